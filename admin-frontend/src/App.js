@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './App.css';
 import CouriersList from './components/CouriersList';
 import MapView from './components/MapView';
@@ -7,6 +7,28 @@ import History from './components/History';
 
 const API_BASE = process.env.REACT_APP_API_BASE || '/api';
 
+// http(s)://host/api -> ws(s)://host/api
+const WS_BASE = (API_BASE.startsWith('http')
+  ? API_BASE
+  : `${window.location.origin}${API_BASE}`
+).replace(/^http/, 'ws');
+
+// Применяем дельту: обновляем изменившихся курьеров, остальных не трогаем
+const applyPositionDelta = (positions, changes) => {
+  const byId = new Map(positions.map(p => [p.courier_id, p]));
+  changes.forEach(change => {
+    if (change.removed) {
+      byId.delete(change.courier_id);
+      return;
+    }
+    byId.set(change.courier_id, { ...(byId.get(change.courier_id) || {}), ...change });
+  });
+  return Array.from(byId.values()).filter(
+    p => p.latitude !== null && p.latitude !== undefined &&
+         p.longitude !== null && p.longitude !== undefined
+  );
+};
+
 function App() {
   const [couriers, setCouriers] = useState([]);
   const [courierPositions, setCourierPositions] = useState([]);
@@ -36,16 +58,74 @@ function App() {
     }
   };
 
+  // Событие заказа: обновляем только то, что могло измениться
+  const selectedCourierRef = useRef(null);
+  selectedCourierRef.current = selectedCourierId;
+
+  const handleOrderEvent = (event) => {
+    if (event.event === 'order_assigned' || event.event === 'order_completed') {
+      loadCouriers();
+    }
+    const selected = selectedCourierRef.current;
+    if (selected !== null && event.courier_id === selected) {
+      loadCourierOrders(selected);
+    }
+  };
+
   useEffect(() => {
     loadCouriers();
-    loadAllCouriers();
-    
-    // Обновляем позиции каждые 5 секунд
-    const interval = setInterval(() => {
+
+    // Позиции приходят по WebSocket: снимок при подключении, дальше только изменения.
+    // Если сокет недоступен — возвращаемся к опросу раз в 5 секунд.
+    let ws = null;
+    let pollInterval = null;
+    let reconnectTimer = null;
+    let closed = false;
+
+    const startPolling = () => {
+      if (pollInterval) return;
       loadAllCouriers();
-    }, 5000);
+      pollInterval = setInterval(loadAllCouriers, 5000);
+    };
+
+    const stopPolling = () => {
+      if (pollInterval) {
+        clearInterval(pollInterval);
+        pollInterval = null;
+      }
+    };
+
+    const connect = () => {
+      ws = new WebSocket(`${WS_BASE}/tracking/ws/admin`);
+
+      ws.onopen = () => stopPolling();
 
-    return () => clearInterval(interval);
+      ws.onmessage = (event) => {
+        const frame = JSON.parse(event.data);
+        if (frame.type === 'snapshot') {
+          setCourierPositions(frame.couriers);
+        } else if (frame.type === 'positions') {
+          setCourierPositions(prev => applyPositionDelta(prev, frame.couriers));
+        } else if (frame.type === 'order_event') {
+          handleOrderEvent(frame.event);
+        }
+      };
+
+      ws.onclose = () => {
+        if (closed) return;
+        startPolling();
+        reconnectTimer = setTimeout(connect, 5000);
+      };
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      stopPolling();
+      clearTimeout(reconnectTimer);
+      if (ws) ws.close();
+    };
   }, []);
 
   const handleRefresh = () => {
@@ -56,8 +136,17 @@ function App() {
   // Загрузка заказов выбранного курьера
   const loadCourierOrders = async (courierId) => {
     try {
-      const response = await fetch(`${API_BASE}/couriers/${courierId}/orders`);
-      const data = await response.json();
+      // Заказы отдаются постранично — идём по X-Next-Cursor до конца
+      const data = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ limit: '200' });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_BASE}/couriers/${courierId}/orders?${params}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        data.push(...(await response.json()));
+        cursor = response.headers.get('X-Next-Cursor');
+      } while (cursor);
       setCourierOrders(data);
     } catch (error) {
       console.error('Ошибка загрузки заказов курьера:', error);
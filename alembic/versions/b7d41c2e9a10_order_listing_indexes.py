@@ -0,0 +1,33 @@
+"""order listing indexes
+
+Revision ID: b7d41c2e9a10
+Revises: 6ec9302437ed
+Create Date: 2026-10-18 12:00:00.000000
+
+courier_accounts.phone уже уникален (UNIQUE создаёт индекс), отдельный индекс не нужен.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d41c2e9a10'
+down_revision: Union[str, None] = '6ec9302437ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_status_created_at', 'orders', ['status', 'created_at', 'id'], unique=False)
+    op.create_index('ix_orders_courier_id_status', 'orders', ['courier_id', 'status'], unique=False)
+    op.create_index('ix_orders_courier_id_created_at', 'orders', ['courier_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_courier_id_created_at', table_name='orders')
+    op.drop_index('ix_orders_courier_id_status', table_name='orders')
+    op.drop_index('ix_orders_status_created_at', table_name='orders')
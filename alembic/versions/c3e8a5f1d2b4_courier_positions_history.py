@@ -0,0 +1,37 @@
+"""courier positions history
+
+Revision ID: c3e8a5f1d2b4
+Revises: b7d41c2e9a10
+Create Date: 2026-10-18 13:00:00.000000
+
+Секционированная по дням таблица; сами секции создаёт приложение
+(services/position_history.py) по мере поступления точек.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a5f1d2b4'
+down_revision: Union[str, None] = 'b7d41c2e9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('courier_positions',
+    sa.Column('courier_id', sa.Integer(), nullable=False),
+    sa.Column('recorded_at', sa.DateTime(), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('courier_id', 'recorded_at'),
+    postgresql_partition_by='RANGE (recorded_at)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('courier_positions')
@@ -0,0 +1,33 @@
+"""one active order per courier
+
+Revision ID: d9f2b6a4c1e7
+Revises: c3e8a5f1d2b4
+Create Date: 2026-10-18 14:00:00.000000
+
+Частичный уникальный индекс: у курьера не может быть двух заказов в статусе assigned.
+Если в базе уже есть такие дубликаты, миграция упадёт — их нужно разобрать вручную.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f2b6a4c1e7'
+down_revision: Union[str, None] = 'c3e8a5f1d2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ux_orders_courier_id_active', 'orders', ['courier_id'], unique=True,
+        postgresql_where=sa.text("status = 'assigned'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_orders_courier_id_active', table_name='orders')
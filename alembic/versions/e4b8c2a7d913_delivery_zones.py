@@ -0,0 +1,61 @@
+"""delivery zones
+
+Revision ID: e4b8c2a7d913
+Revises: d9f2b6a4c1e7
+Create Date: 2026-10-18 16:00:00.000000
+
+Зоны доставки и ссылки на них у заказов и курьеров. Существующие заказы
+остаются без зоны, пока их не перетегирует создание или изменение зоны.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8c2a7d913'
+down_revision: Union[str, None] = 'd9f2b6a4c1e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('zones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('polygon', sa.JSON(), nullable=False),
+    sa.Column('min_lat', sa.Float(), nullable=False),
+    sa.Column('min_lon', sa.Float(), nullable=False),
+    sa.Column('max_lat', sa.Float(), nullable=False),
+    sa.Column('max_lon', sa.Float(), nullable=False),
+    sa.Column('priority', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index(op.f('ix_zones_id'), 'zones', ['id'], unique=False)
+
+    op.add_column('orders', sa.Column('zone_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('orders_zone_id_fkey', 'orders', 'zones', ['zone_id'], ['id'], ondelete='SET NULL')
+    op.create_index('ix_orders_zone_id_status_created_at', 'orders',
+                    ['zone_id', 'status', 'created_at', 'id'], unique=False)
+
+    op.add_column('couriers', sa.Column('zone_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('couriers_zone_id_fkey', 'couriers', 'zones', ['zone_id'], ['id'], ondelete='SET NULL')
+    op.create_index(op.f('ix_couriers_zone_id'), 'couriers', ['zone_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_couriers_zone_id'), table_name='couriers')
+    op.drop_constraint('couriers_zone_id_fkey', 'couriers', type_='foreignkey')
+    op.drop_column('couriers', 'zone_id')
+
+    op.drop_index('ix_orders_zone_id_status_created_at', table_name='orders')
+    op.drop_constraint('orders_zone_id_fkey', 'orders', type_='foreignkey')
+    op.drop_column('orders', 'zone_id')
+
+    op.drop_index(op.f('ix_zones_id'), table_name='zones')
+    op.drop_table('zones')
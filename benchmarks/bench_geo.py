@@ -0,0 +1,51 @@
+"""
+Микробенчмарки services/geo.py.
+
+    python -m benchmarks.bench_geo
+"""
+import time
+
+import numpy as np
+
+from services import geo
+
+
+def _bench(name: str, fn, repeat: int = 5) -> None:
+    fn()  # прогрев
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    best = min(timings) * 1000
+    median = sorted(timings)[len(timings) // 2] * 1000
+    print(f"{name:<40} best {best:9.2f} ms   median {median:9.2f} ms")
+
+
+def _points(rng: np.random.Generator, n: int):
+    # Точки в пределах ~30 км вокруг Махачкалы
+    lats = 42.98306 + rng.uniform(-0.15, 0.15, n)
+    lons = 47.50472 + rng.uniform(-0.2, 0.2, n)
+    return lats, lons
+
+
+def main() -> None:
+    rng = np.random.default_rng(42)
+    lats_1k, lons_1k = _points(rng, 1_000)
+    lats_10k, lons_10k = _points(rng, 10_000)
+    lat0, lon0 = 42.98306, 47.50472
+
+    _bench("haversine 1 x 10k", lambda: geo.haversine_one_to_many(lat0, lon0, lats_10k, lons_10k))
+    _bench("within_radius 5 km, 1 x 10k", lambda: geo.within_radius(lat0, lon0, lats_10k, lons_10k, 5.0))
+    _bench("bearing 1 x 10k", lambda: geo.bearing(lat0, lon0, lats_10k, lons_10k))
+    _bench("haversine 1k x 10k (float64)",
+           lambda: geo.haversine_many_to_many(lats_1k, lons_1k, lats_10k, lons_10k))
+    _bench("haversine 1k x 10k (float32)",
+           lambda: geo.haversine_many_to_many(lats_1k, lons_1k, lats_10k, lons_10k, dtype=np.float32))
+    _bench("haversine 10k x 10k (float32)",
+           lambda: geo.haversine_many_to_many(lats_10k, lons_10k, lats_10k, lons_10k, dtype=np.float32),
+           repeat=3)
+
+
+if __name__ == "__main__":
+    main()
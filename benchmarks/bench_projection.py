@@ -0,0 +1,93 @@
+"""
+Сравнение горячих эндпоинтов чтения: ORM-сущности + Pydantic + json
+против выборки колонок + orjson (services/responses.py).
+Работает на SQLite в памяти: 10k курьеров и 100k заказов.
+
+    python -m benchmarks.bench_projection
+"""
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from models import Base, Courier, Order
+from schemas.order import OrderRead
+from services.responses import FastJSONResponse, ORDER_READ_COLUMNS, rows_as_dicts
+
+N_COURIERS = 10_000
+N_ORDERS = 100_000
+
+
+def _seed(engine) -> None:
+    rng = random.Random(1)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Courier), [
+            {"id": i, "name": f"Курьер {i}", "status": rng.choice(["avail", "unavail", "offline"]),
+             "latitude": 42.98 + rng.uniform(-0.1, 0.1), "longitude": 47.5 + rng.uniform(-0.1, 0.1)}
+            for i in range(1, N_COURIERS + 1)
+        ])
+        conn.execute(insert(Order), [
+            {"id": i, "address": f"ул. Тестовая, {i}", "status": "delivered",
+             "latitude": 42.98 + rng.uniform(-0.1, 0.1), "longitude": 47.5 + rng.uniform(-0.1, 0.1),
+             "courier_id": rng.randint(1, N_COURIERS), "created_at": now - timedelta(seconds=i),
+             "recipient_name": "Получатель", "recipient_phone": "+79990000000", "price": 500.0}
+            for i in range(1, N_ORDERS + 1)
+        ])
+
+
+def _bench(name: str, rows: int, fn, repeat: int = 3) -> float:
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<42} {best * 1000:9.1f} ms  {rows / best:12,.0f} rows/s")
+    return best
+
+
+def main() -> None:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    _seed(engine)
+    orders_adapter = TypeAdapter(List[OrderRead])
+
+    def couriers_before():
+        with Session(engine) as session:
+            couriers = session.execute(select(Courier)).scalars().all()
+            payload = [{"id": c.id, "name": c.name, "status": c.status} for c in couriers]
+            return json.dumps(payload, ensure_ascii=False).encode()
+
+    def couriers_after():
+        with Session(engine) as session:
+            result = session.execute(select(Courier.id, Courier.name, Courier.status))
+            return FastJSONResponse(content=rows_as_dicts(result)).body
+
+    def orders_before():
+        with Session(engine) as session:
+            orders = session.execute(select(Order)).scalars().all()
+            validated = orders_adapter.validate_python(orders, from_attributes=True)
+            return json.dumps(orders_adapter.dump_python(validated, mode="json"), ensure_ascii=False).encode()
+
+    def orders_after():
+        with Session(engine) as session:
+            result = session.execute(select(*ORDER_READ_COLUMNS))
+            return FastJSONResponse(content=rows_as_dicts(result)).body
+
+    print(f"couriers: {N_COURIERS}, orders: {N_ORDERS}")
+    before = _bench("couriers: ORM + json", N_COURIERS, couriers_before)
+    after = _bench("couriers: columns + orjson", N_COURIERS, couriers_after)
+    print(f"{'':<42} x{before / after:.1f}")
+    before = _bench("orders: ORM + OrderRead + json", N_ORDERS, orders_before)
+    after = _bench("orders: columns + orjson", N_ORDERS, orders_after)
+    print(f"{'':<42} x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Нагрузочный прогон «смены» на запущенном сервере:
+  - N курьеров шлют координаты по /api/tracking/ws/courier/{id};
+  - M админов держат /api/tracking/ws/admin — по ним меряется задержка
+    от отправки точки курьером до появления её у админа;
+  - P мобильных приложений опрашивают /orders/available и /couriers/me;
+  - раз в --burst-interval секунд — пачка ручных назначений:
+    /orders/nearest/{courier_id}, затем POST /orders/{id}/assign/{courier_id}.
+В конце — p50/p95/p99 и пропускная способность по операциям, SQL-запросы
+на HTTP-запрос по маршрутам (разница /metrics до и после) и отставание
+event loop: клиента (не упёрся ли сам прогон) и сервера, если он его отдаёт.
+
+    python -m benchmarks.seed --url sqlite+aiosqlite:///bench.db --create-tables
+    DATABASE_URL=sqlite+aiosqlite:///bench.db uvicorn main:app --port 8000
+    python -m benchmarks.shift --base-url http://localhost:8000 --duration 60 --json before.json
+
+Назначенные заказы остаются назначенными: для повторяемых сравнений
+базу перед каждым прогоном заполняют заново. Для WebSocket нужен пакет
+websockets (ставится вместе с uvicorn[standard]).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import orjson
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+_METRIC_LINE = re.compile(r"^([a-zA-Z_:][\w:]*)(\{.*\})?\s+(\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, op: str, seconds: float, status: int = 200) -> None:
+        self.latencies[op].append(seconds)
+        self.statuses[op][status] += 1
+
+    def count(self, op: str, status: int = 200) -> None:
+        self.statuses[op][status] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, dict]:
+        result = {}
+        for op in sorted(self.statuses):
+            statuses = self.statuses[op]
+            total = sum(statuses.values())
+            row = {
+                "count": total,
+                "per_second": round(total / elapsed, 1),
+                "errors": sum(n for status, n in statuses.items() if status == 0 or status >= 500),
+                "statuses": {str(k): v for k, v in sorted(statuses.items())},
+            }
+            latencies = sorted(self.latencies.get(op, ()))
+            if latencies:
+                row.update({f"p{q}_ms": round(_percentile(latencies, q / 100) * 1000, 2) for q in (50, 95, 99)})
+                row["max_ms"] = round(latencies[-1] * 1000, 2)
+            result[op] = row
+        return result
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def _timed(recorder: Recorder, op: str, request) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        recorder.record(op, time.perf_counter() - started, 0)
+        return None
+    recorder.record(op, time.perf_counter() - started, response.status_code)
+    return response
+
+
+# ===============================
+# 📌 Участники смены
+# ===============================
+
+async def courier_socket(ws_url: str, courier_id: int, interval: float, deadline: float,
+                         rng: random.Random, sent: Dict[int, Tuple[float, float, float]],
+                         recorder: Recorder) -> None:
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(f"{ws_url}/api/tracking/ws/courier/{courier_id}") as ws:
+            recorder.record("ws_courier_connect", time.perf_counter() - started)
+            # Входящие события заказов читаем, чтобы не копились в буфере сокета
+            reader = asyncio.create_task(_drain(ws))
+            lat = 42.98306 + rng.uniform(-0.15, 0.15)
+            lon = 47.50472 + rng.uniform(-0.2, 0.2)
+            await asyncio.sleep(rng.uniform(0, interval))  # курьеры не шлют точки синхронно
+            try:
+                while time.monotonic() < deadline:
+                    lat += rng.uniform(-2e-4, 2e-4)
+                    lon += rng.uniform(-2e-4, 2e-4)
+                    sent[courier_id] = (lat, lon, time.perf_counter())
+                    await ws.send(orjson.dumps({"latitude": lat, "longitude": lon}).decode())
+                    recorder.count("ws_position_sent")
+                    await asyncio.sleep(interval)
+            finally:
+                reader.cancel()
+    except Exception:
+        recorder.record("ws_courier_connect", time.perf_counter() - started, 0)
+
+
+async def _drain(ws) -> None:
+    try:
+        async for _ in ws:
+            pass
+    except Exception:
+        pass
+
+
+async def admin_socket(ws_url: str, deadline: float, sent: Dict[int, Tuple[float, float, float]],
+                       recorder: Recorder) -> None:
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(f"{ws_url}/api/tracking/ws/admin", max_size=None) as ws:
+            recorder.record("ws_admin_connect", time.perf_counter() - started)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return
+                received = time.perf_counter()
+                frame = orjson.loads(raw)
+                if frame.get("type") != "positions":
+                    continue
+                recorder.count("ws_admin_frame")
+                for courier in frame.get("couriers", ()):
+                    last = sent.get(courier.get("courier_id"))
+                    # Дельты схлопываются — сравниваем только с последней отправленной точкой
+                    if last and courier.get("latitude") == last[0] and courier.get("longitude") == last[1]:
+                        recorder.record("position_fanout", received - last[2])
+    except Exception:
+        recorder.record("ws_admin_connect", time.perf_counter() - started, 0)
+
+
+async def mobile_app(client: httpx.AsyncClient, token: str, interval: float, deadline: float,
+                     rng: random.Random, recorder: Recorder) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    await asyncio.sleep(rng.uniform(0, interval))
+    while time.monotonic() < deadline:
+        await _timed(recorder, "GET /orders/available", client.get("/api/orders/available", params={"limit": 20}))
+        await _timed(recorder, "GET /couriers/me", client.get("/api/couriers/me", headers=headers))
+        await asyncio.sleep(interval * rng.uniform(0.8, 1.2))
+
+
+async def assignment_bursts(client: httpx.AsyncClient, courier_ids: List[int], size: int, interval: float,
+                            deadline: float, rng: random.Random, recorder: Recorder) -> None:
+    free = list(courier_ids)
+    rng.shuffle(free)
+
+    async def claim(order_id: int, courier_id: int) -> None:
+        await _timed(recorder, "GET /orders/nearest", client.get(f"/api/orders/nearest/{courier_id}"))
+        await _timed(recorder, "POST /orders/assign", client.post(f"/api/orders/{order_id}/assign/{courier_id}"))
+
+    while time.monotonic() < deadline and free:
+        response = await _timed(recorder, "GET /orders/available", client.get(
+            "/api/orders/available", params={"limit": size}))
+        if response is not None and response.status_code == 200:
+            orders = [order["id"] for order in response.json()]
+            couriers, free = free[:len(orders)], free[len(orders):]
+            await asyncio.gather(*(claim(o, c) for o, c in zip(orders, couriers)))
+        await asyncio.sleep(interval)
+
+
+async def loop_lag(deadline: float, recorder: Recorder, period: float = 0.05) -> None:
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        recorder.record("client_loop_lag", max(0.0, time.perf_counter() - started - period))
+
+
+# ===============================
+# 📌 Метрики сервера (/metrics)
+# ===============================
+
+async def scrape(client: httpx.AsyncClient) -> Dict[Tuple[str, tuple], float]:
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return {}
+    if response.status_code != 200:
+        return {}
+    samples = {}
+    for line in response.text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        samples[(name, tuple(sorted(_LABEL.findall(labels or ""))))] = float(value)
+    return samples
+
+
+def _delta(before: dict, after: dict, name: str) -> Dict[tuple, float]:
+    return {
+        labels: value - before.get((metric, labels), 0.0)
+        for (metric, labels), value in after.items() if metric == name
+    }
+
+
+def server_report(before: dict, after: dict) -> dict:
+    counts = _delta(before, after, "http_request_db_queries_count")
+    queries = _delta(before, after, "http_request_db_queries_sum")
+    seconds = _delta(before, after, "http_request_db_seconds_sum")
+    routes = {}
+    for labels, count in counts.items():
+        if count <= 0:
+            continue
+        label = dict(labels)
+        routes[f"{label.get('method')} {label.get('route')}"] = {
+            "requests": int(count),
+            "db_queries_per_request": round(queries.get(labels, 0.0) / count, 2),
+            "db_ms_per_request": round(seconds.get(labels, 0.0) / count * 1000, 2),
+        }
+
+    report = {"routes": dict(sorted(routes.items()))}
+    lag_count = sum(_delta(before, after, "event_loop_lag_seconds_count").values())
+    if lag_count > 0:
+        lag_sum = sum(_delta(before, after, "event_loop_lag_seconds_sum").values())
+        buckets = sorted(
+            (float(dict(labels)["le"]), value)
+            for labels, value in _delta(before, after, "event_loop_lag_seconds_bucket").items()
+        )
+        p99 = next((le for le, cumulative in buckets if cumulative >= 0.99 * lag_count), float("inf"))
+        report["server_loop_lag"] = {"mean_ms": round(lag_sum / lag_count * 1000, 2), "p99_le_ms": p99 * 1000}
+    return report
+
+
+def _print_report(report: dict) -> None:
+    print(f"\nдлительность {report['elapsed_s']} с")
+    print(f"{'операция':<28}{'всего':>9}{'в сек':>9}{'ошибки':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}")
+    for op, row in report["operations"].items():
+        print(f"{op:<28}{row['count']:>9}{row['per_second']:>9}{row['errors']:>8}"
+              f"{row.get('p50_ms', '-'):>10}{row.get('p95_ms', '-'):>10}{row.get('p99_ms', '-'):>10}")
+    server = report["server"]
+    if server["routes"]:
+        print(f"\n{'маршрут':<48}{'запросов':>10}{'SQL/запрос':>12}{'SQL мс':>10}")
+        for route, row in server["routes"].items():
+            print(f"{route:<48}{row['requests']:>10}{row['db_queries_per_request']:>12}{row['db_ms_per_request']:>10}")
+    else:
+        print("\n/metrics недоступен — SQL-запросы по маршрутам не посчитаны")
+    if "server_loop_lag" in server:
+        lag = server["server_loop_lag"]
+        print(f"\nотставание event loop сервера: среднее {lag['mean_ms']} мс, p99 ≤ {lag['p99_le_ms']} мс")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Корень сервера, без /api")
+    parser.add_argument("--manifest", default="seed_manifest.json")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--ws-couriers", type=int, default=500)
+    parser.add_argument("--position-interval", type=float, default=2.0)
+    parser.add_argument("--admins", type=int, default=5)
+    parser.add_argument("--mobile-apps", type=int, default=200)
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--burst-size", type=int, default=20)
+    parser.add_argument("--burst-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=22)
+    parser.add_argument("--json", help="Сохранить отчёт в файл для сравнения прогонов")
+    args = parser.parse_args()
+
+    if websockets is None and (args.ws_couriers or args.admins):
+        raise SystemExit("Для WebSocket-участников нужен пакет websockets: pip install websockets")
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+    couriers = manifest["couriers"]
+    if len(couriers) < args.ws_couriers + args.mobile_apps:
+        raise SystemExit(f"В манифесте {len(couriers)} курьеров, нужно не меньше {args.ws_couriers + args.mobile_apps}")
+
+    rng = random.Random(args.seed)
+    rng.shuffle(couriers)
+    ws_couriers = [c for c, _ in couriers[:args.ws_couriers]]
+    app_couriers = couriers[args.ws_couriers:args.ws_couriers + args.mobile_apps]
+    burst_couriers = [c for c, _ in couriers[args.ws_couriers + args.mobile_apps:]]
+    ws_url = "ws" + args.base_url[len("http"):] if args.base_url.startswith("http") else args.base_url
+
+    connections = args.mobile_apps + args.burst_size * 2 + 10
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        # Вход не входит в замер: bcrypt на каждый аккаунт
+        login_sem = asyncio.Semaphore(16)
+
+        async def login(phone: str) -> Optional[str]:
+            async with login_sem:
+                response = await client.post("/api/auth/login", json={"phone": phone, "password": manifest["password"]})
+            return response.json()["access_token"] if response.status_code == 200 else None
+
+        tokens = [t for t in await asyncio.gather(*(login(phone) for _, phone in app_couriers)) if t]
+        print(f"вошли {len(tokens)} из {len(app_couriers)} мобильных приложений")
+
+        before = await scrape(client)
+        recorder = Recorder()
+        sent: Dict[int, Tuple[float, float, float]] = {}
+        deadline = time.monotonic() + args.duration
+        started = time.perf_counter()
+        tasks = [loop_lag(deadline, recorder)]
+        tasks += [admin_socket(ws_url, deadline, sent, recorder) for _ in range(args.admins)]
+        tasks += [
+            courier_socket(ws_url, cid, args.position_interval, deadline, random.Random(rng.random()), sent, recorder)
+            for cid in ws_couriers
+        ]
+        tasks += [
+            mobile_app(client, token, args.poll_interval, deadline, random.Random(rng.random()), recorder)
+            for token in tokens
+        ]
+        if args.burst_size:
+            tasks.append(assignment_bursts(
+                client, burst_couriers, args.burst_size, args.burst_interval, deadline, rng, recorder))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        after = await scrape(client)
+
+    report = {
+        "elapsed_s": round(elapsed, 1),
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "manifest")},
+        "operations": recorder.summary(elapsed),
+        "server": server_report(before, after),
+    }
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
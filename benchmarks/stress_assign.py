@@ -0,0 +1,117 @@
+"""
+Нагрузочная проверка ручного назначения заказов на запущенном сервере.
+Создаёт курьеров и заказы, затем шлёт одновременные попытки
+POST /orders/{id}/assign/{courier_id} со случайными парами, в том числе
+повторы одной пары (двойное нажатие), и проверяет инварианты:
+  - каждый успешный ответ соответствует ровно одному назначенному заказу;
+  - заказ назначен не больше одного раза, у курьера не больше одного активного заказа.
+
+    python -m benchmarks.stress_assign --base-url http://localhost:8000/api --attempts 5000
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import httpx
+
+
+async def _seed(client: httpx.AsyncClient, couriers: int, orders: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def post(url: str, payload: dict) -> int:
+        async with sem:
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+            return response.json()["id"]
+
+    courier_ids = await asyncio.gather(*(
+        post("/couriers", {"name": f"Стресс {i}", "status": "avail"}) for i in range(couriers)
+    ))
+    order_ids = await asyncio.gather(*(
+        post("/orders/", {"address": f"ул. Нагрузочная, {i}", "latitude": 42.98, "longitude": 47.5})
+        for i in range(orders)
+    ))
+    return list(courier_ids), list(order_ids)
+
+
+async def _list_assigned(client: httpx.AsyncClient, courier_ids: set, order_ids: set) -> list:
+    rows, cursor = [], None
+    while True:
+        params = {"status": "assigned", "limit": 200}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/orders/", params=params)
+        response.raise_for_status()
+        rows.extend(r for r in response.json() if r["id"] in order_ids and r["courier_id"] in courier_ids)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return rows
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000/api")
+    parser.add_argument("--couriers", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--attempts", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        courier_ids, order_ids = await _seed(client, args.couriers, args.orders, args.concurrency)
+        print(f"создано курьеров: {len(courier_ids)}, заказов: {len(order_ids)}")
+
+        rng = random.Random(16)
+        pairs = [(rng.choice(order_ids), rng.choice(courier_ids)) for _ in range(args.attempts)]
+        # Часть попыток — дубли одной пары подряд, как двойное нажатие
+        pairs += rng.sample(pairs, args.attempts // 10)
+        rng.shuffle(pairs)
+
+        sem = asyncio.Semaphore(args.concurrency)
+        statuses: Counter = Counter()
+        won = []
+        latencies = []
+
+        async def claim(order_id: int, courier_id: int) -> None:
+            async with sem:
+                started = time.perf_counter()
+                response = await client.post(f"/orders/{order_id}/assign/{courier_id}")
+                latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                won.append((order_id, courier_id))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(claim(o, c) for o, c in pairs))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+
+        def p(q: float) -> float:
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+        print(f"попыток: {len(pairs)} за {elapsed:.2f} с — {len(pairs) / elapsed:.0f} в секунду")
+        print(f"задержка p50 {p(0.5):.1f} мс, p95 {p(0.95):.1f} мс, p99 {p(0.99):.1f} мс")
+        print(f"ответы: {dict(sorted(statuses.items()))}")
+
+        assigned = await _list_assigned(client, set(courier_ids), set(order_ids))
+        db_pairs = {(r["id"], r["courier_id"]) for r in assigned}
+        by_order = Counter(o for o, _ in won)
+        by_courier = Counter(c for _, c in won)
+        problems = []
+        if len(won) != len(db_pairs) or set(won) != db_pairs:
+            problems.append(f"успешных ответов {len(won)}, назначений в БД {len(db_pairs)}")
+        if by_order and max(by_order.values()) > 1:
+            problems.append("заказ назначен больше одного раза")
+        if by_courier and max(by_courier.values()) > 1:
+            problems.append("у курьера больше одного активного заказа")
+        if statuses.get(500):
+            problems.append(f"ошибок 500: {statuses[500]}")
+        print("✅ инварианты соблюдены" if not problems else "❌ " + "; ".join(problems))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# 📌 Буфер позиций курьеров (write-behind)
+POSITION_FLUSH_INTERVAL_MS = _env_int("POSITION_FLUSH_INTERVAL_MS", 1000)
+POSITION_FLUSH_MAX_BATCH = _env_int("POSITION_FLUSH_MAX_BATCH", 500)
+
+# 📌 Рассылка позиций админам
+ADMIN_TICK_MS = _env_int("ADMIN_TICK_MS", 250)
+ADMIN_SEND_TIMEOUT_MS = _env_int("ADMIN_SEND_TIMEOUT_MS", 5000)
+
+# 📌 Pub/sub между воркерами: memory (один процесс) или postgres (LISTEN/NOTIFY)
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory").strip().lower()
+
+# 📌 Автоматическое распределение заказов
+DISPATCH_ENABLED = _env_bool("DISPATCH_ENABLED", False)
+DISPATCH_INTERVAL_MS = _env_int("DISPATCH_INTERVAL_MS", 2000)
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "greedy").strip().lower()  # greedy или hungarian (scipy, иначе greedy)
+DISPATCH_MAX_DISTANCE_KM = _env_float("DISPATCH_MAX_DISTANCE_KM", 0)  # 0 — без ограничения
+DISPATCH_MAX_ORDERS = _env_int("DISPATCH_MAX_ORDERS", 10000)
+# distance — по прямой; eta — по времени в пути (см. ROUTING_*) для ближайших кандидатов
+DISPATCH_COST = os.getenv("DISPATCH_COST", "distance").strip().lower()
+DISPATCH_ETA_CANDIDATES = _env_int("DISPATCH_ETA_CANDIDATES", 5)
+
+# 📌 Кэш проверенных JWT и id курьера по токену
+AUTH_CACHE_SIZE = _env_int("AUTH_CACHE_SIZE", 10000)
+AUTH_CACHE_TTL_SECONDS = _env_float("AUTH_CACHE_TTL_SECONDS", 300)
+
+# 📌 Пул потоков для bcrypt
+PASSWORD_HASH_WORKERS = _env_int("PASSWORD_HASH_WORKERS", max(2, (os.cpu_count() or 2) // 2))
+PASSWORD_HASH_MAX_QUEUE = _env_int("PASSWORD_HASH_MAX_QUEUE", 64)
+
+# 📌 История позиций курьеров
+POSITION_HISTORY_ENABLED = _env_bool("POSITION_HISTORY_ENABLED", True)
+POSITION_HISTORY_MAX_PENDING = _env_int("POSITION_HISTORY_MAX_PENDING", 200_000)
+POSITION_HISTORY_RETENTION_DAYS = _env_int("POSITION_HISTORY_RETENTION_DAYS", 90)
+TRACK_MAX_RANGE_HOURS = _env_int("TRACK_MAX_RANGE_HOURS", 48)
+TRACK_CACHE_SIZE = _env_int("TRACK_CACHE_SIZE", 2000)
+
+# 📌 Карта админа: ниже этого zoom курьеры отдаются кластерами
+CLUSTER_MAX_ZOOM = _env_int("CLUSTER_MAX_ZOOM", 12)
+CLUSTER_CELL_PX = _env_int("CLUSTER_CELL_PX", 64)
+
+# 📌 HTTP-загрузка точек пачками
+POSITION_UPLOAD_MAX_FIXES = _env_int("POSITION_UPLOAD_MAX_FIXES", 1000)
+POSITION_MAX_CLOCK_SKEW_SECONDS = _env_int("POSITION_MAX_CLOCK_SKEW_SECONDS", 120)
+
+# 📌 Поток событий заказов (SSE / WebSocket)
+ORDER_EVENTS_BUFFER = _env_int("ORDER_EVENTS_BUFFER", 10000)
+ORDER_EVENTS_LISTENER_QUEUE = _env_int("ORDER_EVENTS_LISTENER_QUEUE", 1000)
+ORDER_EVENTS_HEARTBEAT_SECONDS = _env_float("ORDER_EVENTS_HEARTBEAT_SECONDS", 15)
+
+# 📌 Массовый импорт заказов
+BULK_IMPORT_CHUNK_ROWS = _env_int("BULK_IMPORT_CHUNK_ROWS", 2000)
+BULK_IMPORT_MAX_ROWS = _env_int("BULK_IMPORT_MAX_ROWS", 200_000)
+BULK_IMPORT_MAX_ERRORS = _env_int("BULK_IMPORT_MAX_ERRORS", 1000)
+EXPORT_BATCH_ROWS = _env_int("EXPORT_BATCH_ROWS", 5000)
+
+# 📌 База данных и пул соединений (на каждый воркер uvicorn/gunicorn свой пул:
+# воркеры * (DB_POOL_SIZE + DB_MAX_OVERFLOW) должно быть меньше max_connections Postgres)
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://courier_user:qwer52@db:5432/delivery")
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)  # 0 — без ограничения
+DB_PREPARED_STATEMENT_CACHE_SIZE = _env_int("DB_PREPARED_STATEMENT_CACHE_SIZE", 100)  # 0 — для pgbouncer
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "courier-backend")
+DB_ECHO = _env_bool("DB_ECHO", False)
+
+# 📌 Метрики Prometheus на /metrics. Порт бэкенда опубликован наружу, поэтому
+# без METRICS_TOKEN эндпоинт отвечает 404; Prometheus передаёт токен
+# в Authorization: Bearer (параметр authorization.credentials)
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# 📌 Диагностика event loop (по умолчанию выключена) и профилировщик.
+# Эндпоинты /api/debug/* работают, только если задан ADMIN_TOKEN
+LOOP_MONITOR_ENABLED = _env_bool("LOOP_MONITOR_ENABLED", False)
+LOOP_LAG_INTERVAL_MS = _env_int("LOOP_LAG_INTERVAL_MS", 100)
+LOOP_STALL_THRESHOLD_MS = _env_int("LOOP_STALL_THRESHOLD_MS", 100)
+LOOP_STALL_EVENTS = _env_int("LOOP_STALL_EVENTS", 100)
+PROFILE_MAX_SECONDS = _env_int("PROFILE_MAX_SECONDS", 60)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# 📌 Зоны доставки: размер ячейки сетки поиска зоны по точке, градусы
+ZONE_GRID_CELL_DEG = _env_float("ZONE_GRID_CELL_DEG", 0.01)
+DISPATCH_BY_ZONE = _env_bool("DISPATCH_BY_ZONE", True)  # курьеры получают заказы только своей зоны
+
+# 📌 Маршруты и время в пути: GraphHopper (пустой URL — не использовать),
+# затем локальный граф из ROUTING_GRAPH_PATH (.npz или .osm), затем оценка по прямой
+GRAPHHOPPER_URL = os.getenv("GRAPHHOPPER_URL", "http://graphhopper:8989")
+GRAPHHOPPER_PROFILE = os.getenv("GRAPHHOPPER_PROFILE", "car")
+GRAPHHOPPER_MATRIX = _env_bool("GRAPHHOPPER_MATRIX", False)  # /matrix есть не во всех сборках GraphHopper
+GRAPHHOPPER_MATRIX_MAX_POINTS = _env_int("GRAPHHOPPER_MATRIX_MAX_POINTS", 100)
+GRAPHHOPPER_TIMEOUT_SECONDS = _env_float("GRAPHHOPPER_TIMEOUT_SECONDS", 2)
+GRAPHHOPPER_MAX_CONNECTIONS = _env_int("GRAPHHOPPER_MAX_CONNECTIONS", 20)
+GRAPHHOPPER_RETRY_SECONDS = _env_float("GRAPHHOPPER_RETRY_SECONDS", 30)  # пауза после ошибки
+ROUTING_GRAPH_PATH = os.getenv("ROUTING_GRAPH_PATH", "")
+ROUTING_CACHE_SIZE = _env_int("ROUTING_CACHE_SIZE", 200_000)
+ROUTING_CACHE_TTL_SECONDS = _env_int("ROUTING_CACHE_TTL_SECONDS", 3600)
+ROUTING_SNAP_DEG = _env_float("ROUTING_SNAP_DEG", 0.0005)  # ~50 м: точки в одной ячейке делят кэш
+ROUTING_FALLBACK_SPEED_KMH = _env_float("ROUTING_FALLBACK_SPEED_KMH", 20)
+ROUTING_DETOUR_FACTOR = _env_float("ROUTING_DETOUR_FACTOR", 1.3)
+NEAREST_BY_ETA = _env_bool("NEAREST_BY_ETA", False)  # как DISPATCH_COST=eta — включается явно
+
+# 📌 Реплика для чтения: пусто — всё читается из основной БД
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+REPLICA_MAX_LAG_SECONDS = _env_float("REPLICA_MAX_LAG_SECONDS", 5)
+REPLICA_CHECK_INTERVAL_SECONDS = _env_float("REPLICA_CHECK_INTERVAL_SECONDS", 5)
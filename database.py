@@ -1,18 +1,135 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import time
+from typing import Dict, Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import config
+
+
+def normalize_database_url(url: str) -> str:
+    """Приложение работает через asyncpg, какой бы драйвер ни был указан в DATABASE_URL"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed.render_as_string(hide_password=False)
+
+
+DATABASE_URL = normalize_database_url(config.DATABASE_URL)
+DATABASE_REPLICA_URL: Optional[str] = (
+    normalize_database_url(config.DATABASE_REPLICA_URL) if config.DATABASE_REPLICA_URL else None
+)
+
+
+class PoolStats:
+    """Сколько запросов ждали свободное соединение пула и как долго"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds: float) -> None:
+        self.checkouts += 1
+        # Быстрее миллисекунды — соединение было свободно, это не ожидание
+        if seconds >= 0.001:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+# Статистика по роли движка: primary, replica
+pool_stats: Dict[str, PoolStats] = {}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул, который замеряет время получения соединения.
+    Роль движка берётся из logging_name пула — он переживает recreate().
+    """
+
+    def _do_get(self):
+        stats = pool_stats.setdefault(self.logging_name or "primary", PoolStats())
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            stats.timeouts += 1
+            raise
+        finally:
+            stats.record(time.perf_counter() - started)
+
+
+def create_engine_from_config(url: str = DATABASE_URL, role: str = "primary") -> AsyncEngine:
+    """Движок с настройками пула из окружения (см. config.py, раздел БД)"""
+    kwargs = {"echo": config.DB_ECHO, "pool_pre_ping": config.DB_POOL_PRE_PING, "pool_logging_name": role}
+    if make_url(url).get_backend_name() == "postgresql":
+        url = make_url(url).update_query_dict({
+            "prepared_statement_cache_size": str(config.DB_PREPARED_STATEMENT_CACHE_SIZE),
+        })
+        kwargs.update(
+            poolclass=InstrumentedPool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+        server_settings = {"application_name": config.DB_APPLICATION_NAME}
+        if config.DB_STATEMENT_TIMEOUT_MS > 0:
+            server_settings["statement_timeout"] = str(config.DB_STATEMENT_TIMEOUT_MS)
+        kwargs["connect_args"] = {"server_settings": server_settings}
+    return create_async_engine(url, **kwargs)
+
+
+def pool_status(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    stats = pool_stats.get(pool.logging_name or "primary", PoolStats())
+    status = {
+        "pool_class": type(pool).__name__,
+        "checkouts": stats.checkouts,
+        "waits": stats.waits,
+        "wait_ms_total": round(stats.wait_seconds_total * 1000, 1),
+        "wait_ms_max": round(stats.wait_seconds_max * 1000, 1),
+        "timeouts": stats.timeouts,
+    }
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    return status
 
-DATABASE_URL = "postgresql+asyncpg://courier_user:qwer52@db:5432/delivery"
 
 # Создаём движок
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_engine_from_config()
 
 # Создаём фабрику сессий
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
+# Реплика для чтения (необязательна); выбор между ней и основной БД — services/replica.py
+replica_engine: Optional[AsyncEngine] = (
+    create_engine_from_config(DATABASE_REPLICA_URL, role="replica") if DATABASE_REPLICA_URL else None
+)
+ReplicaSessionLocal = (
+    sessionmaker(bind=replica_engine, class_=AsyncSession, expire_on_commit=False) if replica_engine else None
+)
+
 # Базовый класс для моделей
 Base = declarative_base()
 
-# Dependency для FastAPI
-async def get_async_session() -> AsyncSession:
+
+# Dependency для FastAPI — общая для всех роутеров
+async def get_session() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+get_async_session = get_session
@@ -1,14 +1,57 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import ValidationError
-from routers import routes, tracking, auth, order
+from routers import routes, tracking, auth, order, health, debug, zones as zones_router, metrics as metrics_router
+from routers import routing as routing_router
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from services.position_buffer import position_buffer
+from services.admin_hub import admin_hub
+from services.live_positions import live_positions
+from services.pubsub import broker
+from services import order_events, zones
+from services.dispatcher import dispatcher
+from services.replica import replica_router
+from services.routing import routing
+from services.metrics import MetricsMiddleware, instrument_sqlalchemy
+from services.loop_monitor import loop_monitor
+from services.responses import NEXT_CURSOR_HEADER
+import config
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await broker.start()
+    await replica_router.start()
+    await routing.start()
+    if config.LOOP_MONITOR_ENABLED:
+        loop_monitor.start(app)
+    order_events.register()
+    zones.register()
+    auth.register_cache_invalidation()
+    position_buffer.start()
+    admin_hub.start()
+    live_positions.start()
+    if config.DISPATCH_ENABLED:
+        dispatcher.start()
+    yield
+    await dispatcher.stop()
+    await admin_hub.stop()
+    live_positions.stop()
+    await position_buffer.stop()
+    await broker.stop()
+    await replica_router.stop()
+    await routing.stop()
+    await loop_monitor.stop()
+    auth.password_hasher.shutdown()
 
 
 app = FastAPI(
     title="Courier Delivery API",
+    lifespan=lifespan,
     docs_url="/api/docs",
     redoc_url="/api/redoc",
     openapi_url="/api/openapi.json",
@@ -39,14 +82,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# 📌 Метрики: задержка по маршрутам и SQL-время на запрос (отдаются на /metrics)
+if config.METRICS_ENABLED:
+    instrument_sqlalchemy()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router.router)
+
 
 # API роутеры с префиксом /api
 app.include_router(routes.router, prefix="/api")
 app.include_router(tracking.router, prefix="/api")
 app.include_router(auth.router, prefix="/api")
 app.include_router(order.router, prefix="/api")
+app.include_router(zones_router.router, prefix="/api")
+app.include_router(routing_router.router, prefix="/api")
+app.include_router(health.router, prefix="/api")
+app.include_router(debug.router, prefix="/api")
 
 # # Роут для админки
 # app.mount("/admin", StaticFiles(directory="static/admin", html=True), name="admin")
@@ -23,6 +23,28 @@ const WS_BASE = API_CONFIG.WS_URL;
 
 const { width, height } = Dimensions.get('window');
 
+// Офлайн-буфер позиций: при связи точка уходит сразу, пачкой — только накопленное после сбоя
+const POSITION_RETRY_INTERVAL_MS = 15000;
+const MAX_FIXES_PER_REQUEST = 1000;
+const MAX_PENDING_FIXES = 5000;
+
+// Списки заказов отдаются постранично: следующая страница — по заголовку X-Next-Cursor
+const ORDERS_PAGE_SIZE = 200;
+
+const fetchAllOrders = async (url: string): Promise<Order[]> => {
+  const orders: Order[] = [];
+  let cursor: string | null = null;
+  do {
+    const sep = url.includes('?') ? '&' : '?';
+    const page = `${url}${sep}limit=${ORDERS_PAGE_SIZE}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`;
+    const res = await fetch(page);
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    orders.push(...(await res.json()));
+    cursor = res.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return orders;
+};
+
 interface Order {
   id: number;
   address: string;
@@ -53,6 +75,12 @@ export default function CourierScreen() {
   const mapRef = useRef<MapView>(null);
   const sidePanelAnim = useRef(new Animated.Value(-280)).current;
   const orderPanelAnim = useRef(new Animated.Value(height - 60)).current;
+  const pendingFixes = useRef<{ latitude: number; longitude: number; recorded_at: string }[]>([]);
+  const lastPositionFailure = useRef(0);
+  const sendingPositions = useRef(false);
+  const lastOrderEventId = useRef<string | null>(null);
+  const modeRef = useRef(mode);
+  modeRef.current = mode;
 
   useEffect(() => {
     checkAuth();
@@ -64,8 +92,50 @@ export default function CourierScreen() {
 
       startTracking();
       checkAssignedOrder();
-      const interval = setInterval(checkAssignedOrder, 5000);
-      return () => clearInterval(interval);
+
+      // События заказов приходят по WebSocket; опрос — только пока сокет недоступен
+      let ws: WebSocket | null = null;
+      let pollInterval: ReturnType<typeof setInterval> | null = null;
+      let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+      let closed = false;
+
+      const stopPolling = () => {
+        if (pollInterval) {
+          clearInterval(pollInterval);
+          pollInterval = null;
+        }
+      };
+
+      const connect = () => {
+        const resume = lastOrderEventId.current;
+        ws = new WebSocket(
+          `${WS_BASE}/tracking/ws/courier/${courierId}` +
+            (resume ? `?resume=${encodeURIComponent(resume)}` : '')
+        );
+        ws.onopen = () => {
+          stopPolling();
+          // Пока сокета не было, события могли потеряться без resume-токена
+          if (!resume) checkAssignedOrder();
+        };
+        ws.onmessage = (message) => {
+          const frame = JSON.parse(message.data);
+          if (frame.type === 'order_event') handleOrderEvent(frame.event);
+        };
+        ws.onclose = () => {
+          if (closed) return;
+          if (!pollInterval) pollInterval = setInterval(checkAssignedOrder, 5000);
+          reconnectTimer = setTimeout(connect, 5000);
+        };
+      };
+
+      connect();
+
+      return () => {
+        closed = true;
+        stopPolling();
+        if (reconnectTimer) clearTimeout(reconnectTimer);
+        if (ws) ws.close();
+      };
     }
   }, [courierId]);
 
@@ -153,26 +223,50 @@ export default function CourierScreen() {
   const sendPosition = async (loc: Location.LocationObject) => {
     if (!courierId) return;
 
-    // Здесь можно добавить WebSocket отправку позиции
-    // Пока используем простой fetch для демонстрации
+    pendingFixes.current.push({
+      latitude: loc.coords.latitude,
+      longitude: loc.coords.longitude,
+      recorded_at: new Date(loc.timestamp).toISOString(),
+    });
+    if (pendingFixes.current.length > MAX_PENDING_FIXES) {
+      pendingFixes.current.splice(0, pendingFixes.current.length - MAX_PENDING_FIXES);
+    }
+    // Запрос уже идёт — точка уйдёт следом за ним; после сбоя ждём перед повтором
+    if (sendingPositions.current || Date.now() - lastPositionFailure.current < POSITION_RETRY_INTERVAL_MS) {
+      return;
+    }
+
     const token = await AsyncStorage.getItem('token');
     if (!token) return;
 
+    sendingPositions.current = true;
     try {
-      await fetch(`${API_BASE}/tracking/update_position`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          Authorization: `Bearer ${token}`,
-        },
-        body: JSON.stringify({
-          courier_id: courierId,
-          latitude: loc.coords.latitude,
-          longitude: loc.coords.longitude,
-        }),
-      });
-    } catch (err) {
-      console.error('Ошибка отправки позиции:', err);
+      while (pendingFixes.current.length) {
+        const batch = pendingFixes.current.splice(0, MAX_FIXES_PER_REQUEST);
+        try {
+          const res = await fetch(`${API_BASE}/tracking/update_position`, {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+              Authorization: `Bearer ${token}`,
+            },
+            body: JSON.stringify({ positions: batch }),
+          });
+          if (!res.ok && res.status >= 500) {
+            pendingFixes.current.unshift(...batch);
+            lastPositionFailure.current = Date.now();
+            break;
+          }
+        } catch (err) {
+          // Нет сети — вернём точки в буфер и отправим пачкой, когда связь появится
+          pendingFixes.current.unshift(...batch);
+          lastPositionFailure.current = Date.now();
+          console.error('Ошибка отправки позиции:', err);
+          break;
+        }
+      }
+    } finally {
+      sendingPositions.current = false;
     }
   };
 
@@ -204,12 +298,9 @@ export default function CourierScreen() {
 
   const loadAvailableOrders = async () => {
     try {
-      const res = await fetch(`${API_BASE}/orders/available`);
-      if (res.ok) {
-        const orders = await res.json();
-        setAvailableOrders(orders);
-        setOrderListPanelVisible(true);
-      }
+      const orders = await fetchAllOrders(`${API_BASE}/orders/available`);
+      setAvailableOrders(orders);
+      setOrderListPanelVisible(true);
     } catch (err) {
       console.error('Ошибка загрузки заказов:', err);
     }
@@ -239,14 +330,29 @@ export default function CourierScreen() {
     }
   };
 
+  const handleOrderEvent = (event: { id?: string; event: string; courier_id?: number | null }) => {
+    if (event.id) lastOrderEventId.current = event.id;
+    if (event.event === 'reset') {
+      // Сервер не смог восстановить пропущенные события — перечитываем состояние
+      checkAssignedOrder();
+      if (modeRef.current === 'manual') loadAvailableOrders();
+      return;
+    }
+    if (event.courier_id === courierId) {
+      checkAssignedOrder();
+    }
+    if (modeRef.current === 'manual' && ['order_created', 'orders_imported', 'order_assigned', 'order_deleted'].includes(event.event)) {
+      loadAvailableOrders();
+    }
+  };
+
   const checkAssignedOrder = async () => {
     if (!courierId) return;
 
     try {
-      const res = await fetch(`${API_BASE}/couriers/${courierId}/orders`);
-      if (res.ok) {
-        const orders = await res.json();
-        const activeOrder = orders.find((o: Order) => o.status === 'assigned');
+      const res = await fetch(`${API_BASE}/orders/couriers/${courierId}/active-order`);
+      if (res.ok || res.status === 404) {
+        const activeOrder: Order | null = res.ok ? await res.json() : null;
         if (activeOrder) {
           setCurrentOrder(activeOrder);
           setOrderPanelExpanded(true); // Автоматически показываем панель заказа
@@ -324,14 +430,10 @@ export default function CourierScreen() {
     if (!courierId) return;
 
     try {
-      const res = await fetch(`${API_BASE}/couriers/${courierId}/orders`);
-      if (res.ok) {
-        const orders = await res.json();
-        // Фильтруем только завершенные заказы
-        const completed = orders.filter((o: Order) => o.status === 'delivered');
-        setOrderHistory(completed);
-        setHistoryModalVisible(true);
-      }
+      // Только завершенные заказы, все страницы
+      const completed = await fetchAllOrders(`${API_BASE}/couriers/${courierId}/orders?status=delivered`);
+      setOrderHistory(completed);
+      setHistoryModalVisible(true);
     } catch (err) {
       console.error('Ошибка загрузки истории заказов:', err);
       Alert.alert('Ошибка', 'Не удалось загрузить историю заказов');
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, JSON, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -16,6 +16,8 @@ class Courier(Base):
     current_order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
     last_active = Column(DateTime, nullable=True)
     completed_orders_count = Column(Integer, default=0)
+    # Зона по последней записанной позиции (обновляет services/position_buffer.py)
+    zone_id = Column(Integer, ForeignKey("zones.id", ondelete="SET NULL"), nullable=True, index=True)
 
     account = relationship("CourierAccount", back_populates="courier")
     orders = relationship(
@@ -40,6 +42,19 @@ class CourierAccount(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Индексы под keyset-пагинацию списков заказов
+        Index("ix_orders_status_created_at", "status", "created_at", "id"),
+        Index("ix_orders_courier_id_status", "courier_id", "status"),
+        Index("ix_orders_courier_id_created_at", "courier_id", "created_at", "id"),
+        Index("ix_orders_zone_id_status_created_at", "zone_id", "status", "created_at", "id"),
+        # Не больше одного активного заказа на курьера — гарантия на уровне БД
+        Index(
+            "ux_orders_courier_id_active", "courier_id", unique=True,
+            postgresql_where=text("status = 'assigned'"),
+            sqlite_where=text("status = 'assigned'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     address = Column(String, nullable=False)
@@ -47,6 +62,8 @@ class Order(Base):
     longitude = Column(Float, nullable=True)
     status = Column(String, default="pending")
     courier_id = Column(Integer, ForeignKey("couriers.id"), nullable=True)
+    # Зона доставки по координатам, проставляется при создании заказа
+    zone_id = Column(Integer, ForeignKey("zones.id", ondelete="SET NULL"), nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow)
     assigned_at = Column(DateTime, nullable=True)
@@ -61,4 +78,37 @@ class Order(Base):
         "Courier",
         back_populates="orders",
         foreign_keys=[courier_id]   # <-- вот это добавляем
-    )
\ No newline at end of file
+    )
+
+
+class CourierPosition(Base):
+    """
+    История координат курьеров (append-only).
+    Таблица секционирована по дням recorded_at; секции создаёт services/position_history.py.
+    """
+    __tablename__ = "courier_positions"
+    __table_args__ = {"postgresql_partition_by": "RANGE (recorded_at)"}
+
+    courier_id = Column(Integer, primary_key=True)
+    recorded_at = Column(DateTime, primary_key=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+
+
+class Zone(Base):
+    """
+    Зона доставки. polygon — геометрия GeoJSON (Polygon или MultiPolygon,
+    координаты [lon, lat]); рамка хранится отдельно для выборок по bbox.
+    Если зоны пересекаются, точка достаётся зоне с большим priority.
+    """
+    __tablename__ = "zones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, unique=True)
+    polygon = Column(JSON, nullable=False)
+    min_lat = Column(Float, nullable=False)
+    min_lon = Column(Float, nullable=False)
+    max_lat = Column(Float, nullable=False)
+    max_lon = Column(Float, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -6,9 +6,16 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordBearer
+from typing import Optional
+import time
 
-from database import AsyncSessionLocal
+import config
+from database import get_session
 from models import CourierAccount, Courier
+from services.cache import TTLCache
+from services.admin_hub import admin_hub
+from services.hashing import PasswordHasher, HashingOverloaded
+from services.pubsub import broker
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -21,11 +28,16 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 30  # 30 дней
 
 # 📌 Контекст хеширования паролей
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt выполняется в отдельном пуле потоков, а не в event loop
+password_hasher = PasswordHasher(
+    pwd_context,
+    workers=config.PASSWORD_HASH_WORKERS,
+    max_queue=config.PASSWORD_HASH_MAX_QUEUE,
+)
 
-# 📌 Асинхронная сессия
-async def get_session() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
-        yield session
+# 📌 Кэш токенов: token -> {"phone", "courier_id"}
+identity_cache = TTLCache(maxsize=config.AUTH_CACHE_SIZE, ttl=config.AUTH_CACHE_TTL_SECONDS)
+AUTH_CHANNEL = "auth"
 
 # 📌 Pydantic модели
 class UserCreate(BaseModel):
@@ -82,7 +94,7 @@ async def register(data: UserCreate, session: AsyncSession = Depends(get_session
         # Обрезаем пароль до 72 байт для совместимости с bcrypt
         password_bytes = data.password.encode('utf-8')[:72]
         password_str = password_bytes.decode('utf-8', errors='ignore')
-        hashed_password = pwd_context.hash(password_str)
+        hashed_password = await password_hasher.hash(password_str)
         new_user = CourierAccount(phone=data.phone, password_hash=hashed_password)
         session.add(new_user)
         await session.flush()  # Получаем ID без коммита
@@ -97,6 +109,7 @@ async def register(data: UserCreate, session: AsyncSession = Depends(get_session
         session.add(new_courier)
         await session.commit()
         await session.refresh(new_courier)
+        admin_hub.publish(new_courier.id, name=new_courier.name, status=new_courier.status)
 
         return {
             "message": "Регистрация успешна",
@@ -105,6 +118,9 @@ async def register(data: UserCreate, session: AsyncSession = Depends(get_session
     except HTTPException:
         await session.rollback()
         raise
+    except HashingOverloaded:
+        await session.rollback()
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку позже")
     except Exception as e:
         await session.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка при регистрации: {str(e)}")
@@ -125,22 +141,95 @@ async def login(data: UserLogin, session: AsyncSession = Depends(get_session)):
     password_bytes = data.password.encode('utf-8')[:72]
     password_str = password_bytes.decode('utf-8', errors='ignore')
     
-    if not pwd_context.verify(password_str, user.password_hash):
+    try:
+        password_ok = await password_hasher.verify(password_str, user.password_hash)
+    except HashingOverloaded:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку позже")
+    if not password_ok:
         raise HTTPException(status_code=401, detail="Неверный номер или пароль")
 
     access_token = create_access_token(data={"sub": user.phone})
     return {"access_token": access_token}
 
 
-def verify_token(token: str = Depends(oauth2_scheme)):
+def _resolve_identity(token: str) -> dict:
+    identity = identity_cache.get(token)
+    if identity is not None:
+        return identity
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        phone = payload.get("sub")
-        if phone is None:
-            raise HTTPException(status_code=401, detail="Неверный токен")
-        return phone
     except JWTError:
         raise HTTPException(status_code=401, detail="Неверный токен")
+    phone = payload.get("sub")
+    if phone is None:
+        raise HTTPException(status_code=401, detail="Неверный токен")
+
+    identity = {"phone": phone, "courier_id": None}
+    # Запись в кэше не должна пережить сам токен
+    ttl = payload["exp"] - time.time() if "exp" in payload else None
+    identity_cache.set(token, identity, ttl=ttl)
+    return identity
+
+
+def verify_token(token: str = Depends(oauth2_scheme)):
+    return _resolve_identity(token)["phone"]
+
+
+async def get_current_courier_id(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_session),
+) -> int:
+    return await courier_id_for_token(token, session)
+
+
+async def courier_id_for_token(token: str, session: AsyncSession) -> int:
+    """id курьера по токену; JOIN по телефону выполняется только при промахе кэша"""
+    identity = _resolve_identity(token)
+    if identity["courier_id"] is not None:
+        return identity["courier_id"]
+
+    result = await session.execute(
+        select(Courier.id).join(CourierAccount, Courier.account_id == CourierAccount.id).where(
+            CourierAccount.phone == identity["phone"])
+    )
+    courier_id = result.scalar_one_or_none()
+    if courier_id is None:
+        raise HTTPException(status_code=404, detail="Курьер не найден")
+    identity["courier_id"] = courier_id
+    return courier_id
+
+
+def _drop_identities(message: dict) -> None:
+    phone = message.get("phone")
+    courier_id = message.get("courier_id")
+    identity_cache.invalidate_where(
+        lambda identity: (phone is not None and identity["phone"] == phone)
+        or (courier_id is not None and identity["courier_id"] == courier_id)
+    )
+
+
+async def invalidate_identity(phone: Optional[str] = None, courier_id: Optional[int] = None) -> None:
+    """Сбросить закэшированные токены аккаунта/курьера во всех воркерах"""
+    message = {"phone": phone, "courier_id": courier_id}
+    _drop_identities(message)
+    try:
+        await broker.publish(AUTH_CHANNEL, message)
+    except Exception as e:
+        print(f"❌ Не удалось разослать сброс кэша токенов: {e}")
+
+
+def register_cache_invalidation() -> None:
+    broker.subscribe(AUTH_CHANNEL, _drop_identities)
+
+
+@router.get("/cache/stats")
+async def get_identity_cache_stats():
+    return identity_cache.stats()
+
+
+@router.get("/hashing/stats")
+async def get_password_hashing_stats():
+    return password_hasher.stats()
 
 
 @router.get("/secure-data")
@@ -162,8 +251,10 @@ async def delete_account(account_id: int, session: AsyncSession = Depends(get_se
     if not account:
         raise HTTPException(status_code=404, detail="Аккаунт не найден")
 
+    phone = account.phone
     await session.delete(account)
     await session.commit()
+    await invalidate_identity(phone=phone)
     return {"message": f"Аккаунт с id {account_id} удалён"}
 
 
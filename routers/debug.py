@@ -0,0 +1,47 @@
+import hmac
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+import config
+from services.loop_monitor import ProfilerBusy, collapsed, loop_monitor, profiler, summarize
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    # Без ADMIN_TOKEN диагностика выключена целиком: эндпоинтов как будто нет
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Нужен заголовок X-Admin-Token")
+
+
+# 📌 Отставание event loop и последние блокировки со стеками
+@router.get("/loop", dependencies=[Depends(require_admin_token)])
+async def get_loop_stats():
+    return loop_monitor.stats()
+
+
+# 📌 Профиль потока event loop за seconds секунд. format=collapsed — свёрнутые
+# стеки для flamegraph.pl / speedscope (корень — маршрут), json — сводка
+@router.get("/profile", dependencies=[Depends(require_admin_token)])
+async def get_profile(
+    request: Request,
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    route: Optional[str] = Query(None, description='Только один маршрут, например "GET /api/orders/available"'),
+    format: Literal["collapsed", "json"] = "collapsed",
+    include_idle: bool = False,
+):
+    if seconds > config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Не больше {config.PROFILE_MAX_SECONDS} секунд")
+    try:
+        samples = await profiler.profile(request.app, seconds, interval_ms / 1000)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Профиль уже снимается")
+
+    if format == "json":
+        return {"interval_ms": interval_ms, **summarize(samples)}
+    return PlainTextResponse(collapsed(samples, route, include_idle))
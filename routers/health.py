@@ -0,0 +1,53 @@
+import time
+
+from fastapi import APIRouter
+from sqlalchemy import text
+
+import database
+from database import AsyncSessionLocal, engine, pool_status
+from services.replica import replica_router
+from services.responses import FastJSONResponse
+from services.routing import routing
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+# 📌 Живость процесса — без обращения к БД
+@router.get("")
+async def health():
+    return {"status": "ok"}
+
+
+# 📌 Источники маршрутов: GraphHopper, локальный граф, кэш.
+# Недоступный GraphHopper — не ошибка: время в пути считается запасными способами
+@router.get("/routing")
+async def health_routing():
+    return routing.status()
+
+
+def _replica_status():
+    if not replica_router.configured:
+        return None
+    return {**replica_router.status(), "pool": pool_status(database.replica_engine)}
+
+
+# 📌 Доступность БД и состояние пула соединений этого воркера.
+# Недоступная реплика не делает сервис нездоровым: чтение уходит на основную БД
+@router.get("/db")
+async def health_db():
+    started = time.perf_counter()
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("SELECT 1"))
+    except Exception as e:
+        return FastJSONResponse(
+            {"status": "error", "error": e.__class__.__name__, "pool": pool_status(engine),
+             "replica": _replica_status()},
+            status_code=503,
+        )
+    return FastJSONResponse({
+        "status": "ok",
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        "pool": pool_status(engine),
+        "replica": _replica_status(),
+    })
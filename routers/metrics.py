@@ -0,0 +1,75 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+import config
+import database
+from database import engine, pool_status
+from routers.auth import password_hasher
+from routers.tracking import active_admins, active_couriers
+from services import metrics
+from services.admin_hub import admin_hub
+from services.order_events import order_event_log
+from services.position_buffer import position_buffer
+from services.replica import replica_router
+from services.routing import routing
+
+# Без префикса /api, но порт 8000 опубликован в docker-compose: эндпоинт
+# доступен снаружи, поэтому закрыт токеном METRICS_TOKEN
+router = APIRouter(tags=["metrics"])
+
+
+def require_metrics_token(authorization: Optional[str] = Header(None)) -> None:
+    # Без METRICS_TOKEN метрики не отдаются: эндпоинта как будто нет
+    if not config.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), config.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Нужен заголовок Authorization: Bearer",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def _pools():
+    roles = [("primary", engine)]
+    if database.replica_engine is not None:
+        roles.append(("replica", database.replica_engine))
+    return [(role, pool_status(e)) for role, e in roles]
+
+
+def _pool_field(field: str):
+    def collect():
+        return [((role,), status.get(field, 0)) for role, status in _pools()]
+    return collect
+
+
+# 📌 Состояние, которое уже считают сервисы, — читается в момент опроса
+metrics.gauge("websocket_couriers", "Подключённые курьеры", collect=lambda: len(active_couriers))
+metrics.gauge("websocket_admins", "Подключённые админы", collect=lambda: len(active_admins))
+metrics.gauge("order_event_listeners", "Подписчики потока событий заказов",
+              collect=lambda: order_event_log.listeners)
+metrics.gauge("position_buffer_pending", "Курьеры с незаписанной позицией", collect=lambda: len(position_buffer))
+metrics.gauge("admin_hub_clients", "Админы в рассылке позиций", collect=lambda: len(admin_hub))
+metrics.gauge("routing_cache_entries", "Маршруты в кэше", collect=lambda: len(routing.cache))
+metrics.gauge("password_hash_queue_depth", "Задачи bcrypt, ждущие поток",
+              collect=lambda: password_hasher.queue_depth)
+metrics.gauge("db_pool_checked_out", "Выданные соединения пула", ("role",), collect=_pool_field("checked_out"))
+metrics.gauge("db_pool_overflow", "Соединения сверх pool_size", ("role",), collect=_pool_field("overflow"))
+metrics.counter("db_pool_waits_total", "Ожидания свободного соединения", ("role",), collect=_pool_field("waits"))
+metrics.counter("db_pool_timeouts_total", "Таймауты получения соединения", ("role",),
+                collect=_pool_field("timeouts"))
+metrics.gauge("db_replica_in_use", "Чтение идёт с реплики",
+              collect=lambda: [((), int(replica_router.usable()))] if replica_router.configured else [])
+metrics.gauge("db_replica_lag_seconds", "Отставание реплики",
+              collect=lambda: [((), replica_router.lag_seconds)]
+              if replica_router.lag_seconds is not None else [])
+
+password_hasher.observers.append(
+    lambda operation, seconds: metrics.PASSWORD_HASH_SECONDS.observe(seconds, operation)
+)
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
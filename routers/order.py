@@ -1,152 +1,361 @@
-from fastapi import APIRouter, Depends, HTTPException
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from database import AsyncSessionLocal
-from models import Order, Courier, CourierAccount
+from database import get_session
+from models import Order, Courier
 from schemas.order import OrderCreate, OrderRead
-from typing import List
+from typing import List, Literal, Optional
 from datetime import datetime
-from sqlalchemy import func
-from routers.auth import verify_token
+import config
+from routers.auth import courier_id_for_token, get_current_courier_id, invalidate_identity
+from services.spatial_index import pending_orders_index
+from services.zones import zone_index
+from services.routing import routing
+from services.order_events import order_event_log, publish_order_event
+from services.dispatcher import dispatcher
+from services.bulk_import import csv_rows, import_orders, ndjson_rows
+from services.export import export_filename, export_media_type, export_stream, parquet_available
+from services.replica import get_read_session
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, filter_orders, paginate_orders
+from services.responses import FastJSONResponse, ORDER_READ_COLUMNS, json_rows, rows_as_dicts
 
 router = APIRouter(
     prefix="/orders",
     tags=["Orders"]
 )
 
-async def get_session() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
-        yield session
+# Колонки для RETURNING, из которых собирается событие заказа
+_ORDER_EVENT_COLUMNS = (Order.id, Order.status, Order.courier_id, Order.latitude, Order.longitude, Order.zone_id)
 
 @router.post("/{order_id}/complete")
 async def complete_order(
     order_id: int,
     session: AsyncSession = Depends(get_session),
-    phone: str = Depends(verify_token)
+    courier_id: int = Depends(get_current_courier_id)
 ):
-    # Получаем курьера по телефону
-    result = await session.execute(
-        select(Courier).join(CourierAccount).where(CourierAccount.phone == phone)
-    )
-    courier = result.scalar_one_or_none()
+    # Условное UPDATE: повторное нажатие не засчитает заказ дважды
+    order = (await session.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.courier_id == courier_id, Order.status == "assigned")
+        .values(status="delivered", delivered_at=datetime.utcnow())
+        .returning(*_ORDER_EVENT_COLUMNS)
+    )).one_or_none()
+
+    if order is None:
+        await session.rollback()
+        current = (await session.execute(
+            select(Order.courier_id, Order.status).where(Order.id == order_id)
+        )).one_or_none()
+        if current is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if current.courier_id != courier_id:
+            raise HTTPException(status_code=403, detail="This order is not assigned to you")
+        raise HTTPException(status_code=400, detail="Order is not in 'assigned' status")
 
-    if not courier:
+    # Обновляем счетчик завершенных заказов и освобождаем текущий заказ курьера
+    updated = await session.scalar(
+        update(Courier)
+        .where(Courier.id == courier_id)
+        .values(
+            completed_orders_count=func.coalesce(Courier.completed_orders_count, 0) + 1,
+            current_order_id=None,
+        )
+        .returning(Courier.id)
+    )
+    if updated is None:
+        await session.rollback()
+        await invalidate_identity(courier_id=courier_id)
         raise HTTPException(status_code=404, detail="Courier not found")
 
-    # Получаем заказ
-    order = await session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    await session.commit()
+    pending_orders_index.discard(order_id)
+    await publish_order_event("order_completed", order)
 
-    # Проверяем принадлежность заказа курьеру
-    if order.courier_id != courier.id:
-        raise HTTPException(status_code=403, detail="This order is not assigned to you")
+    return {"message": f"Order {order_id} marked as delivered"}
 
-    if order.status != "assigned":
-        raise HTTPException(status_code=400, detail="Order is not in 'assigned' status")
 
-    # Обновляем статус
-    order.status = "delivered"
-    order.delivered_at = datetime.utcnow()
-    
-    # Обновляем счетчик завершенных заказов у курьера
-    courier.completed_orders_count = (courier.completed_orders_count or 0) + 1
-    courier.current_order_id = None  # Освобождаем текущий заказ
+# 📌 Автораспределение: статистика и ручной запуск раунда
+@router.get("/dispatch/stats")
+async def get_dispatch_stats():
+    return dispatcher.stats
 
-    await session.commit()
-    await session.refresh(order)
 
-    return {"message": f"Order {order_id} marked as delivered"}
+@router.post("/dispatch/run")
+async def run_dispatch_round():
+    assigned = await dispatcher.run_round()
+    return {"assigned": assigned, "stats": dispatcher.stats}
 
 
-# Получить все свободные заказы
-@router.get("/available", response_model=List[OrderRead])
-async def get_available_orders(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(Order).where(Order.status == "pending"))
-    orders = result.scalars().all()
-    return orders
+# 📡 Поток событий заказов (Server-Sent Events) вместо опроса.
+# С token — только события курьера, без него — все (админка).
+# Продолжение после обрыва: заголовок Last-Event-ID или параметр resume.
+@router.get("/events")
+async def order_events_stream(
+    token: Optional[str] = None,
+    resume: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session),
+):
+    courier_id = await courier_id_for_token(token, session) if token else None
+    events = order_event_log.follow(
+        last_event_id or resume, courier_id, heartbeat=config.ORDER_EVENTS_HEARTBEAT_SECONDS
+    )
+
+    async def stream():
+        async for message in events:
+            if message is None:
+                yield b": ping\n\n"
+            elif "id" not in message:
+                yield b"event: reset\ndata: {}\n\n"
+            else:
+                yield (
+                    f"id: {message['id']}\nevent: {message['event']}\n".encode()
+                    + b"data: " + orjson.dumps(message) + b"\n\n"
+                )
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# 📤 Выгрузка заказов для аналитики: поток CSV / NDJSON (по желанию gzip) или Parquet
+@router.get("/export")
+async def export_orders(
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+    compression: Literal["none", "gzip"] = "none",
+    status: Optional[str] = None,
+    courier_id: Optional[int] = None,
+    zone_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Для выгрузки в Parquet нужен пакет pyarrow")
+
+    stmt = filter_orders(select(*ORDER_READ_COLUMNS), status=status, courier_id=courier_id, zone_id=zone_id,
+                         created_from=created_from, created_to=created_to).order_by(Order.created_at, Order.id)
+    gzip = compression == "gzip"
+    return StreamingResponse(
+        export_stream(stmt, format, gzip),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(format, gzip)}"'},
+    )
+
+
+# Свободные заказы (старые первыми); с zone_id — только заказы одной зоны
+@router.get("/available", response_model=List[OrderRead], response_class=FastJSONResponse)
+async def get_available_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    zone_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    stmt = filter_orders(select(*ORDER_READ_COLUMNS), status="pending", zone_id=zone_id,
+                         created_from=created_from, created_to=created_to)
+    return json_rows(*await paginate_orders(session, stmt, cursor, limit, descending=False))
+
+
+# Список заказов с фильтрами (новые первыми, постранично)
+@router.get("/", response_model=List[OrderRead], response_class=FastJSONResponse)
+async def list_orders(
+    status: Optional[str] = None,
+    courier_id: Optional[int] = None,
+    zone_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_session),
+):
+    stmt = filter_orders(select(*ORDER_READ_COLUMNS), status=status, courier_id=courier_id, zone_id=zone_id,
+                         created_from=created_from, created_to=created_to)
+    return json_rows(*await paginate_orders(session, stmt, cursor, limit))
 
 # Создать новый заказ
 @router.post("/", response_model=OrderRead)
 async def create_order(order: OrderCreate, session: AsyncSession = Depends(get_session)):
-    new_order = Order(**order.model_dump())
+    await zone_index.ensure_loaded(session)
+    new_order = Order(**order.model_dump(), zone_id=zone_index.lookup(order.latitude, order.longitude))
     session.add(new_order)
     await session.commit()
     await session.refresh(new_order)
+    if new_order.status == "pending":
+        pending_orders_index.add(new_order.id, new_order.latitude, new_order.longitude, new_order.zone_id)
+    await publish_order_event("order_created", new_order)
     return new_order
 
+# 📥 Массовый импорт: тело в NDJSON или CSV (с заголовком) читается потоком,
+# ошибки возвращаются построчно и не прерывают импорт
+@router.post("/bulk")
+async def bulk_import_orders(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = Query(None, description="По умолчанию — по Content-Type"),
+):
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type in ("text/csv", "application/csv"):
+            format = "csv"
+        elif content_type in ("application/x-ndjson", "application/jsonl", "application/ndjson", "application/json-lines"):
+            format = "ndjson"
+        else:
+            raise HTTPException(
+                status_code=415,
+                detail="Ожидается text/csv или application/x-ndjson (или параметр format)"
+            )
+    rows = csv_rows(request.stream()) if format == "csv" else ndjson_rows(request.stream())
+    return FastJSONResponse(await import_orders(rows))
+
+
 # Назначить заказ курьеру вручную
 @router.post("/{order_id}/assign/{courier_id}")
 async def assign_order(order_id: int, courier_id: int, session: AsyncSession = Depends(get_session)):
-    order = await session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-
-    courier = await session.get(Courier, courier_id)
-    if not courier:
-        raise HTTPException(status_code=404, detail="Courier not found")
-
-    # 🛑 Проверяем, есть ли у курьера уже активный заказ
-    result = await session.execute(
-        select(Order).where(
-            Order.courier_id == courier_id,
-            Order.status == "assigned"
-        )
-    )
-    existing_order = result.scalar_one_or_none()
-
-    if existing_order:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Courier {courier_id} already has an active order (ID {existing_order.id})"
-        )
-
-    if order.status != "pending":
+    # ✅ Одно условное UPDATE: из двух одновременных попыток заказ получит только одна,
+    # а второй активный заказ курьера отсекает частичный уникальный индекс
+    try:
+        order = (await session.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == "pending")
+            .values(status="assigned", courier_id=courier_id, assigned_at=datetime.utcnow())
+            .returning(*_ORDER_EVENT_COLUMNS)
+        )).one_or_none()
+    except IntegrityError:
+        await session.rollback()
+        await _raise_assign_conflict(session, courier_id)
+
+    if order is None:
+        await session.rollback()
+        exists = await session.scalar(select(Order.id).where(Order.id == order_id))
+        if exists is None:
+            raise HTTPException(status_code=404, detail="Order not found")
         raise HTTPException(status_code=400, detail="Order is not available")
 
-    # ✅ Назначаем заказ
-    order.courier_id = courier_id
-    order.status = "assigned"
-    order.assigned_at = datetime.utcnow()
-    courier.current_order_id = order_id  # Обновляем текущий заказ курьера
+    # Обновляем текущий заказ курьера (курьер существует — иначе UPDATE заказа отсёк бы внешний ключ)
+    await session.execute(
+        update(Courier).where(Courier.id == courier_id).values(current_order_id=order_id)
+    )
 
     await session.commit()
-    await session.refresh(order)
+    pending_orders_index.discard(order_id)
+    await publish_order_event("order_assigned", order)
 
     return {"message": f"Order {order_id} assigned to courier {courier_id}"}
 
 
+async def _raise_assign_conflict(session: AsyncSession, courier_id: int):
+    # IntegrityError даёт и внешний ключ на несуществующего курьера — повтор тут не поможет
+    if await session.scalar(select(Courier.id).where(Courier.id == courier_id)) is None:
+        raise HTTPException(status_code=404, detail="Courier not found")
+    existing = await session.scalar(
+        select(Order.id).where(Order.courier_id == courier_id, Order.status == "assigned").limit(1)
+    )
+    if existing is None:
+        # Конфликтующий заказ уже завершили — клиент может повторить попытку
+        raise HTTPException(status_code=409, detail=f"Courier {courier_id} assignment conflict, retry")
+    raise HTTPException(
+        status_code=400,
+        detail=f"Courier {courier_id} already has an active order (ID {existing})"
+    )
+
+
 
 # Получить активный заказ курьера
-@router.get("/couriers/{courier_id}/active-order", response_model=OrderRead)
+@router.get("/couriers/{courier_id}/active-order", response_model=OrderRead, response_class=FastJSONResponse)
 async def get_active_order(courier_id: int, session: AsyncSession = Depends(get_session)):
     result = await session.execute(
-        select(Order).where(Order.courier_id == courier_id, Order.status == "assigned")
+        select(*ORDER_READ_COLUMNS).where(Order.courier_id == courier_id, Order.status == "assigned")
     )
-    order = result.scalar_one_or_none()
-    if not order:
+    orders = rows_as_dicts(result)
+    if not orders:
         raise HTTPException(status_code=404, detail="No active order")
-    return order
+    return FastJSONResponse(content=orders[0])
+
 
+# Сколько кандидатов берём из индекса за одну проверку в БД
+NEAREST_CANDIDATES = 5
+NEAREST_MAX_ATTEMPTS = 3
 
+
+async def _closest_by_eta(courier: Courier, orders: List[Order]):
+    """Из кандидатов, ближайших по прямой, — тот, до которого быстрее доехать"""
+    if not config.NEAREST_BY_ETA:
+        return orders[0], None
+    seconds, meters = await routing.one_to_many(
+        courier.latitude, courier.longitude, [(o.latitude, o.longitude) for o in orders]
+    )
+    best = int(seconds.argmin())
+    return orders[best], (float(seconds[best]), float(meters[best]))
+
+
+# scope=city (по умолчанию, как раньше) — по всему городу, zone — только заказы
+# текущей зоны курьера (если он в зоне).
+# С NEAREST_BY_ETA кандидаты ранжируются по времени в пути, а не по прямой
 @router.get("/nearest/{courier_id}")
-async def get_nearest_order(courier_id: int, session: AsyncSession = Depends(get_session)):
+async def get_nearest_order(
+    courier_id: int,
+    scope: Literal["zone", "city"] = "city",
+    session: AsyncSession = Depends(get_session),
+):
     courier = await session.get(Courier, courier_id)
     if not courier:
         raise HTTPException(status_code=404, detail="Courier not found")
+    zone_id = courier.zone_id if scope == "zone" else None
+
+    nearest_order = None
+    leg = None
+    if courier.latitude is not None and courier.longitude is not None:
+        await pending_orders_index.ensure_loaded(session)
+        rejected: set[int] = set()
+        for _ in range(NEAREST_MAX_ATTEMPTS):
+            candidates = pending_orders_index.nearest(
+                courier.latitude, courier.longitude, k=NEAREST_CANDIDATES, exclude=rejected, zone_id=zone_id
+            )
+            if not candidates:
+                break
+            ids = [order_id for _, order_id in candidates]
+
+            # Индекс мог устареть (заказ взяли в другом воркере) — подтверждаем в БД
+            result = await session.execute(
+                select(Order).where(Order.id.in_(ids), Order.status == "pending")
+            )
+            confirmed = {o.id: o for o in result.scalars().all()}
+            alive = []
+            for order_id in ids:
+                if order_id in confirmed:
+                    alive.append(confirmed[order_id])
+                else:
+                    pending_orders_index.discard(order_id)
+                    rejected.add(order_id)
+            if alive:
+                nearest_order, leg = await _closest_by_eta(courier, alive)
+                break
+
+    if nearest_order is None:
+        # Позиция курьера неизвестна или в индексе пусто (например, заказы без координат) —
+        # отдаём самый старый свободный заказ
+        result = await session.execute(
+            filter_orders(select(Order), status="pending", zone_id=zone_id)
+            .order_by(Order.created_at, Order.id)
+            .limit(1)
+        )
+        nearest_order = result.scalar_one_or_none()
 
-    result = await session.execute(
-        select(Order).where(Order.status == "pending")
-        .order_by(func.sqrt(func.pow(Order.latitude - courier.latitude, 2) + func.pow(Order.longitude - courier.longitude, 2)))
-        .limit(1)
-    )
-    nearest_order = result.scalar_one_or_none()
     if not nearest_order:
         return {}
 
     return {
         "id": nearest_order.id,
         "address": nearest_order.address,
+        "zone_id": nearest_order.zone_id,
+        "eta_seconds": round(leg[0]) if leg else None,
+        "route_distance_m": round(leg[1]) if leg else None,
         "recipient_name": nearest_order.recipient_name,
         "recipient_phone": nearest_order.recipient_phone,
         "comment": nearest_order.comment
@@ -160,6 +369,8 @@ async def delete_order(order_id: int, session: AsyncSession = Depends(get_sessio
 
     await session.delete(order)
     await session.commit()
+    pending_orders_index.discard(order_id)
+    await publish_order_event("order_deleted", order)
 
     return {"message": f"Order {order_id} has been deleted"}
 
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field, field_validator
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models import Courier, CourierAccount, Order
-from database import AsyncSessionLocal
+from database import get_session
 from typing import Optional, List
+from datetime import datetime
 from schemas.order import OrderRead
 
-from routers.auth import verify_token, oauth2_scheme
+from routers.auth import verify_token, oauth2_scheme, get_current_courier_id, invalidate_identity
+from services.admin_hub import admin_hub
+from services.replica import get_read_session
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, filter_orders, paginate_orders
+from services.responses import FastJSONResponse, ORDER_READ_COLUMNS, json_rows, rows_as_dicts
 
 router = APIRouter()
 
@@ -47,15 +52,6 @@ class StatusUpdate(BaseModel):
             raise ValueError('Статус должен быть: avail или unavail')
         return v
 
-# ===============================
-# 📌 Асинхронная сессия
-# ===============================
-
-async def get_session() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
-        yield session
-
-
 # ===============================
 # 📌 Эндпоинты для курьеров
 # ===============================
@@ -64,42 +60,36 @@ async def get_session() -> AsyncSession:
 async def update_status(
     status_data: StatusUpdate,
     session: AsyncSession = Depends(get_session),
-    phone: str = Depends(verify_token)):
+    courier_id: int = Depends(get_current_courier_id)):
 
-    result = await session.execute(
-        select(Courier).join(CourierAccount, Courier.account_id == CourierAccount.id).where(
-            CourierAccount.phone == phone)
-    )
-    courier = result.scalar_one_or_none()
+    courier = await session.get(Courier, courier_id)
     if not courier:
+        await invalidate_identity(courier_id=courier_id)
         raise HTTPException(status_code=404, detail="Курьер не найден")
 
     courier.status = status_data.status
     await session.commit()
     await session.refresh(courier)
+    admin_hub.publish(courier.id, status=courier.status)
     return {"message": "Статус успешно обновлен", "new_status": courier.status}
 
 @router.get("/couriers/me")
 async def get_current_courier(
     session: AsyncSession = Depends(get_session),
-    phone: str = Depends(verify_token)):
+    courier_id: int = Depends(get_current_courier_id)):
 
-    result = await session.execute(
-        select(Courier).join(CourierAccount, Courier.account_id == CourierAccount.id).where(
-            CourierAccount.phone == phone)
-    )
-    courier = result.scalar_one_or_none()
+    courier = await session.get(Courier, courier_id)
     if not courier:
+        await invalidate_identity(courier_id=courier_id)
         raise HTTPException(status_code=404, detail="Курьер не найден")
-    return {"id": courier.id, "name": courier.name, "status": courier.status}
+    return {"id": courier.id, "name": courier.name, "status": courier.status, "zone_id": courier.zone_id}
 
 
 
-@router.get("/couriers")
-async def get_couriers(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(Courier))
-    couriers = result.scalars().all()
-    return [{"id": c.id, "name": c.name, "status": c.status} for c in couriers]
+@router.get("/couriers", response_class=FastJSONResponse)
+async def get_couriers(session: AsyncSession = Depends(get_read_session)):
+    result = await session.execute(select(Courier.id, Courier.name, Courier.status))
+    return json_rows(rows_as_dicts(result))
 
 
 @router.get("/couriers/{courier_id}")
@@ -116,6 +106,8 @@ async def create_courier(courier: CouriersCreate, session: AsyncSession = Depend
     session.add(new_courier)
     await session.commit()
     await session.refresh(new_courier)
+    # Индекс позиций и карта админа узнают имя и статус нового курьера сразу
+    admin_hub.publish(new_courier.id, name=new_courier.name, status=new_courier.status)
     return {"id": new_courier.id, "name": new_courier.name, "status": new_courier.status}
 
 
@@ -126,6 +118,8 @@ async def delete_courier(courier_id: int, session: AsyncSession = Depends(get_se
         raise HTTPException(status_code=404, detail=f"Courier with id {courier_id} not found")
     await session.delete(courier)
     await session.commit()
+    admin_hub.publish(courier_id, removed=True)
+    await invalidate_identity(courier_id=courier_id)
     return {"message": f"Courier with id {courier_id} has been deleted"}
 
 
@@ -138,6 +132,8 @@ async def update_courier(courier_id: int, updated_data: CouriersCreate, session:
     courier.status = updated_data.status
     await session.commit()
     await session.refresh(courier)
+    admin_hub.publish(courier.id, name=courier.name, status=courier.status)
+    await invalidate_identity(courier_id=courier_id)
     return {"id": courier.id, "name": courier.name, "status": courier.status}
 
 
@@ -153,19 +149,28 @@ async def patch_courier(courier_id: int, updated_data: CourierUpdate, session: A
         courier.status = updated_data.status
     await session.commit()
     await session.refresh(courier)
+    admin_hub.publish(courier.id, name=courier.name, status=courier.status)
+    await invalidate_identity(courier_id=courier_id)
     return {"id": courier.id, "name": courier.name, "status": courier.status}
 
 
 
 
-# 📌 Получить все заказы конкретного курьера
-@router.get("/couriers/{courier_id}/orders", response_model=List[OrderRead])
-async def get_orders_by_courier(courier_id: int, session: AsyncSession = Depends(get_session)):
-    result = await session.execute(
-        select(Order).where(Order.courier_id == courier_id)
-    )
-    orders = result.scalars().all()
-    return orders
+# 📌 Получить заказы конкретного курьера (новые первыми, постранично).
+# Читается с основной БД: приложение перечитывает список сразу после назначения
+@router.get("/couriers/{courier_id}/orders", response_model=List[OrderRead], response_class=FastJSONResponse)
+async def get_orders_by_courier(
+    courier_id: int,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+):
+    stmt = filter_orders(select(*ORDER_READ_COLUMNS), status=status, courier_id=courier_id,
+                         created_from=created_from, created_to=created_to)
+    return json_rows(*await paginate_orders(session, stmt, cursor, limit))
 
 
 
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Query
+
+from services.routing import routing
+
+router = APIRouter(prefix="/routing", tags=["Routing"])
+
+
+# 📍 Время в пути и длина маршрута между двумя точками
+@router.get("/eta")
+async def get_eta(
+    from_lat: float = Query(..., ge=-90, le=90),
+    from_lon: float = Query(..., ge=-180, le=180),
+    to_lat: float = Query(..., ge=-90, le=90),
+    to_lon: float = Query(..., ge=-180, le=180),
+):
+    seconds, meters = await routing.eta(from_lat, from_lon, to_lat, to_lon)
+    return {"eta_seconds": round(seconds), "distance_m": round(meters)}
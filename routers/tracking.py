@@ -1,43 +1,91 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+import asyncio
+from datetime import datetime, time, timedelta
+from typing import Literal, Optional, Tuple
+
+import numpy as np
+import orjson
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from database import AsyncSessionLocal
-from models import Courier
+from sqlalchemy import select
+import config
+from database import AsyncSessionLocal, get_session
+from models import Courier, CourierPosition
+from services.position_buffer import position_buffer
+from services.order_events import order_event_log
+from services.admin_hub import admin_hub
+from services import geo
+from services.live_positions import cluster_positions, live_positions, parse_bbox
+from services.responses import FastJSONResponse, json_rows, rows_as_dicts
+from services.cache import TTLCache
+from services.replica import get_read_session, replica_router
+from services.metrics import POSITION_MESSAGES
+from services import simplify as track_simplify
+from routers.auth import get_current_courier_id
+from schemas.tracking import PositionUpload, PositionUploadResult, to_naive_utc
 
 router = APIRouter(prefix="/tracking", tags=["tracking"])
 
-# Список всех подключений
+# Список подключений этого воркера; позиции между воркерами ходят через брокер
 active_admins: list[WebSocket] = []
 active_couriers: dict[int, WebSocket] = {}  # courier_id -> WebSocket
 
-# Dependency для HTTP эндпоинтов
-async def get_session() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
-        yield session
+# Задачи закрытия сокетов курьеров, чтобы их не собрал сборщик мусора
+_closing_couriers: set = set()
+
+
+async def _push_order_events(websocket: WebSocket, courier_id: int, resume: Optional[str]) -> None:
+    # Единственный, кто пишет в сокет курьера: события его заказов
+    async for message in order_event_log.follow(resume, courier_id):
+        await websocket.send_text(orjson.dumps({"type": "order_event", "event": message}).decode())
+
+
+async def _close_courier_socket(websocket: WebSocket) -> None:
+    try:
+        # 1011 — ошибка сервера: клиент включает опрос и переподключается
+        await websocket.close(code=1011)
+    except Exception:
+        pass  # сокет уже закрыт
+
+
+def _on_pusher_done(websocket: WebSocket, courier_id: int, task: asyncio.Task) -> None:
+    if task.cancelled():
+        return
+    # Без потока событий сокет курьеру бесполезен — закрываем, а не молчим
+    print(f"❌ Поток событий заказов курьера {courier_id} остановился: {task.exception()!r}")
+    closing = asyncio.get_running_loop().create_task(_close_courier_socket(websocket))
+    _closing_couriers.add(closing)
+    closing.add_done_callback(_closing_couriers.discard)
+
 
-# 📍 WebSocket для курьеров (отправка координат)
+# 📍 WebSocket для курьеров (отправка координат, в ответ — события заказов;
+# ?resume=<id последнего события> продолжает поток после переподключения)
 @router.websocket("/ws/courier/{courier_id}")
 async def courier_ws(websocket: WebSocket, courier_id: int):
     await websocket.accept()
     active_couriers[courier_id] = websocket
     print(f"✅ Курьер {courier_id} подключился по WebSocket")
+    pusher = asyncio.create_task(
+        _push_order_events(websocket, courier_id, websocket.query_params.get("resume"))
+    )
+    pusher.add_done_callback(lambda task: _on_pusher_done(websocket, courier_id, task))
 
     try:
         while True:
             data = await websocket.receive_json()
             # например, позиции от курьера
-            lat = data.get("latitude")
-            lon = data.get("longitude")
-            print(f"📍 Курьер {courier_id}: {lat}, {lon}")
-
-            # ✅ сохраняем координаты в БД
-            async with AsyncSessionLocal() as session:
-                await session.execute(
-                    update(Courier)
-                    .where(Courier.id == courier_id)
-                    .values(latitude=lat, longitude=lon)
-                )
-                await session.commit()
+            try:
+                lat = float(data["latitude"])
+                lon = float(data["longitude"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                continue
+
+            POSITION_MESSAGES.inc("websocket")
+            # ✅ кладём в буфер, в БД пишет фоновая задача пачками
+            if position_buffer.put(courier_id, lat, lon):
+                admin_hub.publish(courier_id, latitude=lat, longitude=lon)
 
     except WebSocketDisconnect:
         print(f"❌ Курьер {courier_id} отключился")
@@ -45,9 +93,41 @@ async def courier_ws(websocket: WebSocket, courier_id: int):
     except Exception as e:
         print(f"❌ Ошибка в WebSocket курьера {courier_id}: {e}")
         active_couriers.pop(courier_id, None)
+    finally:
+        pusher.cancel()
+
 
+# 📍 HTTP-загрузка точек (когда WebSocket недоступен): одна точка или пачка из офлайн-буфера
+@router.post("/update_position", response_model=PositionUploadResult)
+async def update_position(
+    upload: PositionUpload,
+    courier_id: int = Depends(get_current_courier_id),
+):
+    now = datetime.utcnow()
+    latest_allowed = now + timedelta(seconds=config.POSITION_MAX_CLOCK_SKEW_SECONDS)
+    oldest_allowed = (now - timedelta(days=config.POSITION_HISTORY_RETENTION_DAYS)
+                      if config.POSITION_HISTORY_RETENTION_DAYS > 0 else datetime.min)
 
-# 📍 WebSocket для админов (получение всех позиций)
+    accepted = rejected = 0
+    current = None
+    # По времени — чтобы текущей позицией стала самая свежая точка, а админам ушла одна дельта
+    for fix in sorted(upload.positions, key=lambda f: f.recorded_at or now):
+        recorded_at = fix.recorded_at or now
+        if not oldest_allowed <= recorded_at <= latest_allowed:
+            rejected += 1
+            continue
+        accepted += 1
+        if position_buffer.put(courier_id, fix.latitude, fix.longitude, recorded_at):
+            current = fix
+
+    if accepted:
+        POSITION_MESSAGES.inc("http", amount=accepted)
+    if current is not None:
+        admin_hub.publish(courier_id, latitude=current.latitude, longitude=current.longitude)
+    return {"accepted": accepted, "rejected": rejected, "current_updated": current is not None}
+
+
+# 📍 WebSocket для админов (снимок при подключении, дальше дельты)
 @router.websocket("/ws/admin")
 async def admin_ws(websocket: WebSocket):
     await websocket.accept()
@@ -55,52 +135,219 @@ async def admin_ws(websocket: WebSocket):
     print("✅ Админ подключился")
 
     try:
-        # При подключении сразу отправляем текущие позиции
+        # При подключении отправляем текущие позиции только этому админу
         async with AsyncSessionLocal() as session:
-            await broadcast_positions(session)
+            snapshot = await load_positions(session)
+        await admin_hub.connect(websocket, snapshot)
 
         while True:
             await websocket.receive_text()  # ждём, но админ ничего не шлёт
 
     except WebSocketDisconnect:
         print("❌ Админ отключился")
-        active_admins.remove(websocket)
     except Exception as e:
         print(f"❌ Ошибка в WebSocket админа: {e}")
-        active_admins.remove(websocket)
-
-# 📤 Отправка всем админам
-async def broadcast_positions(session: AsyncSession):
-    result = await session.execute(select(Courier))
-    couriers = result.scalars().all()
-
-    positions = [
-        {
-            "courier_id": c.id,
-            "name": c.name,
-            "latitude": c.latitude,
-            "longitude": c.longitude,
-            "status": c.status
-        }
-        for c in couriers if c.latitude is not None and c.longitude is not None
-    ]
-
-    for admin_ws in active_admins:
-        await admin_ws.send_json(positions)
-
-
-@router.get("/all_positions")
-async def get_all_positions(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(Courier))
-    couriers = result.scalars().all()
-
-    return [
-        {
-            "courier_id": c.id,
-            "name": c.name,
-            "latitude": c.latitude,
-            "longitude": c.longitude,
-            "status": c.status
-        }
-        for c in couriers if c.latitude is not None and c.longitude is not None
-    ]
\ No newline at end of file
+    finally:
+        admin_hub.disconnect(websocket)
+        if websocket in active_admins:
+            active_admins.remove(websocket)
+
+
+# 📤 Текущие позиции всех курьеров (только нужные колонки, без ORM-сущностей)
+async def load_positions(session: AsyncSession) -> list[dict]:
+    result = await session.execute(
+        select(
+            Courier.id.label("courier_id"),
+            Courier.name,
+            Courier.latitude,
+            Courier.longitude,
+            Courier.status,
+        ).where(Courier.latitude.is_not(None), Courier.longitude.is_not(None))
+    )
+    return rows_as_dicts(result)
+
+
+@router.get("/all_positions", response_class=FastJSONResponse)
+async def get_all_positions(
+    bbox: Optional[str] = Query(None, description="Окно карты: min_lon,min_lat,max_lon,max_lat"),
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Позиции из индекса в памяти. С bbox — только курьеры в окне карты,
+    с zoom ниже CLUSTER_MAX_ZOOM — кластеры вместо отдельных точек.
+    """
+    try:
+        viewport = parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await live_positions.ensure_loaded(session)
+    positions = live_positions.positions(viewport)
+
+    # Необязательный фильтр: только курьеры в радиусе от точки
+    if latitude is not None and longitude is not None and radius_km is not None and positions:
+        mask = geo.within_radius(
+            latitude, longitude,
+            [p["latitude"] for p in positions],
+            [p["longitude"] for p in positions],
+            radius_km,
+        )
+        positions = [p for p, keep in zip(positions, mask.tolist()) if keep]
+
+    if zoom is None:
+        return json_rows(positions)
+    if zoom >= config.CLUSTER_MAX_ZOOM:
+        return FastJSONResponse({"zoom": zoom, "clusters": [], "couriers": positions})
+    clusters, singles = cluster_positions(positions, zoom)
+    return FastJSONResponse({"zoom": zoom, "clusters": clusters, "couriers": singles})
+
+
+# ===============================
+# 📌 История перемещений
+# ===============================
+
+def _track_range(date_from: datetime, date_to: datetime) -> Tuple[datetime, datetime]:
+    """Границы интервала в наивном UTC, как в БД; ?from=...Z иначе сравнивался бы с колонкой без зоны"""
+    date_from, date_to = to_naive_utc(date_from), to_naive_utc(date_to)
+    if date_to <= date_from:
+        raise HTTPException(status_code=400, detail="'to' должен быть позже 'from'")
+    if date_to - date_from > timedelta(hours=config.TRACK_MAX_RANGE_HOURS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Интервал не может быть больше {config.TRACK_MAX_RANGE_HOURS} ч"
+        )
+    return date_from, date_to
+
+
+def _track_query(courier_id: int, date_from: datetime, date_to: datetime):
+    return (
+        select(CourierPosition.recorded_at, CourierPosition.latitude, CourierPosition.longitude)
+        .where(
+            CourierPosition.courier_id == courier_id,
+            CourierPosition.recorded_at >= date_from,
+            CourierPosition.recorded_at < date_to,
+        )
+        .order_by(CourierPosition.recorded_at)
+    )
+
+
+# Упрощённые треки за завершённые дни не меняются — кэшируем по (курьер, день, параметры)
+track_cache = TTLCache(maxsize=config.TRACK_CACHE_SIZE, ttl=24 * 3600)
+
+NDJSON = "application/x-ndjson"
+
+
+async def _load_track(session: AsyncSession, courier_id: int, date_from: datetime, date_to: datetime):
+    result = await session.execute(_track_query(courier_id, date_from, date_to))
+    rows = result.all()
+    times = np.array([r[0] for r in rows], dtype="datetime64[us]")
+    lats = np.array([r[1] for r in rows], dtype=np.float64)
+    lons = np.array([r[2] for r in rows], dtype=np.float64)
+    return times, lats, lons
+
+
+def _reduce_track(track, method: Optional[str], tolerance_m: float, bucket_seconds: Optional[int]):
+    times, lats, lons = track
+    idx = np.arange(times.size)
+    if bucket_seconds:
+        idx = track_simplify.time_buckets(times, bucket_seconds)
+    if method == "dp":
+        idx = idx[track_simplify.douglas_peucker(lats[idx], lons[idx], tolerance_m)]
+    elif method == "vw":
+        idx = idx[track_simplify.visvalingam(lats[idx], lons[idx], tolerance_m)]
+    return times[idx], lats[idx], lons[idx]
+
+
+async def _simplified_track(session: AsyncSession, courier_id: int, date_from: datetime, date_to: datetime,
+                            method: Optional[str], tolerance_m: float, bucket_seconds: Optional[int]):
+    """
+    Трек режется по суткам: полные прошедшие сутки берутся из кэша.
+    date_from/date_to — наивное UTC (см. _track_range): по нему считаются
+    границы суток и ключ кэша
+    """
+    today = datetime.utcnow().date()
+    pieces = []
+    day = date_from.date()
+    while datetime.combine(day, time.min) < date_to:
+        day_start = datetime.combine(day, time.min)
+        day_end = day_start + timedelta(days=1)
+        start = max(date_from, day_start)
+        end = min(date_to, day_end)
+
+        cacheable = start == day_start and end == day_end and day < today
+        key = (courier_id, day, method, tolerance_m, bucket_seconds)
+        piece = track_cache.get(key) if cacheable else None
+        if piece is None:
+            raw = await _load_track(session, courier_id, start, end)
+            piece = await asyncio.to_thread(_reduce_track, raw, method, tolerance_m, bucket_seconds)
+            if cacheable:
+                track_cache.set(key, piece)
+        pieces.append(piece)
+        day += timedelta(days=1)
+
+    return (
+        np.concatenate([p[0] for p in pieces]),
+        np.concatenate([p[1] for p in pieces]),
+        np.concatenate([p[2] for p in pieces]),
+    )
+
+
+@router.get("/couriers/{courier_id}/track")
+async def get_courier_track(
+    courier_id: int,
+    date_from: datetime = Query(..., alias="from"),
+    date_to: datetime = Query(..., alias="to"),
+    simplify: Optional[Literal["dp", "vw"]] = Query(
+        None, description="dp — Douglas–Peucker, vw — Visvalingam–Whyatt"),
+    tolerance: float = Query(10.0, gt=0, le=10_000, description="Допуск упрощения, метры"),
+    bucket_seconds: Optional[int] = Query(None, ge=1, le=3600, description="Не больше точки за интервал"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Точки маршрута курьера за интервал в NDJSON (по строке на точку)"""
+    date_from, date_to = _track_range(date_from, date_to)
+
+    if simplify or bucket_seconds:
+        times, lats, lons = await _simplified_track(
+            session, courier_id, date_from, date_to, simplify, tolerance, bucket_seconds
+        )
+        stamps = np.datetime_as_string(times, unit="us").tolist()
+        body = b"".join(
+            orjson.dumps({"recorded_at": t, "latitude": lat, "longitude": lon}) + b"\n"
+            for t, lat, lon in zip(stamps, lats.tolist(), lons.tolist())
+        )
+        return Response(content=body, media_type=NDJSON)
+
+    async def stream_points():
+        # Сессия живёт внутри генератора: зависимости FastAPI закрываются до конца стрима
+        async with await replica_router.open_session() as stream_session:
+            result = await stream_session.stream(
+                _track_query(courier_id, date_from, date_to).execution_options(yield_per=2000)
+            )
+            async for rows in result.partitions():
+                yield b"".join(
+                    orjson.dumps({"recorded_at": t, "latitude": lat, "longitude": lon}) + b"\n"
+                    for t, lat, lon in rows
+                )
+
+    return StreamingResponse(stream_points(), media_type=NDJSON)
+
+
+@router.get("/couriers/{courier_id}/distance")
+async def get_courier_distance(
+    courier_id: int,
+    date_from: datetime = Query(..., alias="from"),
+    date_to: datetime = Query(..., alias="to"),
+    session: AsyncSession = Depends(get_session),
+):
+    """Пройденное расстояние за интервал по истории точек"""
+    date_from, date_to = _track_range(date_from, date_to)
+    result = await session.execute(_track_query(courier_id, date_from, date_to))
+    points = np.array([(lat, lon) for _, lat, lon in result], dtype=np.float64).reshape(-1, 2)
+    distance_km = 0.0
+    if len(points) > 1:
+        distance_km = float(geo.haversine(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1]).sum())
+    return {"courier_id": courier_id, "points": len(points), "distance_km": round(distance_km, 3)}
@@ -0,0 +1,112 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import get_session
+from models import Zone
+from schemas.zone import ZoneCreate, ZoneRead
+from services.replica import get_read_session
+from services.spatial_index import pending_orders_index
+from services.zones import polygon_bbox, publish_zones_changed, retag, zone_index
+
+router = APIRouter(
+    prefix="/zones",
+    tags=["Zones"]
+)
+
+
+def _bbox(zone: Zone):
+    return (zone.min_lat, zone.min_lon, zone.max_lat, zone.max_lon)
+
+
+async def _apply_zone_change(session: AsyncSession, bboxes) -> dict:
+    """
+    После изменения зоны: перестроить индекс и перетегировать активные заказы
+    и курьеров в старой и новой рамке, затем оповестить остальные воркеры
+    """
+    zone_index.invalidate()
+    await zone_index.ensure_loaded(session)
+    retagged = await retag(session, bboxes)
+    await session.commit()
+    pending_orders_index.invalidate()
+    await publish_zones_changed()
+    print(f"📍 Зоны изменены, перетегировано: {retagged}")
+    return retagged
+
+
+async def _save(session: AsyncSession) -> None:
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="Зона с таким названием уже есть")
+
+
+# 📌 Список зон
+@router.get("/", response_model=List[ZoneRead])
+async def list_zones(session: AsyncSession = Depends(get_read_session)):
+    return (await session.execute(select(Zone).order_by(Zone.id))).scalars().all()
+
+
+# 📍 Зона по точке (та же логика, что при создании заказа)
+@router.get("/lookup")
+async def lookup_zone(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    session: AsyncSession = Depends(get_session),
+):
+    await zone_index.ensure_loaded(session)
+    return {"latitude": lat, "longitude": lon, "zone_id": zone_index.lookup(lat, lon)}
+
+
+@router.get("/{zone_id}", response_model=ZoneRead)
+async def get_zone(zone_id: int, session: AsyncSession = Depends(get_read_session)):
+    zone = await session.get(Zone, zone_id)
+    if zone is None:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    return zone
+
+
+# Создать зону: попавшие в неё активные заказы и курьеры получают zone_id
+@router.post("/", response_model=ZoneRead)
+async def create_zone(data: ZoneCreate, session: AsyncSession = Depends(get_session)):
+    min_lat, min_lon, max_lat, max_lon = polygon_bbox(data.polygon)
+    zone = Zone(**data.model_dump(), min_lat=min_lat, min_lon=min_lon, max_lat=max_lat, max_lon=max_lon)
+    session.add(zone)
+    await _save(session)
+    await session.refresh(zone)
+    await _apply_zone_change(session, [_bbox(zone)])
+    return zone
+
+
+# Изменить зону (полигон, название, приоритет)
+@router.put("/{zone_id}", response_model=ZoneRead)
+async def update_zone(zone_id: int, data: ZoneCreate, session: AsyncSession = Depends(get_session)):
+    zone = await session.get(Zone, zone_id)
+    if zone is None:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    old_bbox = _bbox(zone)
+    zone.name = data.name
+    zone.polygon = data.polygon
+    zone.priority = data.priority
+    zone.min_lat, zone.min_lon, zone.max_lat, zone.max_lon = polygon_bbox(data.polygon)
+    await _save(session)
+    await session.refresh(zone)
+    await _apply_zone_change(session, [old_bbox, _bbox(zone)])
+    return zone
+
+
+# Удалить зону: её заказы и курьеры переходят в соседние зоны или остаются без зоны
+@router.delete("/{zone_id}")
+async def delete_zone(zone_id: int, session: AsyncSession = Depends(get_session)):
+    zone = await session.get(Zone, zone_id)
+    if zone is None:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    old_bbox = _bbox(zone)
+    await session.delete(zone)
+    await session.commit()
+    retagged = await _apply_zone_change(session, [old_bbox])
+    return {"message": f"Zone {zone_id} deleted", "retagged": retagged}
@@ -28,6 +28,7 @@ class OrderRead(BaseModel):
     assigned_at: Optional[datetime] = None
     delivered_at: Optional[datetime] = None
     courier_id: Optional[int] = None
+    zone_id: Optional[int] = None
     recipient_name: Optional[str] = None
     recipient_phone: Optional[str] = None
     comment: Optional[str] = None
@@ -0,0 +1,56 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Optional
+from datetime import datetime, timezone
+
+import config
+
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # В БД время хранится без зоны, в UTC
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class PositionFix(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90, description="Широта")
+    longitude: float = Field(..., ge=-180, le=180, description="Долгота")
+    recorded_at: Optional[datetime] = Field(None, description="Время фиксации на устройстве; по умолчанию — время приёма")
+
+    @field_validator('recorded_at')
+    @classmethod
+    def normalize_time(cls, v):
+        return to_naive_utc(v)
+
+
+class PositionUpload(BaseModel):
+    """
+    Пачка точек из офлайн-буфера или фонового режима.
+    Старый формат с одной точкой (latitude/longitude в корне) тоже принимается.
+    """
+    positions: List[PositionFix] = Field(default_factory=list, max_length=config.POSITION_UPLOAD_MAX_FIXES)
+    courier_id: Optional[int] = Field(None, description="Игнорируется: курьер определяется по токену")
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    recorded_at: Optional[datetime] = None
+
+    @field_validator('recorded_at')
+    @classmethod
+    def normalize_time(cls, v):
+        return to_naive_utc(v)
+
+    @model_validator(mode='after')
+    def collect_single_fix(self):
+        if self.latitude is not None and self.longitude is not None:
+            self.positions.append(PositionFix(
+                latitude=self.latitude, longitude=self.longitude, recorded_at=self.recorded_at
+            ))
+        if not self.positions:
+            raise ValueError('Нужна хотя бы одна точка')
+        return self
+
+
+class PositionUploadResult(BaseModel):
+    accepted: int
+    rejected: int
+    current_updated: bool
@@ -0,0 +1,38 @@
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, Optional
+from datetime import datetime
+
+from services.zones import polygon_rings
+
+
+class ZoneCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100, description="Название зоны")
+    polygon: Dict[str, Any] = Field(..., description="GeoJSON Polygon или MultiPolygon, координаты [lon, lat]")
+    priority: int = Field(0, description="При пересечении зон точка достаётся зоне с большим priority")
+
+    @field_validator('polygon')
+    @classmethod
+    def validate_polygon(cls, v):
+        # GeoJSON Feature тоже принимаем — берём его геометрию
+        if v.get("type") == "Feature":
+            v = v.get("geometry") or {}
+        try:
+            polygon_rings(v)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'Некорректный полигон: {e}')
+        return {"type": v["type"], "coordinates": v["coordinates"]}
+
+
+class ZoneRead(BaseModel):
+    id: int
+    name: str
+    polygon: Dict[str, Any]
+    priority: int
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,232 @@
+import asyncio
+
+import orjson
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+import config
+from services.order_events import ORDERS_CHANNEL
+from services.pubsub import MAX_PAYLOAD_BYTES, broker
+
+POSITIONS_CHANNEL = "positions"
+
+# Сколько событий заказов может ждать отправки одному админу
+MAX_PENDING_EVENTS = 1000
+
+
+class AdminClient:
+    """
+    Одно подключение админа со своей задачей отправки.
+    Пока сокет занят, изменения копятся в pending и схлопываются по courier_id,
+    поэтому медленный админ получает реже, но не тормозит остальных.
+    """
+
+    def __init__(self, hub: "AdminHub", websocket: WebSocket):
+        self.hub = hub
+        self.websocket = websocket
+        self.pending: Dict[int, dict] = {}
+        # Общий для всех уже сериализованный кадр, пока у клиента нет хвоста
+        self.shared: Optional[Tuple[Dict[int, dict], str]] = None
+        # События заказов не схлопываются: уходят все и по порядку
+        self.events: List[str] = []
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.frames_sent = 0
+
+    def offer(self, changes: Dict[int, dict], encoded: str) -> None:
+        if not self.pending and self.shared is None:
+            self.shared = (changes, encoded)
+        else:
+            if self.shared is not None:
+                self._merge(self.shared[0])
+                self.shared = None
+            self._merge(changes)
+        self.ready.set()
+
+    def push_event(self, encoded: str) -> None:
+        if len(self.events) >= MAX_PENDING_EVENTS:
+            print("❌ Админ не успевает получать события заказов, отключаем")
+            self.hub.drop(self.websocket)
+            return
+        self.events.append(encoded)
+        self.ready.set()
+
+    def _merge(self, changes: Dict[int, dict]) -> None:
+        for courier_id, fields in changes.items():
+            current = self.pending.get(courier_id)
+            if current is None:
+                self.pending[courier_id] = dict(fields)
+            else:
+                current.update(fields)
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.events:
+                    await asyncio.wait_for(
+                        self.websocket.send_text(self.events.pop(0)), timeout=self.hub.send_timeout
+                    )
+                    self.frames_sent += 1
+                if self.pending:
+                    payload = encode_frame("positions", list(self.pending.values()))
+                    self.pending = {}
+                elif self.shared is not None:
+                    payload = self.shared[1]
+                else:
+                    continue
+                self.shared = None
+                await asyncio.wait_for(
+                    self.websocket.send_text(payload), timeout=self.hub.send_timeout
+                )
+                self.frames_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Админ отключён при отправке: {e!r}")
+            self.hub.drop(self.websocket)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+
+def encode_frame(frame_type: str, couriers: list) -> str:
+    return orjson.dumps({"type": frame_type, "couriers": couriers}).decode()
+
+
+class AdminHub:
+    """
+    Рассылка изменений позиций админам.
+    Изменения накапливаются между тиками и публикуются в брокер; каждый воркер
+    получает их из брокера и отправляет своим админам кадр-дельту только
+    с изменившимися курьерами. События заказов уходят тем же сокетом без схлопывания.
+    """
+
+    def __init__(self, tick_ms: int, send_timeout_ms: int):
+        self.tick = tick_ms / 1000
+        self.send_timeout = send_timeout_ms / 1000
+        self._clients: Dict[WebSocket, AdminClient] = {}
+        self._changes: Dict[int, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closing: set = set()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def publish(self, courier_id: int, **fields) -> None:
+        """Запомнить изменение курьера; уйдёт админам на ближайшем тике"""
+        current = self._changes.get(courier_id)
+        if current is None:
+            self._changes[courier_id] = {"courier_id": courier_id, **fields}
+        else:
+            current.update(fields)
+
+    async def connect(self, websocket: WebSocket, snapshot: list) -> AdminClient:
+        """
+        Регистрируем клиента до отправки снимка, чтобы не потерять изменения,
+        пришедшие пока снимок уходит; задачу отправки запускаем после снимка.
+        """
+        client = AdminClient(self, websocket)
+        self._clients[websocket] = client
+        await websocket.send_text(encode_frame("snapshot", snapshot))
+        client.start()
+        return client
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        client = self._clients.pop(websocket, None)
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def drop(self, websocket: WebSocket) -> None:
+        """
+        Отключить отстающего админа и закрыть его сокет: браузер переподключится
+        и получит свежий снимок, а не будет показывать замёрзшую карту
+        """
+        self.disconnect(websocket)
+        task = asyncio.get_running_loop().create_task(_close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _flush(self) -> None:
+        if not self._changes:
+            return
+        changes, self._changes = self._changes, {}
+        for chunk in _split_by_size(list(changes.values())):
+            await broker.publish(POSITIONS_CHANNEL, {"couriers": chunk})
+
+    def _deliver(self, message: dict) -> None:
+        if not self._clients:
+            return
+        couriers = message.get("couriers") or []
+        changes = {c["courier_id"]: c for c in couriers}
+        encoded = encode_frame("positions", couriers)
+        for client in self._clients.values():
+            client.offer(changes, encoded)
+
+    def _deliver_order_event(self, message: dict) -> None:
+        if not self._clients:
+            return
+        encoded = orjson.dumps({"type": "order_event", "event": message}).decode()
+        for client in list(self._clients.values()):
+            client.push_event(encoded)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self._flush()
+            except Exception as e:
+                print(f"❌ Ошибка рассылки позиций админам: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            broker.subscribe(POSITIONS_CHANNEL, self._deliver)
+            broker.subscribe(ORDERS_CHANNEL, self._deliver_order_event)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            broker.unsubscribe(POSITIONS_CHANNEL, self._deliver)
+            broker.unsubscribe(ORDERS_CHANNEL, self._deliver_order_event)
+        for websocket in list(self._clients):
+            self.disconnect(websocket)
+
+
+async def _close(websocket: WebSocket) -> None:
+    try:
+        # 1013 — «повторите позже»: клиент переподключается
+        await websocket.close(code=1013)
+    except Exception:
+        pass  # сокет уже закрыт
+
+
+def _split_by_size(couriers: list) -> list:
+    """Режем изменения на сообщения, влезающие в лимит payload брокера"""
+    chunks = []
+    current = []
+    size = 64  # запас на обёртку сообщения
+    for item in couriers:
+        item_size = len(orjson.dumps(item)) + 1
+        if current and size + item_size > MAX_PAYLOAD_BYTES:
+            chunks.append(current)
+            current = []
+            size = 64
+        current.append(item)
+        size += item_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+admin_hub = AdminHub(
+    tick_ms=config.ADMIN_TICK_MS,
+    send_timeout_ms=config.ADMIN_SEND_TIMEOUT_MS,
+)
@@ -0,0 +1,187 @@
+"""
+Потоковый импорт заказов: тело запроса в NDJSON или CSV читается кусками,
+строки валидируются OrderCreate пачками и вставляются многострочным
+INSERT ... RETURNING. Ошибочные строки не прерывают импорт.
+"""
+import codecs
+import csv
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+import config
+from database import AsyncSessionLocal
+from models import Order
+from schemas.order import OrderCreate
+from services.order_events import publish_order_message
+from services.zones import zone_index
+
+# (номер строки во входных данных, сырые поля или текст ошибки разбора)
+RawRow = Tuple[int, object]
+
+_insert_orders = insert(Order).returning(Order.id)
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Строки из потока байт; UTF-8 декодируется инкрементально, BOM отбрасывается"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[RawRow]:
+    line_no = 0
+    async for line in _lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            value = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_no, f"некорректный JSON: {e}"
+            continue
+        yield line_no, value if isinstance(value, dict) else "строка должна быть JSON-объектом"
+
+
+async def csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[RawRow]:
+    """
+    CSV с заголовком. Запись может занимать несколько строк (перенос внутри
+    кавычек): запись закончена, когда число кавычек в ней чётное.
+    Пустые значения становятся None.
+    """
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    quotes = 0
+    line_no = 0
+    record_line = 0
+
+    async for line in _lines(chunks):
+        line_no += 1
+        if not record:
+            record_line = line_no
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text = "\n".join(record).rstrip("\r")
+        record, quotes = [], 0
+        if not text.strip():
+            continue
+        fields = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in fields]
+            continue
+        if len(fields) != len(header):
+            yield record_line, f"ожидалось {len(header)} полей, получено {len(fields)}"
+            continue
+        yield record_line, {k: (v if v != "" else None) for k, v in zip(header, fields)}
+
+    if record:
+        yield record_line, "незакрытая кавычка в конце файла"
+
+
+def _validate(rows: List[RawRow]) -> Tuple[List[Tuple[int, dict]], List[dict]]:
+    valid, errors = [], []
+    for line_no, raw in rows:
+        if isinstance(raw, str):
+            errors.append({"line": line_no, "errors": [raw]})
+            continue
+        try:
+            valid.append((line_no, OrderCreate.model_validate(raw).model_dump()))
+        except ValidationError as e:
+            errors.append({
+                "line": line_no,
+                "errors": [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()],
+            })
+    return valid, errors
+
+
+class BulkImportResult:
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self.started = time.perf_counter()
+
+    def add_errors(self, errors: List[dict]) -> None:
+        self.failed += len(errors)
+        room = self.max_errors - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+async def _insert_chunk(valid: List[Tuple[int, dict]], result: BulkImportResult) -> None:
+    now = datetime.utcnow()
+    zones = zone_index.lookup_many([v["latitude"] for _, v in valid], [v["longitude"] for _, v in valid])
+    params = [
+        {**values, "status": "pending", "created_at": now, "zone_id": zone_id}
+        for (_, values), zone_id in zip(valid, zones)
+    ]
+    try:
+        # Каждая пачка — своя транзакция: ошибка БД теряет только её строки
+        async with AsyncSessionLocal() as session:
+            inserted = (await session.execute(_insert_orders, params)).all()
+            await session.commit()
+    except SQLAlchemyError as e:
+        message = f"ошибка записи пачки: {e.__class__.__name__}"
+        result.add_errors([{"line": line_no, "errors": [message]} for line_no, _ in valid])
+        return
+    result.inserted += len(inserted)
+
+
+async def import_orders(rows: AsyncIterator[RawRow]) -> Dict[str, object]:
+    result = BulkImportResult(max_errors=config.BULK_IMPORT_MAX_ERRORS)
+    chunk: List[RawRow] = []
+    total = 0
+    # Зоны проставляются при вставке пачек
+    async with AsyncSessionLocal() as session:
+        await zone_index.ensure_loaded(session)
+
+    async def flush() -> None:
+        valid, errors = _validate(chunk)
+        result.add_errors(errors)
+        if valid:
+            await _insert_chunk(valid, result)
+        chunk.clear()
+
+    async for row in rows:
+        total += 1
+        if total > config.BULK_IMPORT_MAX_ROWS:
+            result.add_errors([{"line": row[0], "errors": [
+                f"превышен лимит {config.BULK_IMPORT_MAX_ROWS} строк, остаток файла пропущен"
+            ]}])
+            break
+        chunk.append(row)
+        if len(chunk) >= config.BULK_IMPORT_CHUNK_ROWS:
+            await flush()
+    if chunk:
+        await flush()
+
+    if result.inserted:
+        # Одно событие на весь импорт вместо сотен тысяч order_created;
+        # индексы свободных заказов по нему перезагружаются во всех воркерах
+        await publish_order_message({"event": "orders_imported", "count": result.inserted, "courier_id": None})
+    return result.as_dict()
@@ -0,0 +1,364 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+
+import config
+from database import AsyncSessionLocal
+from models import Courier, Order
+from services.order_events import publish_order_message
+from services.geo import haversine_many_to_many
+from services.routing import routing
+from services.spatial_index import pending_orders_index
+
+_orders = Order.__table__
+_couriers = Courier.__table__
+
+# Ключ advisory-lock: раунд в каждый момент крутит только один воркер
+DISPATCH_LOCK_KEY = 7_310_001
+
+# В режиме eta: стоимость пар, для которых время в пути не запрашивалось,
+# и порог, выше которого пара не назначается
+NO_ROUTE_COST = 1e9
+MAX_ETA_COST = NO_ROUTE_COST / 10
+
+_assign_orders = (
+    update(_orders)
+    .where(_orders.c.id == bindparam("b_order_id"))
+    .values(status="assigned", courier_id=bindparam("b_courier_id"), assigned_at=bindparam("b_ts"))
+)
+_set_current_order = (
+    update(_couriers)
+    .where(_couriers.c.id == bindparam("b_courier_id"))
+    .values(current_order_id=bindparam("b_order_id"))
+)
+
+
+def greedy_assignment(cost: np.ndarray, max_cost: float = np.inf) -> List[Tuple[int, int]]:
+    """
+    Жадное назначение по возрастанию стоимости.
+    За раунд берём все взаимно-ближайшие пары (строка выбрала столбец и наоборот) —
+    это ровно те пары, которые выбрал бы жадный проход по отсортированному списку,
+    но без сортировки всех n*m элементов.
+    """
+    rows = np.arange(cost.shape[0])
+    cols = np.arange(cost.shape[1])
+    pairs: List[Tuple[int, int]] = []
+
+    while rows.size and cols.size:
+        sub = cost[np.ix_(rows, cols)]
+        best_col = sub.argmin(axis=1)
+        best_row = sub.argmin(axis=0)
+        mutual = best_row[best_col] == np.arange(rows.size)
+        mutual &= sub[np.arange(rows.size), best_col] <= max_cost
+        if not mutual.any():
+            break
+        r_idx = np.flatnonzero(mutual)
+        c_idx = best_col[r_idx]
+        pairs.extend(zip(rows[r_idx].tolist(), cols[c_idx].tolist()))
+
+        keep_rows = np.ones(rows.size, dtype=bool)
+        keep_rows[r_idx] = False
+        keep_cols = np.ones(cols.size, dtype=bool)
+        keep_cols[c_idx] = False
+        rows = rows[keep_rows]
+        cols = cols[keep_cols]
+
+    return pairs
+
+
+def hungarian_assignment(cost: np.ndarray, max_cost: float = np.inf) -> List[Tuple[int, int]]:
+    """Оптимальное назначение (минимум суммарного расстояния), нужен scipy"""
+    from scipy.optimize import linear_sum_assignment
+
+    if np.isfinite(max_cost):
+        # Недопустимые пары делаем дороже любой допустимой и отбрасываем после решения
+        cost = np.where(cost <= max_cost, cost, max_cost * 10 + cost.max() + 1)
+    row_ind, col_ind = linear_sum_assignment(cost)
+    return [
+        (int(r), int(c)) for r, c in zip(row_ind, col_ind)
+        if cost[r, c] <= max_cost
+    ]
+
+
+class Dispatcher:
+    """
+    Фоновое распределение свободных заказов по свободным курьерам.
+    Пары подбираются без блокировок, затем в одной транзакции строки выбранных
+    пар блокируются через FOR UPDATE SKIP LOCKED и перепроверяются, поэтому
+    параллельное ручное назначение просто пропускается до следующего раунда.
+    С by_zone задача решается отдельно в каждой зоне (заказы и курьеры вне зон —
+    отдельная группа): матрицы меньше, и курьер не уезжает в чужую зону.
+    С cost="eta" стоимость — время в пути до eta_candidates ближайших по прямой
+    заказов каждого курьера (остальные пары не рассматриваются).
+    mode="hungarian" требует scipy; без него раунды идут жадным алгоритмом.
+    """
+
+    def __init__(self, interval_ms: int, mode: str, max_distance_km: float, max_orders: int,
+                 by_zone: bool = True, cost: str = "distance", eta_candidates: int = 5):
+        self.interval = interval_ms / 1000
+        self.mode = mode
+        self.by_zone = by_zone
+        self.cost = cost
+        self.eta_candidates = eta_candidates
+        self.max_distance_km = max_distance_km if max_distance_km > 0 else np.inf
+        self.max_orders = max_orders
+        self._task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "rounds": 0,
+            "skipped_rounds": 0,
+            "errors": 0,
+            "assigned_total": 0,
+            "last_round_ms": 0.0,
+            "max_round_ms": 0.0,
+            "last_solve_ms": 0.0,
+            "last_orders": 0,
+            "last_couriers": 0,
+            "last_matrix_cells": 0,
+            "last_zones": 0,
+            "last_assigned": 0,
+            "last_routing_ms": 0.0,
+            "mode": mode,
+            "cost": cost,
+        }
+
+    def _assign(self, cost: np.ndarray, max_cost: float) -> List[Tuple[int, int]]:
+        if self.mode == "hungarian":
+            try:
+                return hungarian_assignment(cost, max_cost)
+            except ImportError:
+                print("❌ Для DISPATCH_MODE=hungarian нужен scipy, используем greedy")
+                self.mode = self.stats["mode"] = "greedy"
+        return greedy_assignment(cost, max_cost)
+
+    @staticmethod
+    def _distance_cost(courier_arr: np.ndarray, order_arr: np.ndarray) -> np.ndarray:
+        return haversine_many_to_many(
+            courier_arr[:, 0], courier_arr[:, 1], order_arr[:, 0], order_arr[:, 1], dtype=np.float32
+        )
+
+    def _groups(self, courier_zones: np.ndarray, order_zones: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Индексы курьеров и заказов каждой подзадачи"""
+        if not self.by_zone:
+            return [(np.arange(len(courier_zones)), np.arange(len(order_zones)))]
+        return [
+            (np.flatnonzero(courier_zones == zone), np.flatnonzero(order_zones == zone))
+            for zone in np.intersect1d(courier_zones, order_zones).tolist()
+        ]
+
+    def _eta_candidates(self, courier_arr: np.ndarray, order_arr: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Пары (курьер, заказ): eta_candidates ближайших по прямой заказов каждого курьера"""
+        dist = self._distance_cost(courier_arr, order_arr)
+        k = min(self.eta_candidates, dist.shape[1])
+        cols = np.argpartition(dist, k - 1, axis=1)[:, :k].ravel()
+        rows = np.repeat(np.arange(dist.shape[0]), k)
+        keep = dist[rows, cols] <= self.max_distance_km
+        return rows[keep], cols[keep]
+
+    async def _eta_costs(self, courier_arr: np.ndarray, order_arr: np.ndarray,
+                         groups: List[Tuple[np.ndarray, np.ndarray]]) -> List[np.ndarray]:
+        """Матрицы времени в пути (с) для подзадач; время всех групп запрашивается одной пачкой"""
+        candidates = await asyncio.to_thread(
+            lambda: [self._eta_candidates(courier_arr[c_idx], order_arr[o_idx]) for c_idx, o_idx in groups]
+        )
+        pairs = []
+        for (c_idx, o_idx), (rows, cols) in zip(groups, candidates):
+            c_pts = courier_arr[c_idx[rows]]
+            o_pts = order_arr[o_idx[cols]]
+            pairs.extend(zip(c_pts[:, 0].tolist(), c_pts[:, 1].tolist(), o_pts[:, 0].tolist(), o_pts[:, 1].tolist()))
+        seconds, _ = await routing.route_pairs(pairs)
+
+        costs = []
+        offset = 0
+        for (c_idx, o_idx), (rows, cols) in zip(groups, candidates):
+            cost = np.full((len(c_idx), len(o_idx)), NO_ROUTE_COST, dtype=np.float32)
+            cost[rows, cols] = seconds[offset:offset + len(rows)]
+            offset += len(rows)
+            costs.append(cost)
+        return costs
+
+    def _solve(self, courier_arr: np.ndarray, order_arr: np.ndarray,
+               groups: List[Tuple[np.ndarray, np.ndarray]],
+               costs: Optional[List[np.ndarray]] = None) -> List[Tuple[int, int]]:
+        pairs: List[Tuple[int, int]] = []
+        cells = 0
+        for g, (c_idx, o_idx) in enumerate(groups):
+            if costs is None:
+                cost, max_cost = self._distance_cost(courier_arr[c_idx], order_arr[o_idx]), self.max_distance_km
+            else:
+                cost, max_cost = costs[g], MAX_ETA_COST
+            cells += cost.size
+            for c, o in self._assign(cost, max_cost):
+                pairs.append((int(c_idx[c]), int(o_idx[o])))
+        self.stats["last_zones"] = len(groups)
+        self.stats["last_matrix_cells"] = cells
+        return pairs
+
+    def _orders_stmt(self):
+        return (
+            select(Order.id, Order.latitude, Order.longitude, Order.zone_id)
+            .where(
+                Order.status == "pending",
+                Order.latitude.is_not(None),
+                Order.longitude.is_not(None),
+            )
+            .order_by(Order.created_at, Order.id)
+            .limit(self.max_orders)
+        )
+
+    @staticmethod
+    def _couriers_stmt():
+        return (
+            select(Courier.id, Courier.latitude, Courier.longitude, Courier.zone_id)
+            .where(
+                Courier.status == "avail",
+                Courier.current_order_id.is_(None),
+                # current_order_id мог разойтись с заказами (старые данные, ручная правка);
+                # такой курьер нарушил бы уникальный индекс и сорвал весь пакетный UPDATE
+                ~select(Order.id).where(
+                    Order.courier_id == Courier.id, Order.status == "assigned"
+                ).exists(),
+                Courier.latitude.is_not(None),
+                Courier.longitude.is_not(None),
+            )
+        )
+
+    async def _match(self, orders: list, couriers: list) -> List[Tuple[int, int]]:
+        """Пары (индекс курьера, индекс заказа)"""
+        self.stats["last_orders"] = len(orders)
+        self.stats["last_couriers"] = len(couriers)
+        if not orders or not couriers:
+            return []
+
+        order_arr = np.array([(o[1], o[2]) for o in orders], dtype=np.float64)
+        courier_arr = np.array([(c[1], c[2]) for c in couriers], dtype=np.float64)
+        # -1 — вне зон
+        order_zones = np.array([-1 if o[3] is None else o[3] for o in orders], dtype=np.int64)
+        courier_zones = np.array([-1 if c[3] is None else c[3] for c in couriers], dtype=np.int64)
+
+        groups = self._groups(courier_zones, order_zones)
+        costs = None
+        if self.cost == "eta":
+            routing_started = time.perf_counter()
+            costs = await self._eta_costs(courier_arr, order_arr, groups)
+            self.stats["last_routing_ms"] = (time.perf_counter() - routing_started) * 1000
+
+        # Матрица и решение считаются в потоке, чтобы не держать event loop
+        solve_started = time.perf_counter()
+        pairs = await asyncio.to_thread(self._solve, courier_arr, order_arr, groups, costs)
+        self.stats["last_solve_ms"] = (time.perf_counter() - solve_started) * 1000
+        return pairs
+
+    async def _lock_pairs(self, session, orders: list, couriers: list,
+                          pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Блокирует строки выбранных пар и оставляет те, что всё ещё свободны"""
+        order_ids = [orders[o][0] for _, o in pairs]
+        courier_ids = [couriers[c][0] for c, _ in pairs]
+        free_orders = set((await session.scalars(
+            select(Order.id)
+            .where(Order.id.in_(order_ids), Order.status == "pending")
+            .with_for_update(skip_locked=True)
+        )).all())
+        free_couriers = set((await session.scalars(
+            self._couriers_stmt().with_only_columns(Courier.id)
+            .where(Courier.id.in_(courier_ids))
+            .with_for_update(skip_locked=True)
+        )).all())
+        return [
+            (c, o) for c, o in pairs
+            if orders[o][0] in free_orders and couriers[c][0] in free_couriers
+        ]
+
+    async def run_round(self) -> int:
+        started = time.perf_counter()
+        assigned: List[dict] = []
+
+        # Кандидаты читаются без блокировок, а матрица, маршруты (в режиме eta)
+        # и решение считаются до транзакции: пока идёт расчёт, строки курьеров
+        # и заказов свободны для записи позиций и ручного назначения.
+        # Потом выбранные пары блокируются и перепроверяются
+        async with AsyncSessionLocal() as session:
+            orders = (await session.execute(self._orders_stmt())).all()
+            couriers = (await session.execute(self._couriers_stmt())).all()
+        pairs = await self._match(orders, couriers)
+
+        if pairs:
+            async with AsyncSessionLocal() as session:
+                async with session.begin():
+                    locked = await session.scalar(select(func.pg_try_advisory_xact_lock(DISPATCH_LOCK_KEY)))
+                    if not locked:
+                        self.stats["skipped_rounds"] += 1
+                        return 0
+
+                    pairs = await self._lock_pairs(session, orders, couriers, pairs)
+
+                    now = datetime.utcnow()
+                    assigned = [
+                        {"b_order_id": orders[o_idx][0], "b_courier_id": couriers[c_idx][0], "b_ts": now}
+                        for c_idx, o_idx in pairs
+                    ]
+                    if assigned:
+                        await session.execute(_assign_orders, assigned)
+                        await session.execute(
+                            _set_current_order,
+                            [{"b_courier_id": r["b_courier_id"], "b_order_id": r["b_order_id"]} for r in assigned],
+                        )
+
+        coordinates = {o[0]: (o[1], o[2], o[3]) for o in orders} if assigned else {}
+        for row in assigned:
+            order_id = row["b_order_id"]
+            pending_orders_index.discard(order_id)
+            await publish_order_message({
+                "event": "order_assigned",
+                "order_id": order_id,
+                "status": "assigned",
+                "courier_id": row["b_courier_id"],
+                "latitude": coordinates[order_id][0],
+                "longitude": coordinates[order_id][1],
+                "zone_id": coordinates[order_id][2],
+            })
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stats["rounds"] += 1
+        self.stats["last_round_ms"] = elapsed
+        self.stats["max_round_ms"] = max(self.stats["max_round_ms"], elapsed)
+        self.stats["last_assigned"] = len(assigned)
+        self.stats["assigned_total"] += len(assigned)
+        return len(assigned)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_round()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"❌ Ошибка раунда распределения заказов: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+dispatcher = Dispatcher(
+    interval_ms=config.DISPATCH_INTERVAL_MS,
+    mode=config.DISPATCH_MODE,
+    max_distance_km=config.DISPATCH_MAX_DISTANCE_KM,
+    max_orders=config.DISPATCH_MAX_ORDERS,
+    by_zone=config.DISPATCH_BY_ZONE,
+    cost=config.DISPATCH_COST,
+    eta_candidates=config.DISPATCH_ETA_CANDIDATES,
+)
@@ -0,0 +1,98 @@
+"""
+Геометрия на сфере: haversine, азимут, bounding box.
+Все функции векторизованы через NumPy и принимают скаляры или массивы;
+массивы приводятся к непрерывным float64.
+"""
+import math
+from typing import Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def as_coords(values) -> np.ndarray:
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Поэлементное расстояние (км) с broadcasting"""
+    phi1 = np.radians(as_coords(lat1))
+    phi2 = np.radians(as_coords(lat2))
+    dlmb = np.radians(as_coords(lon2)) - np.radians(as_coords(lon1))
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_one_to_many(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Расстояния (км) от одной точки до массива точек"""
+    phi1 = math.radians(lat)
+    lmb1 = math.radians(lon)
+    phi2 = np.radians(as_coords(lats))
+    lmb2 = np.radians(as_coords(lons))
+    a = np.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin((lmb2 - lmb1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_many_to_many(lats1, lons1, lats2, lons2,
+                           dtype=np.float64, block_rows: int = 256) -> np.ndarray:
+    """
+    Матрица расстояний (км) len(lats1) x len(lats2).
+    Считается блоками строк, чтобы временные массивы не росли вместе с матрицей;
+    для больших матриц стоит передавать dtype=np.float32.
+    """
+    phi1_all = np.radians(as_coords(lats1))
+    lmb1_all = np.radians(as_coords(lons1))
+    phi2 = np.radians(as_coords(lats2))[None, :]
+    lmb2 = np.radians(as_coords(lons2))[None, :]
+    cos_phi2 = np.cos(phi2)
+
+    out = np.empty((phi1_all.size, phi2.size), dtype=dtype)
+    for start in range(0, phi1_all.size, block_rows):
+        phi1 = phi1_all[start:start + block_rows, None]
+        lmb1 = lmb1_all[start:start + block_rows, None]
+        a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * cos_phi2 * np.sin((lmb2 - lmb1) / 2) ** 2
+        out[start:start + block_rows] = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return out
+
+
+def bearing(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Начальный азимут из точки 1 в точку 2, градусы [0, 360)"""
+    phi1 = np.radians(as_coords(lat1))
+    phi2 = np.radians(as_coords(lat2))
+    dlmb = np.radians(as_coords(lon2)) - np.radians(as_coords(lon1))
+    x = np.sin(dlmb) * np.cos(phi2)
+    y = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlmb)
+    return np.degrees(np.arctan2(x, y)) % 360.0
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    Прямоугольник (min_lat, min_lon, max_lat, max_lon), гарантированно
+    содержащий круг радиуса radius_km. Около полюса — вся полоса долгот.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(lat - dlat, -90.0)
+    max_lat = min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-12 or radius_km / EARTH_RADIUS_KM >= math.pi / 2:
+        return min_lat, -180.0, max_lat, 180.0
+    dlon = dlat / cos_lat
+    return min_lat, lon - dlon, max_lat, lon + dlon
+
+
+def in_bbox(lats, lons, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> np.ndarray:
+    lats = as_coords(lats)
+    lons = as_coords(lons)
+    return (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+
+
+def within_radius(lat: float, lon: float, lats, lons, radius_km: float) -> np.ndarray:
+    """Маска точек в радиусе: сначала дешёвый bbox, haversine только для прошедших"""
+    lats = as_coords(lats)
+    lons = as_coords(lons)
+    mask = in_bbox(lats, lons, *bounding_box(lat, lon, radius_km))
+    idx = np.flatnonzero(mask)
+    if idx.size:
+        mask[idx] = haversine_one_to_many(lat, lon, lats[idx], lons[idx]) <= radius_km
+    return mask
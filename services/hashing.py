@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from passlib.context import CryptContext
+
+
+class HashingOverloaded(Exception):
+    """Очередь на хеширование паролей заполнена"""
+
+
+class PasswordHasher:
+    """
+    bcrypt в отдельном пуле потоков: сам bcrypt отпускает GIL, поэтому
+    event loop продолжает обслуживать WebSocket и остальные запросы.
+    Если ждущих задач больше max_queue, вызов сразу падает с HashingOverloaded.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, max_queue: int):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.in_flight = 0
+
+        # Статистика; completed/total_seconds/max_seconds пишут потоки пула
+        self._stats_lock = threading.Lock()
+        self.rejected = 0
+        self.completed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.observers: list[Callable[[str, float], None]] = []
+
+    @property
+    def queue_depth(self) -> int:
+        """Задачи, которые ждут свободный поток"""
+        return max(0, self.in_flight - self.workers)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise HashingOverloaded()
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), self._timed, operation, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def _timed(self, operation: str, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self.completed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+            for observer in self.observers:
+                observer(operation, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run("verify", self.context.verify, password, password_hash)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
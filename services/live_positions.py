@@ -0,0 +1,166 @@
+import asyncio
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from models import Courier
+from services.admin_hub import POSITIONS_CHANNEL
+from services.pubsub import broker
+from services.spatial_index import GridIndex
+
+# Ячейка индекса крупнее, чем у заказов: запросы идут прямоугольниками окна карты
+LIVE_CELL_DEG = 0.05
+
+# bbox в порядке GeoJSON: (min_lon, min_lat, max_lon, max_lat)
+BBox = Tuple[float, float, float, float]
+
+
+def cluster_cell_deg(zoom: int) -> float:
+    """Размер ячейки кластера в градусах: CLUSTER_CELL_PX пикселей тайла 256px на данном zoom"""
+    return 360.0 / (2 ** zoom) * config.CLUSTER_CELL_PX / 256
+
+
+class LivePositionIndex:
+    """
+    Текущие позиции курьеров в памяти процесса.
+    Загружается из БД при первом запросе, дальше обновляется изменениями из
+    канала брокера positions — теми же, что уходят админам, поэтому индекс
+    одинаково свежий на всех воркерах. Изменения до загрузки копятся и
+    накладываются поверх снимка: БД отстаёт от них на интервал буфера позиций.
+    """
+
+    def __init__(self, cell_deg: float = LIVE_CELL_DEG):
+        self._grid = GridIndex(cell_deg)
+        self._couriers: Dict[int, dict] = {}
+        self._early: Dict[int, dict] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._grid)
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            result = await session.execute(
+                select(
+                    Courier.id.label("courier_id"),
+                    Courier.name,
+                    Courier.latitude,
+                    Courier.longitude,
+                    Courier.status,
+                )
+            )
+            self._grid.clear()
+            self._couriers = {}
+            for row in result.mappings():
+                self._apply(dict(row))
+            early, self._early = self._early, {}
+            for change in early.values():
+                self._apply(change)
+            self._loaded = True
+
+    def invalidate(self) -> None:
+        self._loaded = False
+        self._grid.clear()
+        self._couriers = {}
+        self._early = {}
+
+    def _apply(self, change: dict) -> None:
+        courier_id = change["courier_id"]
+        if change.get("removed"):
+            self._couriers.pop(courier_id, None)
+            self._grid.remove(courier_id)
+            return
+        current = self._couriers.get(courier_id)
+        if current is None:
+            current = self._couriers[courier_id] = {
+                "courier_id": courier_id, "name": None, "latitude": None, "longitude": None, "status": None,
+            }
+        for key in ("name", "latitude", "longitude", "status"):
+            if key in change:
+                current[key] = change[key]
+        if current["latitude"] is None or current["longitude"] is None:
+            self._grid.remove(courier_id)
+        else:
+            self._grid.add(courier_id, current["latitude"], current["longitude"])
+
+    def _deliver(self, message: dict) -> None:
+        for change in message.get("couriers") or []:
+            if self._loaded:
+                self._apply(change)
+            elif change.get("removed"):
+                self._early[change["courier_id"]] = dict(change)
+            else:
+                merged = self._early.setdefault(change["courier_id"], {})
+                merged.pop("removed", None)
+                merged.update(change)
+
+    def start(self) -> None:
+        broker.subscribe(POSITIONS_CHANNEL, self._deliver)
+
+    def stop(self) -> None:
+        broker.unsubscribe(POSITIONS_CHANNEL, self._deliver)
+        self.invalidate()
+
+    def positions(self, bbox: Optional[BBox] = None) -> List[dict]:
+        """Курьеры с координатами; bbox может пересекать антимеридиан (min_lon > max_lon)"""
+        if bbox is None:
+            ids = [i for i in self._couriers if i in self._grid]
+        else:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            if min_lon <= max_lon:
+                ids = self._grid.within_bbox(min_lat, min_lon, max_lat, max_lon)
+            else:
+                ids = (self._grid.within_bbox(min_lat, min_lon, max_lat, 180.0)
+                       + self._grid.within_bbox(min_lat, -180.0, max_lat, max_lon))
+        return [dict(self._couriers[i]) for i in ids]
+
+
+def cluster_positions(positions: List[dict], zoom: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Сеточная кластеризация: точки одной ячейки сворачиваются в (count, центроид).
+    Возвращает (кластеры, одиночные курьеры) — ячейку с одним курьером отдаём как есть.
+    """
+    if not positions:
+        return [], []
+    cell = cluster_cell_deg(zoom)
+    lats = np.fromiter((p["latitude"] for p in positions), dtype=np.float64, count=len(positions))
+    lons = np.fromiter((p["longitude"] for p in positions), dtype=np.float64, count=len(positions))
+    keys = np.stack([np.floor(lats / cell), np.floor(lons / cell)], axis=1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    sum_lat = np.bincount(inverse, weights=lats)
+    sum_lon = np.bincount(inverse, weights=lons)
+    clusters = [
+        {"latitude": lat, "longitude": lon, "count": count}
+        for lat, lon, count in zip(
+            (sum_lat / counts).tolist(), (sum_lon / counts).tolist(), counts.tolist()
+        )
+        if count > 1
+    ]
+    singles = [p for p, group in zip(positions, inverse.tolist()) if counts[group] == 1]
+    return clusters, singles
+
+
+def parse_bbox(value: str) -> BBox:
+    """Строка min_lon,min_lat,max_lon,max_lat -> кортеж; ValueError при неверном формате"""
+    parts = [float(x) for x in value.split(",")]
+    if len(parts) != 4 or not all(math.isfinite(x) for x in parts):
+        raise ValueError("bbox: нужно 4 числа min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError("bbox: координаты вне допустимого диапазона")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+# Общий индекс на процесс
+live_positions = LivePositionIndex()
@@ -0,0 +1,231 @@
+"""
+Диагностика event loop: постоянный замер отставания, сторож, который
+снимает стек, если loop занят дольше порога, и сэмплирующий профилировщик.
+Стеки читаются из отдельного потока через sys._current_frames(), поэтому
+в сам loop ничего не встраивается и без запущенного профиля накладных
+расходов нет.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from types import FrameType
+from typing import Dict, Optional, Tuple
+
+import config
+from services.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+# Кадры, в которых loop ждёт событий ввода-вывода, — это простой, а не работа
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "_run_once"}
+
+Stack = Tuple[str, ...]
+
+
+def endpoint_routes(app) -> Dict[object, str]:
+    """code-объект эндпоинта -> "GET /api/orders/{order_id}" (для WebSocket — "WS ...")"""
+    routes = {}
+    for route in app.routes:
+        endpoint = getattr(route, "endpoint", None)
+        code = getattr(endpoint, "__code__", None)
+        if code is None:
+            continue
+        methods = getattr(route, "methods", None)
+        routes[code] = f"{','.join(sorted(methods)) if methods else 'WS'} {route.path}"
+    return routes
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stack(frame: Optional[FrameType], routes: Dict[object, str]) -> Tuple[str, Stack]:
+    """Маршрут, которому принадлежит стек, и сам стек от внешнего кадра к внутреннему"""
+    names = []
+    route = "(other)"
+    while frame is not None:
+        names.append(_frame_name(frame))
+        if frame.f_code in routes and route == "(other)":
+            route = routes[frame.f_code]
+        frame = frame.f_back
+    names.reverse()
+    if names and names[-1].split(" ", 1)[0] in _IDLE_FUNCTIONS:
+        route = "(idle)"
+    return route, tuple(names)
+
+
+class LoopMonitor:
+    """
+    Задача в loop раз в interval засыпает и меряет, насколько позже
+    проснулась, — это и есть отставание. Поток-сторож следит за последним
+    пробуждением: если его нет дольше threshold, значит loop занят синхронным
+    кодом, и сторож снимает стек потока loop'а, пока блокировка ещё идёт.
+    """
+
+    def __init__(self, interval: float, threshold: float, max_events: int):
+        self.interval = interval
+        self.threshold = threshold
+        self.events: deque = deque(maxlen=max_events)
+        self.routes: Dict[object, str] = {}
+        self.loop_thread: Optional[int] = None
+        self._beat = time.monotonic()
+        self._stalled: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # Статистика
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._beat = time.monotonic()
+            self.samples += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.observe(lag)
+            stalled, self._stalled = self._stalled, None
+            if stalled is not None:
+                # Сторож видел начало блокировки, здесь известна полная длительность
+                stalled["blocked_ms"] = round(lag * 1000, 1)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold or self._stalled is not None:
+                continue
+            frame = sys._current_frames().get(self.loop_thread)
+            route, stack = sample_stack(frame, self.routes)
+            del frame
+            event = {
+                "at": time.time(),
+                "blocked_ms": round(blocked * 1000, 1),
+                "route": route,
+                "stack": list(stack),
+            }
+            self._stalled = event
+            self.events.append(event)
+            self.stalls += 1
+            EVENT_LOOP_STALLS.inc(route)
+            print(f"❌ Event loop занят {event['blocked_ms']} мс ({route}): {stack[-1] if stack else '?'}")
+
+    def start(self, app) -> None:
+        if self._task is not None:
+            return
+        self.routes = endpoint_routes(app)
+        self.loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": self.samples,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "stalls": self.stalls,
+            "recent_stalls": list(self.events),
+        }
+
+
+class ProfilerBusy(Exception):
+    """Профиль уже снимается"""
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик потока event loop: раз в interval поток-сэмплер
+    снимает стек и относит его к маршруту, чей эндпоинт есть в стеке.
+    Результат — свёрнутые стеки (формат flamegraph.pl / speedscope).
+    Одновременно снимается только один профиль.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _sample(self, thread_id: int, routes: Dict[object, str], seconds: float,
+                interval: float) -> Counter:
+        samples: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            samples[sample_stack(frame, routes)] += 1
+            del frame
+            time.sleep(interval)
+        return samples
+
+    async def profile(self, app, seconds: float, interval: float) -> Counter:
+        """Профиль потока, в котором запущен вызывающий loop; сам loop при этом не ждёт"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            return await asyncio.to_thread(
+                self._sample, threading.get_ident(), endpoint_routes(app), seconds, interval
+            )
+        finally:
+            self._lock.release()
+
+
+def collapsed(samples: Counter, route: Optional[str] = None, include_idle: bool = False) -> str:
+    """Строки "маршрут;кадр;...;кадр число" — корень флеймграфа разбит по маршрутам"""
+    lines = []
+    for (sample_route, stack), count in samples.most_common():
+        if route is not None and sample_route != route:
+            continue
+        if sample_route == "(idle)" and not include_idle:
+            continue
+        lines.append(f"{';'.join((sample_route,) + stack)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize(samples: Counter, top: int = 30) -> dict:
+    """Сэмплы по маршрутам и функции, на которых loop проводит больше всего времени"""
+    by_route: Counter = Counter()
+    self_time: Counter = Counter()
+    for (route, stack), count in samples.items():
+        by_route[route] += count
+        if route != "(idle)" and stack:
+            self_time[stack[-1]] += count
+    total = sum(samples.values())
+    return {
+        "samples": total,
+        "routes": dict(by_route.most_common()),
+        "top_functions": [{"function": name, "samples": count} for name, count in self_time.most_common(top)],
+    }
+
+
+loop_monitor = LoopMonitor(
+    interval=config.LOOP_LAG_INTERVAL_MS / 1000,
+    threshold=config.LOOP_STALL_THRESHOLD_MS / 1000,
+    max_events=config.LOOP_STALL_EVENTS,
+)
+profiler = SamplingProfiler()
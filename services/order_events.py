@@ -0,0 +1,182 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, List, Optional, Set, Tuple
+
+import config
+from models import Order
+from services.pubsub import broker
+from services.spatial_index import pending_orders_index
+
+ORDERS_CHANNEL = "orders"
+
+# Окно, в котором при переподключении к другому воркеру повторяем события по времени
+RESUME_SKEW_MS = 1000
+
+# id события: "<мс>-<процесс>-<номер>"; время в начале позволяет продолжить
+# поток на воркере, который не видел исходный id
+_ORIGIN = os.urandom(3).hex()
+_counter = itertools.count(1)
+
+
+def _new_event_id() -> str:
+    return f"{time.time_ns() // 1_000_000}-{_ORIGIN}-{next(_counter)}"
+
+
+def _event_ms(event_id: str) -> Optional[int]:
+    head = event_id.split("-", 1)[0]
+    return int(head) if head.isdigit() else None
+
+
+async def publish_order_event(event: str, order: Order) -> None:
+    """Событие по заказу для всех воркеров; ошибка брокера не ломает запрос"""
+    await publish_order_message({
+        "event": event,
+        "order_id": order.id,
+        "status": order.status,
+        "courier_id": order.courier_id,
+        "latitude": order.latitude,
+        "longitude": order.longitude,
+        "zone_id": order.zone_id,
+    })
+
+
+async def publish_order_message(message: dict) -> None:
+    message.setdefault("id", _new_event_id())
+    try:
+        await broker.publish(ORDERS_CHANNEL, message)
+    except Exception as e:
+        print(f"❌ Не удалось опубликовать событие {message.get('event')} заказа {message.get('order_id')}: {e}")
+
+
+def visible_to(message: dict, courier_id: Optional[int]) -> bool:
+    """
+    Админ (courier_id=None) видит всё. Курьер — свои заказы, новые заказы
+    и назначения (заказ ушёл из списка свободных).
+    """
+    if courier_id is None:
+        return True
+    return message.get("courier_id") in (None, courier_id) or message.get("event") == "order_assigned"
+
+
+class _Listener:
+    def __init__(self, courier_id: Optional[int], maxsize: int):
+        self.courier_id = courier_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+
+class OrderEventLog:
+    """
+    Последние события заказов в памяти воркера и живые подписчики.
+    Лог нужен для продолжения потока после переподключения по resume-токену
+    (id последнего полученного события). Отставший подписчик не тормозит
+    остальных: его очередь отключается, и он догоняет по логу.
+    """
+
+    def __init__(self, maxlen: int, listener_queue: int):
+        self._events: deque = deque(maxlen=maxlen)
+        self._listeners: Set[_Listener] = set()
+        self.listener_queue = listener_queue
+        self.overflows = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    @property
+    def listeners(self) -> int:
+        return len(self._listeners)
+
+    def append(self, message: dict) -> None:
+        if "id" not in message:
+            return
+        self._events.append(message)
+        for listener in list(self._listeners):
+            if not visible_to(message, listener.courier_id):
+                continue
+            try:
+                listener.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                listener.overflowed = True
+                self._listeners.discard(listener)
+                self.overflows += 1
+
+    def since(self, token: str, courier_id: Optional[int] = None) -> Tuple[List[dict], bool]:
+        """
+        События после token. Второй элемент — False, если продолжить нельзя
+        (токен старше лога или не разобран) и клиенту нужно перечитать состояние.
+        """
+        events = list(self._events)
+        for i in range(len(events) - 1, -1, -1):
+            if events[i]["id"] == token:
+                return [e for e in events[i + 1:] if visible_to(e, courier_id)], True
+
+        token_ms = _event_ms(token)
+        if token_ms is None or not events or token_ms < _event_ms(events[0]["id"]):
+            return [], False
+        # Токен выдал другой воркер: повторяем события с небольшим запасом по времени,
+        # дубликаты клиент отбрасывает по id
+        return [
+            e for e in events
+            if e["id"] != token and _event_ms(e["id"]) >= token_ms - RESUME_SKEW_MS
+            and visible_to(e, courier_id)
+        ], True
+
+    async def follow(self, resume: Optional[str], courier_id: Optional[int],
+                     heartbeat: Optional[float] = None) -> AsyncIterator[Optional[dict]]:
+        """
+        Поток событий для одного клиента. Отдаёт dict события, {"event": "reset"},
+        если пропущенное не восстановить, и None раз в heartbeat секунд тишины.
+        """
+        last_id = resume
+        while True:
+            # Подписываемся до чтения лога, чтобы не потерять события между ними
+            listener = _Listener(courier_id, self.listener_queue)
+            self._listeners.add(listener)
+            try:
+                sent: Set[str] = set()
+                if last_id:
+                    backlog, complete = self.since(last_id, courier_id)
+                    if not complete:
+                        yield {"event": "reset"}
+                    for message in backlog:
+                        sent.add(message["id"])
+                        last_id = message["id"]
+                        yield message
+
+                while not (listener.overflowed and listener.queue.empty()):
+                    try:
+                        message = await asyncio.wait_for(listener.queue.get(), timeout=heartbeat)
+                    except asyncio.TimeoutError:
+                        yield None
+                        continue
+                    if message["id"] in sent:
+                        continue
+                    last_id = message["id"]
+                    yield message
+            finally:
+                self._listeners.discard(listener)
+
+
+order_event_log = OrderEventLog(
+    maxlen=config.ORDER_EVENTS_BUFFER,
+    listener_queue=config.ORDER_EVENTS_LISTENER_QUEUE,
+)
+
+
+def _sync_pending_index(message: dict) -> None:
+    # Индекс свободных заказов в каждом воркере догоняет изменения из других
+    if message.get("event") == "orders_imported":
+        pending_orders_index.invalidate()
+    elif message.get("event") != "order_deleted" and message.get("status") == "pending":
+        pending_orders_index.add(message["order_id"], message.get("latitude"), message.get("longitude"),
+                                 message.get("zone_id"))
+    else:
+        pending_orders_index.discard(message["order_id"])
+
+
+def register() -> None:
+    broker.subscribe(ORDERS_CHANNEL, _sync_pending_index)
+    broker.subscribe(ORDERS_CHANNEL, order_event_log.append)
@@ -0,0 +1,71 @@
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Order
+from services.responses import rows_as_dicts
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, order_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
+
+def filter_orders(stmt: Select, status: Optional[str] = None, courier_id: Optional[int] = None,
+                  created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                  zone_id: Optional[int] = None) -> Select:
+    if status is not None:
+        stmt = stmt.where(Order.status == status)
+    if courier_id is not None:
+        stmt = stmt.where(Order.courier_id == courier_id)
+    if zone_id is not None:
+        stmt = stmt.where(Order.zone_id == zone_id)
+    if created_from is not None:
+        stmt = stmt.where(Order.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(Order.created_at < created_to)
+    return stmt
+
+
+async def paginate_orders(session: AsyncSession, stmt: Select, cursor: Optional[str],
+                          limit: int, descending: bool = True) -> Tuple[List[dict], Optional[str]]:
+    """
+    Keyset-пагинация по (created_at, id): без OFFSET, каждая страница — это
+    диапазонное чтение по индексу. stmt выбирает колонки заказа (включая id и created_at);
+    возвращает строки-словари и курсор следующей страницы (он уходит в заголовке,
+    тело ответа остаётся списком, как раньше).
+    """
+    key = tuple_(Order.created_at, Order.id)
+    # Строки без created_at не встают в порядок ключа и не могут стать курсором
+    stmt = stmt.where(Order.created_at.is_not(None))
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        stmt = stmt.where(key < (created_at, order_id) if descending else key > (created_at, order_id))
+    if descending:
+        stmt = stmt.order_by(Order.created_at.desc(), Order.id.desc())
+    else:
+        stmt = stmt.order_by(Order.created_at, Order.id)
+
+    result = await session.execute(stmt.limit(limit + 1))
+    rows = rows_as_dicts(result)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return rows, next_cursor
@@ -0,0 +1,176 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, or_, update
+
+import config
+from database import AsyncSessionLocal
+from models import Courier
+from services.position_history import PositionRecord, position_history
+from services.zones import zone_index
+
+_couriers = Courier.__table__
+
+# Один UPDATE на всю пачку через executemany; более старая точка
+# (от другого воркера или запоздавшая) не перетирает свежую
+_update_positions = (
+    update(_couriers)
+    .where(
+        _couriers.c.id == bindparam("b_id"),
+        or_(_couriers.c.last_active.is_(None), _couriers.c.last_active <= bindparam("b_ts")),
+    )
+    .values(
+        latitude=bindparam("b_lat"),
+        longitude=bindparam("b_lon"),
+        last_active=bindparam("b_ts"),
+        zone_id=bindparam("b_zone"),
+    )
+)
+
+
+class PositionBuffer:
+    """
+    Буфер последних позиций курьеров.
+    WebSocket только кладёт позицию в словарь (дубликаты по курьеру схлопываются),
+    фоновая задача раз в flush_interval_ms или при накоплении max_batch курьеров
+    пишет всё одной пачкой. Все точки без схлопывания копятся для истории
+    и уходят в той же транзакции.
+    Точки могут приходить не по порядку (офлайн-буфер телефона): текущей
+    позицией становится только самая свежая по recorded_at, повторы
+    отсекает ON CONFLICT в истории.
+    """
+
+    def __init__(self, flush_interval_ms: int, max_batch: int,
+                 history_enabled: bool = True, max_history: int = 200_000):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.history_enabled = history_enabled
+        self.max_history = max_history
+        self._latest: Dict[int, Tuple[float, float, datetime]] = {}
+        # Время самой свежей принятой точки по курьеру, в том числе уже записанной
+        self._newest: Dict[int, datetime] = {}
+        self._history: List[PositionRecord] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Статистика
+        self.flushes = 0
+        self.flushed_positions = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.history_written = 0
+        self.history_dropped = 0
+        self.last_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+    def put(self, courier_id: int, lat: float, lon: float,
+            recorded_at: Optional[datetime] = None) -> bool:
+        """Возвращает True, если точка стала текущей позицией курьера"""
+        received_at = datetime.utcnow()
+        recorded_at = recorded_at or received_at
+        # Свежесть текущей позиции сравнивается по времени не позже приёма: иначе
+        # одна пачка с телефона со спешащими часами записала бы newest и last_active
+        # в будущее, и все следующие точки считались бы устаревшими. В историю
+        # точка попадает с временем устройства.
+        current_at = min(recorded_at, received_at)
+        newest = self._newest.get(courier_id)
+        is_current = newest is None or current_at >= newest
+        if is_current:
+            if courier_id in self._latest:
+                self.coalesced += 1
+            self._latest[courier_id] = (lat, lon, current_at)
+            self._newest[courier_id] = current_at
+        else:
+            self.stale += 1
+        if self.history_enabled:
+            self._history.append((courier_id, recorded_at, lat, lon))
+        if len(self._latest) >= self.max_batch or len(self._history) >= self.max_batch * 10:
+            self._wakeup.set()
+        return is_current
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._latest and not self._history:
+                return 0
+            batch, self._latest = self._latest, {}
+            history, self._history = self._history, []
+            rows: List[dict] = []
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as session:
+                    if batch:
+                        # Зона курьера обновляется вместе с позицией, одной векторной проверкой на пачку
+                        await zone_index.ensure_loaded(session)
+                        zones = zone_index.lookup_many(
+                            [lat for lat, _, _ in batch.values()], [lon for _, lon, _ in batch.values()]
+                        )
+                        rows = [
+                            {"b_id": courier_id, "b_lat": lat, "b_lon": lon, "b_ts": ts, "b_zone": zone_id}
+                            for (courier_id, (lat, lon, ts)), zone_id in zip(batch.items(), zones)
+                        ]
+                        await session.execute(_update_positions, rows)
+                    if history:
+                        await position_history.write(session, history)
+                    await session.commit()
+            except BaseException:
+                # Возвращаем позиции в буфер, если их ещё не перезаписали более свежими;
+                # BaseException — чтобы пачку не потеряла и отмена посреди записи
+                for courier_id, value in batch.items():
+                    self._latest.setdefault(courier_id, value)
+                self._requeue_history(history)
+                position_history.forget_partitions()
+                raise
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed_positions += len(rows)
+            self.history_written += len(history)
+            return len(rows)
+
+    def _requeue_history(self, history: List[PositionRecord]) -> None:
+        # Пока БД недоступна, храним не больше max_history точек — старые отбрасываем
+        self._history = history + self._history
+        overflow = len(self._history) - self.max_history
+        if overflow > 0:
+            del self._history[:overflow]
+            self.history_dropped += overflow
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Ошибка записи позиций курьеров: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Цикл не отменяется, а доходит до конца текущей записи и выходит сам
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        # Финальная запись при остановке
+        await self.flush()
+
+
+position_buffer = PositionBuffer(
+    flush_interval_ms=config.POSITION_FLUSH_INTERVAL_MS,
+    max_batch=config.POSITION_FLUSH_MAX_BATCH,
+    history_enabled=config.POSITION_HISTORY_ENABLED,
+    max_history=config.POSITION_HISTORY_MAX_PENDING,
+)
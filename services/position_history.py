@@ -0,0 +1,88 @@
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from models import CourierPosition
+
+TABLE = CourierPosition.__tablename__
+STAGE_TABLE = f"{TABLE}_stage"
+COLUMNS = ["courier_id", "recorded_at", "latitude", "longitude"]
+
+# (courier_id, recorded_at, latitude, longitude)
+PositionRecord = Tuple[int, datetime, float, float]
+
+
+def partition_name(day: date) -> str:
+    return f"{TABLE}_{day:%Y%m%d}"
+
+
+class PositionHistoryStore:
+    """
+    Запись истории точек пачками: COPY во временную таблицу, затем
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING в секционированную таблицу.
+    COPY даёт скорость, а ON CONFLICT — идемпотентность: повторно присланные
+    точки (тот же курьер и то же время) просто пропускаются.
+    """
+
+    def __init__(self, retention_days: int):
+        self.retention_days = retention_days
+        self._known_days: Set[date] = set()
+        self._maintained_on: date | None = None
+
+    def forget_partitions(self) -> None:
+        """После отката транзакции созданные в ней секции могли не сохраниться"""
+        self._known_days.clear()
+        self._maintained_on = None
+
+    async def _ensure_partitions(self, session: AsyncSession, days: Iterable[date]) -> None:
+        for day in sorted(set(days) - self._known_days):
+            await session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            ))
+            self._known_days.add(day)
+
+    async def _drop_expired_partitions(self, session: AsyncSession) -> None:
+        today = datetime.utcnow().date()
+        if self._maintained_on == today or self.retention_days <= 0:
+            return
+        cutoff = partition_name(today - timedelta(days=self.retention_days))
+        result = await session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :parent"
+        ), {"parent": TABLE})
+        for (name,) in result:
+            # Имена секций сортируются как даты: courier_positions_YYYYMMDD
+            if name < cutoff:
+                await session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        self._known_days = {d for d in self._known_days if partition_name(d) >= cutoff}
+        self._maintained_on = today
+
+    async def write(self, session: AsyncSession, records: List[PositionRecord]) -> None:
+        """Пишет точки в транзакции переданной сессии; коммит — за вызывающим"""
+        if not records:
+            return
+        await self._drop_expired_partitions(session)
+        await self._ensure_partitions(session, (r[1].date() for r in records))
+
+        await session.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} "
+            f"(LIKE {TABLE} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        ))
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            STAGE_TABLE, records=records, columns=COLUMNS
+        )
+        await session.execute(text(
+            f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) "
+            f"SELECT {', '.join(COLUMNS)} FROM {STAGE_TABLE} ON CONFLICT DO NOTHING"
+        ))
+
+
+position_history = PositionHistoryStore(retention_days=config.POSITION_HISTORY_RETENTION_DAYS)
@@ -0,0 +1,147 @@
+import asyncio
+import inspect
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+import config
+
+Handler = Callable[[dict], Union[None, Awaitable[None]]]
+
+# Ограничение Postgres на размер payload в NOTIFY — 8000 байт
+MAX_PAYLOAD_BYTES = 7900
+
+
+class Broker:
+    """
+    Pub/sub для событий трекинга и заказов.
+    Подписчики получают и собственные сообщения процесса — так у событий
+    один путь доставки при любом бэкенде.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def unsubscribe(self, channel: str, handler: Handler) -> None:
+        handlers = self._handlers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    async def publish(self, channel: str, message: dict) -> None:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def _dispatch(self, channel: str, message: dict) -> None:
+        for handler in list(self._handlers.get(channel, [])):
+            try:
+                result = handler(message)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                print(f"❌ Ошибка обработчика канала {channel}: {e}")
+
+
+class InProcessBroker(Broker):
+    """Доставка внутри одного процесса (один воркер uvicorn)"""
+
+    async def publish(self, channel: str, message: dict) -> None:
+        self._dispatch(channel, message)
+
+
+class PostgresBroker(Broker):
+    """
+    Доставка между воркерами и контейнерами через LISTEN/NOTIFY.
+    Слушает отдельное asyncpg-соединение, при обрыве переподключается.
+    """
+
+    def __init__(self, dsn: str, prefix: str = "courier_"):
+        super().__init__()
+        self.dsn = dsn
+        self.prefix = prefix
+        self._listen_conn = None
+        self._publish_conn = None
+        self._publish_lock = asyncio.Lock()
+        self._listening: set = set()
+        self._watchdog: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        super().subscribe(channel, handler)
+        if self._listen_conn is not None and channel not in self._listening:
+            asyncio.ensure_future(self._listen(channel))
+
+    async def _connect(self):
+        import asyncpg
+        return await asyncpg.connect(self.dsn)
+
+    async def _listen(self, channel: str) -> None:
+        await self._listen_conn.add_listener(self.prefix + channel, self._on_notify)
+        self._listening.add(channel)
+
+    def _on_notify(self, connection, pid, pg_channel: str, payload: str) -> None:
+        channel = pg_channel[len(self.prefix):]
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        self._dispatch(channel, message)
+
+    async def _open_listener(self) -> None:
+        self._listening.clear()
+        self._listen_conn = await self._connect()
+        for channel in list(self._handlers):
+            await self._listen(channel)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(5)
+            if self._listen_conn is not None and not self._listen_conn.is_closed():
+                continue
+            try:
+                await self._open_listener()
+                print("✅ Переподключились к LISTEN/NOTIFY")
+            except Exception as e:
+                print(f"❌ Нет соединения для LISTEN/NOTIFY: {e}")
+
+    async def start(self) -> None:
+        await self._open_listener()
+        self._watchdog = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        for conn in (self._listen_conn, self._publish_conn):
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        self._listen_conn = None
+        self._publish_conn = None
+
+    async def publish(self, channel: str, message: dict) -> None:
+        payload = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+            raise ValueError(f"Сообщение для канала {channel} больше {MAX_PAYLOAD_BYTES} байт")
+        async with self._publish_lock:
+            if self._publish_conn is None or self._publish_conn.is_closed():
+                self._publish_conn = await self._connect()
+            await self._publish_conn.execute(
+                "SELECT pg_notify($1, $2)", self.prefix + channel, payload
+            )
+
+
+def create_broker() -> Broker:
+    if config.PUBSUB_BACKEND == "postgres":
+        from database import DATABASE_URL
+        return PostgresBroker(DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://"))
+    if config.PUBSUB_BACKEND == "memory":
+        return InProcessBroker()
+    raise ValueError(f"Неизвестный PUBSUB_BACKEND: {config.PUBSUB_BACKEND}")
+
+
+broker = create_broker()
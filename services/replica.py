@@ -0,0 +1,165 @@
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+import database
+
+# Текущая позиция WAL основной БД — с ней сравнивается реплика
+PRIMARY_LSN_SQL = text("SELECT pg_current_wal_lsn()::text")
+
+# Отставание реплики в секундах, NULL — неизвестно (такая реплика не используется).
+# Реплика не отстаёт, если применила WAL до позиции, которую основная БД отдала
+# перед проверкой. Если основную опросить не удалось — только при живом потоке
+# репликации (pg_stat_wal_receiver), иначе реплика, потерявшая связь, применила
+# всё полученное и казалась бы актуальной, всё больше отставая.
+# Обычная база (не в режиме recovery) считается репликой без отставания — так её
+# можно подставить вместо реплики в локальной разработке.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN CAST(:primary_lsn AS text) IS NOT NULL THEN CASE
+            WHEN pg_last_wal_replay_lsn() >= CAST(CAST(:primary_lsn AS text) AS pg_lsn) THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+    END
+""")
+
+
+class ReplicaRouter:
+    """
+    Выбор между репликой и основной БД для запросов только на чтение.
+    Фоновая задача периодически проверяет реплику и её отставание; чтение идёт
+    с реплики, только если она доступна и отстаёт не больше max_lag секунд.
+    Если соединение с репликой не удалось получить в момент запроса, реплика
+    помечается недоступной до следующей проверки и запрос уходит на основную.
+    """
+
+    def __init__(self, max_lag: float, check_interval: float):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Статистика
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+
+    @property
+    def configured(self) -> bool:
+        return database.ReplicaSessionLocal is not None
+
+    def usable(self) -> bool:
+        return (
+            self.configured and self.healthy
+            and self.lag_seconds is not None and self.lag_seconds <= self.max_lag
+        )
+
+    def mark_down(self, error: Exception) -> None:
+        if self.healthy:
+            print(f"❌ Реплика недоступна, чтение переключено на основную БД: {error!r}")
+        self.healthy = False
+        self.last_error = repr(error)
+
+    async def _primary_lsn(self) -> Optional[str]:
+        try:
+            async with database.AsyncSessionLocal() as session:
+                return await session.scalar(PRIMARY_LSN_SQL)
+        except Exception as e:
+            print(f"❌ Не удалось получить позицию WAL основной БД: {e!r}")
+            return None
+
+    async def check(self) -> None:
+        try:
+            async with database.ReplicaSessionLocal() as session:
+                if session.bind.dialect.name == "postgresql":
+                    primary_lsn = await self._primary_lsn()
+                    lag = await session.scalar(REPLICA_LAG_SQL, {"primary_lsn": primary_lsn})
+                else:
+                    await session.execute(text("SELECT 1"))
+                    lag = 0
+        except Exception as e:
+            self.mark_down(e)
+        else:
+            if not self.healthy:
+                print("✅ Реплика доступна, чтение идёт с неё")
+            if lag is None and self.lag_seconds is not None:
+                print("❌ Отставание реплики неизвестно, чтение переключено на основную БД")
+            self.healthy = True
+            self.lag_seconds = None if lag is None else float(lag)
+            self.last_error = None
+        self.last_check = time.time()
+
+    async def open_session(self) -> AsyncSession:
+        """Сессия для чтения: с реплики, если можно, иначе с основной БД. Закрывает вызывающий."""
+        if self.usable():
+            session = database.ReplicaSessionLocal()
+            try:
+                # Соединение берём сразу: если реплика упала, ещё можно уйти на основную
+                await session.connection()
+            except Exception as e:
+                await session.close()
+                self.mark_down(e)
+                self.fallbacks += 1
+            else:
+                self.replica_reads += 1
+                return session
+        self.primary_reads += 1
+        return database.AsyncSessionLocal()
+
+    def status(self) -> dict:
+        return {
+            "configured": self.configured,
+            "healthy": self.healthy,
+            "in_use": self.usable(),
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    async def start(self) -> None:
+        if not self.configured or self._task is not None:
+            return
+        await self.check()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+replica_router = ReplicaRouter(
+    max_lag=config.REPLICA_MAX_LAG_SECONDS,
+    check_interval=config.REPLICA_CHECK_INTERVAL_SECONDS,
+)
+
+
+# Dependency для эндпоинтов только на чтение (данные могут отставать на REPLICA_MAX_LAG_SECONDS)
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    async with await replica_router.open_session() as session:
+        yield session
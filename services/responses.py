@@ -0,0 +1,31 @@
+from typing import Iterable, List, Optional
+
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.engine import Result
+
+from models import Order
+from schemas.order import OrderRead
+
+# Колонки заказа, которые отдаёт OrderRead — читаем только их, без ORM-сущностей
+ORDER_READ_COLUMNS = [getattr(Order, name) for name in OrderRead.model_fields]
+
+# Курсор следующей страницы списка; без заголовка — страница последняя
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Общий класс ответа горячих эндпоинтов: orjson сразу в байты.
+    Возврат готового Response пропускает валидацию response_model,
+    поэтому строки не прогоняются через Pydantic.
+    """
+
+
+def rows_as_dicts(result: Result) -> List[dict]:
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def json_rows(rows: Iterable[dict], next_cursor: Optional[str] = None) -> FastJSONResponse:
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return FastJSONResponse(content=list(rows), headers=headers)
@@ -0,0 +1,327 @@
+"""
+Локальный граф дорог для маршрутов без GraphHopper (офлайн, тесты).
+
+Граф собирается из выгрузки OSM (XML, можно .gz) и хранится компактно —
+массивы NumPy в формате CSR: indptr / targets / seconds / meters, плюс
+координаты узлов. Собранный граф сохраняется в .npz и грузится без разбора XML:
+
+    python -m services.road_graph city.osm graph.npz
+
+Кратчайшие пути — Dijkstra (от одной точки до многих) и A* (одна пара),
+вес ребра — время проезда. Привязка точки к ближайшему узлу — через
+отсортированные ключи ячеек сетки и searchsorted.
+"""
+import gzip
+import heapq
+import math
+import sys
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.geo import EARTH_RADIUS_KM, haversine, haversine_one_to_many
+
+# Скорости по умолчанию (км/ч) для профиля car; остальные типы дорог пропускаются
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 90, "motorway_link": 45,
+    "trunk": 70, "trunk_link": 40,
+    "primary": 60, "primary_link": 35,
+    "secondary": 50, "secondary_link": 30,
+    "tertiary": 40, "tertiary_link": 25,
+    "unclassified": 30, "residential": 25,
+    "living_street": 10, "service": 15, "road": 25,
+}
+_ONEWAY_VALUES = {"yes", "1", "true"}
+
+# Размер ячейки для привязки точек к узлам и сколько колец ячеек просматривать
+SNAP_CELL_DEG = 0.005
+SNAP_MAX_RINGS = 10
+
+
+def _open(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _speed(tags: Dict[str, str]) -> Optional[float]:
+    default = HIGHWAY_SPEEDS_KMH.get(tags.get("highway", ""))
+    if default is None:
+        return None
+    maxspeed = tags.get("maxspeed", "").split(" ")[0]
+    try:
+        # Реальная скорость в городе ниже знака — берём меньшее из двух
+        return min(default, float(maxspeed)) if maxspeed else default
+    except ValueError:
+        return default
+
+
+class RoadGraph:
+    """Ориентированный граф дорог в массивах; узлы пронумерованы 0..n-1"""
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, indptr: np.ndarray,
+                 targets: np.ndarray, seconds: np.ndarray, meters: np.ndarray):
+        self.lats = np.ascontiguousarray(lats, dtype=np.float64)
+        self.lons = np.ascontiguousarray(lons, dtype=np.float64)
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+        self.targets = np.ascontiguousarray(targets, dtype=np.int32)
+        self.seconds = np.ascontiguousarray(seconds, dtype=np.float32)
+        self.meters = np.ascontiguousarray(meters, dtype=np.float32)
+        # Самое быстрое ребро — для допустимой эвристики A*
+        speeds = self.meters / np.maximum(self.seconds, 1e-6)
+        self.max_speed_mps = float(speeds.max()) if len(speeds) else 1.0
+
+        # Узлы, отсортированные по ячейке сетки, — для привязки точек
+        keys = self._cell_keys(self.lats, self.lons)
+        self._snap_order = np.argsort(keys, kind="stable").astype(np.int32)
+        self._snap_keys = keys[self._snap_order]
+        self._lists = None
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @property
+    def edges(self) -> int:
+        return len(self.targets)
+
+    # --- сборка и хранение ---
+
+    @classmethod
+    def from_edges(cls, lats: Sequence[float], lons: Sequence[float],
+                   edges: Iterable[Tuple[int, int, float]]) -> "RoadGraph":
+        """edges — (откуда, куда, скорость км/ч); длины считаются по координатам"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        edge_arr = np.array(list(edges), dtype=np.float64).reshape(-1, 3)
+        src = edge_arr[:, 0].astype(np.int64)
+        dst = edge_arr[:, 1].astype(np.int64)
+        meters = haversine(lats[src], lons[src], lats[dst], lons[dst]) * 1000
+        seconds = meters / (edge_arr[:, 2] / 3.6)
+
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(len(lats) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(lats)), out=indptr[1:])
+        return cls(lats, lons, indptr, dst[order], seconds[order], meters[order])
+
+    @classmethod
+    def from_osm(cls, path: str) -> "RoadGraph":
+        """Граф из OSM XML: дороги из HIGHWAY_SPEEDS_KMH, с учётом oneway"""
+        coords: Dict[int, Tuple[float, float]] = {}
+        ways: List[Tuple[List[int], float, int]] = []  # узлы, скорость, направление
+        with _open(path) as f:
+            for _, elem in ET.iterparse(f, events=("end",)):
+                if elem.tag == "node":
+                    coords[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+                elif elem.tag == "way":
+                    tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                    speed = _speed(tags)
+                    if speed is not None:
+                        refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                        oneway = tags.get("oneway", "")
+                        if oneway == "-1":
+                            direction = -1
+                        elif oneway in _ONEWAY_VALUES or tags.get("junction") == "roundabout":
+                            direction = 1
+                        else:
+                            direction = 0
+                        ways.append((refs, speed, direction))
+                if elem.tag in ("node", "way", "relation"):
+                    elem.clear()
+
+        # Оставляем только узлы дорог и нумеруем их подряд
+        index: Dict[int, int] = {}
+        lats: List[float] = []
+        lons: List[float] = []
+        edges: List[Tuple[int, int, float]] = []
+        for refs, speed, direction in ways:
+            path_nodes = []
+            for ref in refs:
+                if ref not in coords:
+                    continue  # узел за границей выгрузки
+                node = index.get(ref)
+                if node is None:
+                    node = index[ref] = len(lats)
+                    lat, lon = coords[ref]
+                    lats.append(lat)
+                    lons.append(lon)
+                path_nodes.append(node)
+            for a, b in zip(path_nodes, path_nodes[1:]):
+                if direction >= 0:
+                    edges.append((a, b, speed))
+                if direction <= 0:
+                    edges.append((b, a, speed))
+        return cls.from_edges(lats, lons, edges)
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, lats=self.lats, lons=self.lons, indptr=self.indptr,
+                            targets=self.targets, seconds=self.seconds, meters=self.meters)
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        """Граф из .npz (собранного save) или напрямую из .osm / .osm.gz"""
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                return cls(data["lats"], data["lons"], data["indptr"],
+                           data["targets"], data["seconds"], data["meters"])
+        return cls.from_osm(path)
+
+    # --- привязка точек ---
+
+    @staticmethod
+    def _cell_keys(lats, lons) -> np.ndarray:
+        i = np.floor(np.asarray(lats) / SNAP_CELL_DEG).astype(np.int64)
+        j = np.floor(np.asarray(lons) / SNAP_CELL_DEG).astype(np.int64)
+        return (i << 32) + (j & 0xFFFFFFFF)
+
+    def _cell_nodes(self, i: int, j: int) -> np.ndarray:
+        key = (i << 32) + (j & 0xFFFFFFFF)
+        lo = np.searchsorted(self._snap_keys, key, side="left")
+        hi = np.searchsorted(self._snap_keys, key, side="right")
+        return self._snap_order[lo:hi]
+
+    def snap(self, lat: float, lon: float) -> Tuple[int, float]:
+        """Ближайший узел и расстояние до него (м); (-1, inf), если рядом дорог нет"""
+        ci = int(math.floor(lat / SNAP_CELL_DEG))
+        cj = int(math.floor(lon / SNAP_CELL_DEG))
+        best_node, best_m = -1, math.inf
+        found_ring = None
+        for ring in range(SNAP_MAX_RINGS + 1):
+            cells = [
+                (ci + di, cj + dj)
+                for di in range(-ring, ring + 1)
+                for dj in range(-ring, ring + 1)
+                if max(abs(di), abs(dj)) == ring
+            ]
+            nodes = np.concatenate([self._cell_nodes(i, j) for i, j in cells])
+            if len(nodes):
+                dists = haversine_one_to_many(lat, lon, self.lats[nodes], self.lons[nodes]) * 1000
+                k = int(dists.argmin())
+                if dists[k] < best_m:
+                    best_node, best_m = int(nodes[k]), float(dists[k])
+                if found_ring is None:
+                    found_ring = ring
+            # Узел из соседнего кольца может оказаться ближе найденного — смотрим ещё одно
+            if found_ring is not None and ring > found_ring:
+                break
+        return best_node, best_m
+
+    # --- кратчайшие пути ---
+
+    def _adjacency(self):
+        # Обход в чистом Python быстрее по спискам, чем по элементам массивов NumPy
+        if self._lists is None:
+            self._lists = (self.indptr.tolist(), self.targets.tolist(),
+                           self.seconds.tolist(), self.meters.tolist())
+        return self._lists
+
+    def one_to_many(self, source: int, targets: Iterable[int],
+                    max_seconds: float = math.inf) -> Dict[int, Tuple[float, float]]:
+        """Dijkstra от source до всех targets: узел -> (секунды, метры); недостижимых нет в ответе"""
+        indptr, adj, weights, lengths = self._adjacency()
+        remaining = set(targets)
+        found: Dict[int, Tuple[float, float]] = {}
+        best = {source: 0.0}
+        meters = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = set()
+        while heap and remaining:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if cost > max_seconds:
+                break
+            settled.add(node)
+            if node in remaining:
+                remaining.discard(node)
+                found[node] = (cost, meters[node])
+            for e in range(indptr[node], indptr[node + 1]):
+                nxt = adj[e]
+                new_cost = cost + weights[e]
+                if new_cost < best.get(nxt, math.inf):
+                    best[nxt] = new_cost
+                    meters[nxt] = meters[node] + lengths[e]
+                    heapq.heappush(heap, (new_cost, nxt))
+        return found
+
+    def shortest(self, source: int, target: int) -> Optional[Tuple[float, float]]:
+        """A* для одной пары: (секунды, метры) или None, если пути нет"""
+        if source == target:
+            return 0.0, 0.0
+        indptr, adj, weights, lengths = self._adjacency()
+        lat_t, lon_t = math.radians(self.lats[target]), math.radians(self.lons[target])
+        cos_t = math.cos(lat_t)
+        lats, lons = self.lats, self.lons
+        inv_speed = 1.0 / self.max_speed_mps
+
+        def heuristic(node: int) -> float:
+            lat, lon = math.radians(lats[node]), math.radians(lons[node])
+            a = math.sin((lat_t - lat) / 2) ** 2 + math.cos(lat) * cos_t * math.sin((lon_t - lon) / 2) ** 2
+            return 2 * EARTH_RADIUS_KM * 1000 * math.asin(min(1.0, math.sqrt(a))) * inv_speed
+
+        best = {source: 0.0}
+        meters = {source: 0.0}
+        heap = [(heuristic(source), 0.0, source)]
+        settled = set()
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                return cost, meters[node]
+            if node in settled:
+                continue
+            settled.add(node)
+            for e in range(indptr[node], indptr[node + 1]):
+                nxt = adj[e]
+                new_cost = cost + weights[e]
+                if new_cost < best.get(nxt, math.inf):
+                    best[nxt] = new_cost
+                    meters[nxt] = meters[node] + lengths[e]
+                    heapq.heappush(heap, (new_cost + heuristic(nxt), new_cost, nxt))
+        return None
+
+    def route_pairs(self, pairs: Sequence[Tuple[float, float, float, float]],
+                    access_speed_kmh: float = 15.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Время (с) и длина (м) для пар точек (lat1, lon1, lat2, lon2).
+        Путь от точки до ближайшего узла считается по прямой со скоростью access_speed_kmh.
+        Пары с общей начальной точкой считаются одним проходом Dijkstra.
+        """
+        seconds = np.full(len(pairs), np.inf)
+        meters = np.full(len(pairs), np.inf)
+        access_mps = access_speed_kmh / 3.6
+        snapped: Dict[Tuple[float, float], Tuple[int, float]] = {}
+
+        def snap(lat: float, lon: float) -> Tuple[int, float]:
+            key = (lat, lon)
+            if key not in snapped:
+                snapped[key] = self.snap(lat, lon)
+            return snapped[key]
+
+        by_source: Dict[int, List[Tuple[int, int, float]]] = {}
+        for k, (lat1, lon1, lat2, lon2) in enumerate(pairs):
+            src, src_m = snap(lat1, lon1)
+            dst, dst_m = snap(lat2, lon2)
+            if src < 0 or dst < 0:
+                continue
+            by_source.setdefault(src, []).append((k, dst, src_m + dst_m))
+
+        for src, items in by_source.items():
+            if len(items) == 1:
+                k, dst, access_m = items[0]
+                result = self.shortest(src, dst)
+                found = {dst: result} if result is not None else {}
+            else:
+                found = self.one_to_many(src, {dst for _, dst, _ in items})
+            for k, dst, access_m in items:
+                if dst in found:
+                    path_s, path_m = found[dst]
+                    seconds[k] = path_s + access_m / access_mps
+                    meters[k] = path_m + access_m
+        return seconds, meters
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Использование: python -m services.road_graph city.osm[.gz] graph.npz")
+        sys.exit(1)
+    graph = RoadGraph.from_osm(sys.argv[1])
+    graph.save(sys.argv[2])
+    print(f"✅ Граф сохранён: {len(graph)} узлов, {graph.edges} рёбер")
@@ -0,0 +1,278 @@
+"""
+Время в пути и длина маршрута между точками.
+
+Источники по очереди: GraphHopper (один общий httpx.AsyncClient с пулом
+соединений; /matrix пачками или параллельные /route), локальный граф дорог
+(services/road_graph.py) и, если нет ни того ни другого, оценка по прямой
+с коэффициентом извилистости. Ответы кэшируются по ячейкам сетки
+ROUTING_SNAP_DEG: точки в одной ячейке считаются одной точкой, поэтому
+повторные запросы для соседних заказов и курьеров не уходят в сеть.
+Оценки по прямой кэшируются ненадолго, чтобы их заменили настоящие маршруты.
+"""
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+import config
+from services.cache import TTLCache
+from services.geo import haversine_one_to_many
+from services.metrics import ROUTING_LOOKUPS, ROUTING_REMOTE_SECONDS
+from services.road_graph import RoadGraph
+
+Pair = Tuple[float, float, float, float]  # lat1, lon1, lat2, lon2
+Leg = Tuple[float, float]  # секунды, метры
+
+# Сколько живёт в кэше оценка по прямой
+ESTIMATE_TTL_SECONDS = 60
+
+
+class RoutingService:
+    """
+    Общий на процесс клиент маршрутов. После ошибки сети или 5xx GraphHopper
+    не опрашивается retry_after секунд — запросы сразу идут в запасные источники.
+    """
+
+    def __init__(self, base_url: str, profile: str, timeout: float, max_connections: int,
+                 use_matrix: bool, matrix_max_points: int, retry_after: float,
+                 cache_size: int, cache_ttl: float, snap_deg: float, graph_path: str,
+                 fallback_speed_kmh: float, detour_factor: float):
+        self.base_url = base_url.rstrip("/")
+        self.profile = profile
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.use_matrix = use_matrix
+        self.matrix_max_points = matrix_max_points
+        self.retry_after = retry_after
+        self.snap_deg = snap_deg
+        self.graph_path = graph_path
+        self.fallback_mps = fallback_speed_kmh / 3.6
+        self.detour_factor = detour_factor
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.graph: Optional[RoadGraph] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self._down_until = 0.0
+        self.last_error: Optional[str] = None
+
+        # Статистика
+        self.counts = {"cache": 0, "graphhopper": 0, "local": 0, "estimate": 0}
+        self.remote_requests = 0
+        self.remote_errors = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.base_url)
+
+    def usable(self) -> bool:
+        return self._client is not None and time.monotonic() >= self._down_until
+
+    def mark_down(self, error: Exception) -> None:
+        self.remote_errors += 1
+        self.last_error = f"{error.__class__.__name__}: {error}"
+        self._down_until = time.monotonic() + self.retry_after
+        print(f"❌ GraphHopper недоступен, {self.retry_after:g} с считаем без него: {self.last_error}")
+
+    async def start(self) -> None:
+        if self.configured and self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        if self.graph_path and self.graph is None:
+            try:
+                self.graph = await asyncio.to_thread(RoadGraph.load, self.graph_path)
+                print(f"✅ Граф дорог загружен: {len(self.graph)} узлов, {self.graph.edges} рёбер")
+            except (OSError, ValueError) as e:
+                print(f"❌ Не удалось загрузить граф дорог {self.graph_path}: {e}")
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _key(self, pair: Pair) -> Tuple[int, int, int, int]:
+        s = self.snap_deg
+        return tuple(int(math.floor(v / s)) for v in pair)
+
+    # --- источники ---
+
+    async def _route(self, pair: Pair) -> Optional[Leg]:
+        lat1, lon1, lat2, lon2 = pair
+        async with self._semaphore:
+            started = time.perf_counter()
+            response = await self._client.get("/route", params={
+                "point": [f"{lat1},{lon1}", f"{lat2},{lon2}"],
+                "profile": self.profile,
+                "calc_points": "false",
+                "instructions": "false",
+            })
+            ROUTING_REMOTE_SECONDS.observe(time.perf_counter() - started, "route")
+        self.remote_requests += 1
+        # 400 — точку не удалось привязать к дороге или маршрута нет: это ответ, а не сбой
+        if response.status_code == 400:
+            return None
+        response.raise_for_status()
+        path = response.json()["paths"][0]
+        return path["time"] / 1000, path["distance"]
+
+    async def _matrix(self, pairs: Sequence[Pair]) -> List[Optional[Leg]]:
+        """
+        Пары группируются по началу: на каждую пачку из matrix_max_points начал
+        запрашиваются только их концы, а не все концы сразу
+        """
+        by_origin: Dict[Tuple[float, float], List[int]] = {}
+        for k, (lat1, lon1, _, _) in enumerate(pairs):
+            by_origin.setdefault((lat1, lon1), []).append(k)
+        origin_list = list(by_origin)
+        step = self.matrix_max_points
+        result: List[Optional[Leg]] = [None] * len(pairs)
+
+        async def block(origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]) -> None:
+            body = {
+                "from_points": [[lon, lat] for lat, lon in origins],
+                "to_points": [[lon, lat] for lat, lon in destinations],
+                "profile": self.profile,
+                "out_arrays": ["times", "distances"],
+                "fail_fast": False,
+            }
+            async with self._semaphore:
+                started = time.perf_counter()
+                response = await self._client.post("/matrix", json=body)
+                ROUTING_REMOTE_SECONDS.observe(time.perf_counter() - started, "matrix")
+            self.remote_requests += 1
+            response.raise_for_status()
+            data = response.json()
+            row = {point: i for i, point in enumerate(origins)}
+            col = {point: j for j, point in enumerate(destinations)}
+            for origin in origins:
+                for k in by_origin[origin]:
+                    destination = (pairs[k][2], pairs[k][3])
+                    if destination not in col:
+                        continue
+                    seconds = data["times"][row[origin]][col[destination]]
+                    meters = data["distances"][row[origin]][col[destination]]
+                    # null — маршрута между точками нет
+                    if seconds is not None and meters is not None:
+                        result[k] = (float(seconds), float(meters))
+
+        blocks = []
+        for i in range(0, len(origin_list), step):
+            origins = origin_list[i:i + step]
+            destinations = list(dict.fromkeys((pairs[k][2], pairs[k][3]) for o in origins for k in by_origin[o]))
+            for j in range(0, len(destinations), step):
+                blocks.append(block(origins, destinations[j:j + step]))
+        self._note_errors(await asyncio.gather(*blocks, return_exceptions=True))
+        return result
+
+    def _note_errors(self, results: list) -> None:
+        # Ответы, полученные до сбоя, не пропадают: ошибку только запоминаем
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            self.mark_down(errors[0])
+
+    async def _remote(self, pairs: Sequence[Pair]) -> List[Optional[Leg]]:
+        if self.use_matrix and len(pairs) > 1:
+            return await self._matrix(pairs)
+        results = await asyncio.gather(*(self._route(pair) for pair in pairs), return_exceptions=True)
+        self._note_errors(results)
+        return [None if isinstance(r, Exception) else r for r in results]
+
+    def _estimate(self, pair: Pair) -> Leg:
+        lat1, lon1, lat2, lon2 = pair
+        meters = float(haversine_one_to_many(lat1, lon1, [lat2], [lon2])[0]) * 1000 * self.detour_factor
+        return meters / self.fallback_mps, meters
+
+    async def _compute(self, pairs: List[Pair]) -> List[Tuple[Leg, str]]:
+        results: List[Optional[Tuple[Leg, str]]] = [None] * len(pairs)
+
+        if self.usable():
+            try:
+                for k, leg in enumerate(await self._remote(pairs)):
+                    if leg is not None:
+                        results[k] = (leg, "graphhopper")
+            except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+                self.mark_down(e)
+
+        missing = [k for k, item in enumerate(results) if item is None]
+        if missing and self.graph is not None:
+            seconds, meters = await asyncio.to_thread(self.graph.route_pairs, [pairs[k] for k in missing])
+            for k, s, m in zip(missing, seconds.tolist(), meters.tolist()):
+                if math.isfinite(s):
+                    results[k] = ((s, m), "local")
+
+        return [item if item is not None else (self._estimate(pairs[k]), "estimate")
+                for k, item in enumerate(results)]
+
+    # --- API ---
+
+    async def route_pairs(self, pairs: Sequence[Pair]) -> Tuple[np.ndarray, np.ndarray]:
+        """Время (с) и длина (м) для каждой пары точек; одинаковые по ячейкам пары считаются один раз"""
+        seconds = np.empty(len(pairs))
+        meters = np.empty(len(pairs))
+        missing: Dict[Tuple[int, int, int, int], List[int]] = {}
+        for k, pair in enumerate(pairs):
+            key = self._key(pair)
+            leg = self.cache.get(key)
+            if leg is not None:
+                seconds[k], meters[k] = leg
+                self.counts["cache"] += 1
+                ROUTING_LOOKUPS.inc("cache")
+            else:
+                missing.setdefault(key, []).append(k)
+
+        if missing:
+            keys = list(missing)
+            computed = await self._compute([pairs[missing[key][0]] for key in keys])
+            for key, (leg, source) in zip(keys, computed):
+                self.cache.set(key, leg, ttl=ESTIMATE_TTL_SECONDS if source == "estimate" else None)
+                for k in missing[key]:
+                    seconds[k], meters[k] = leg
+                self.counts[source] += 1
+                ROUTING_LOOKUPS.inc(source)
+        return seconds, meters
+
+    async def one_to_many(self, lat: float, lon: float,
+                          points: Sequence[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        return await self.route_pairs([(lat, lon, p_lat, p_lon) for p_lat, p_lon in points])
+
+    async def eta(self, lat1: float, lon1: float, lat2: float, lon2: float) -> Leg:
+        seconds, meters = await self.route_pairs([(lat1, lon1, lat2, lon2)])
+        return float(seconds[0]), float(meters[0])
+
+    def status(self) -> dict:
+        return {
+            "graphhopper": {
+                "url": self.base_url or None,
+                "healthy": self.usable(),
+                "matrix": self.use_matrix,
+                "requests": self.remote_requests,
+                "errors": self.remote_errors,
+                "last_error": self.last_error,
+            },
+            "local_graph": {"nodes": len(self.graph), "edges": self.graph.edges} if self.graph is not None else None,
+            "sources": dict(self.counts),
+            "cache": self.cache.stats(),
+        }
+
+
+routing = RoutingService(
+    base_url=config.GRAPHHOPPER_URL,
+    profile=config.GRAPHHOPPER_PROFILE,
+    timeout=config.GRAPHHOPPER_TIMEOUT_SECONDS,
+    max_connections=config.GRAPHHOPPER_MAX_CONNECTIONS,
+    use_matrix=config.GRAPHHOPPER_MATRIX,
+    matrix_max_points=config.GRAPHHOPPER_MATRIX_MAX_POINTS,
+    retry_after=config.GRAPHHOPPER_RETRY_SECONDS,
+    cache_size=config.ROUTING_CACHE_SIZE,
+    cache_ttl=config.ROUTING_CACHE_TTL_SECONDS,
+    snap_deg=config.ROUTING_SNAP_DEG,
+    graph_path=config.ROUTING_GRAPH_PATH,
+    fallback_speed_kmh=config.ROUTING_FALLBACK_SPEED_KMH,
+    detour_factor=config.ROUTING_DETOUR_FACTOR,
+)
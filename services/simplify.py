@@ -0,0 +1,124 @@
+"""
+Упрощение треков: Douglas–Peucker, Visvalingam–Whyatt и прореживание по времени.
+Функции возвращают индексы сохраняемых точек (по возрастанию), первая и
+последняя точки трека сохраняются всегда.
+"""
+import heapq
+import math
+
+import numpy as np
+
+from services.geo import EARTH_RADIUS_KM, as_coords
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+
+
+def to_local_xy(lats, lons) -> np.ndarray:
+    """Равнопромежуточная проекция в метры вокруг средней широты — для городских треков достаточно"""
+    lats = as_coords(lats)
+    lons = as_coords(lons)
+    lat0 = math.radians(float(lats.mean())) if lats.size else 0.0
+    xy = np.empty((lats.size, 2), dtype=np.float64)
+    xy[:, 0] = np.radians(lons) * math.cos(lat0) * EARTH_RADIUS_M
+    xy[:, 1] = np.radians(lats) * EARTH_RADIUS_M
+    return xy
+
+
+def douglas_peucker(lats, lons, tolerance_m: float) -> np.ndarray:
+    """
+    Итеративный Douglas–Peucker: расстояния всех внутренних точек отрезка
+    до хорды считаются одним векторным выражением.
+    """
+    xy = to_local_xy(lats, lons)
+    n = len(xy)
+    if n <= 2 or tolerance_m <= 0:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        seg = xy[start + 1:end]
+        a = xy[start]
+        d = xy[end] - a
+        norm = math.hypot(d[0], d[1])
+        if norm == 0:
+            dist = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        else:
+            dist = np.abs(d[0] * (seg[:, 1] - a[1]) - d[1] * (seg[:, 0] - a[0])) / norm
+        i = int(dist.argmax())
+        if dist[i] > tolerance_m:
+            idx = start + 1 + i
+            keep[idx] = True
+            stack.append((start, idx))
+            stack.append((idx, end))
+    return np.flatnonzero(keep)
+
+
+def _triangle_areas(xy: np.ndarray) -> np.ndarray:
+    a, b, c = xy[:-2], xy[1:-1], xy[2:]
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def visvalingam(lats, lons, tolerance_m: float) -> np.ndarray:
+    """
+    Visvalingam–Whyatt: убираем точки с наименьшей «эффективной площадью»,
+    пока она меньше tolerance_m². Начальные площади считаются векторно,
+    дальше — куча с ленивым удалением.
+    """
+    xy = to_local_xy(lats, lons)
+    n = len(xy)
+    if n <= 2 or tolerance_m <= 0:
+        return np.arange(n)
+    threshold = tolerance_m * tolerance_m
+
+    areas = np.full(n, np.inf)
+    areas[1:-1] = _triangle_areas(xy)
+    prev = np.arange(-1, n - 1)
+    nxt = np.arange(1, n + 1)
+    removed = np.zeros(n, dtype=bool)
+
+    heap = [(areas[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+
+    def area(i: int) -> float:
+        p, q = prev[i], nxt[i]
+        return 0.5 * abs((xy[i, 0] - xy[p, 0]) * (xy[q, 1] - xy[p, 1])
+                         - (xy[q, 0] - xy[p, 0]) * (xy[i, 1] - xy[p, 1]))
+
+    max_removed_area = 0.0
+    while heap:
+        a, i = heapq.heappop(heap)
+        if removed[i] or a != areas[i]:
+            continue
+        # Площадь соседа не может быть меньше уже удалённой — иначе порядок нарушится
+        a = max(a, max_removed_area)
+        if a >= threshold:
+            break
+        max_removed_area = a
+        removed[i] = True
+        p, q = prev[i], nxt[i]
+        nxt[p] = q
+        prev[q] = p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                areas[j] = area(j)
+                heapq.heappush(heap, (areas[j], j))
+    return np.flatnonzero(~removed)
+
+
+def time_buckets(times, bucket_seconds: float) -> np.ndarray:
+    """Последняя точка в каждом интервале bucket_seconds; times — datetime64 по возрастанию"""
+    times = np.asarray(times, dtype="datetime64[ms]")
+    n = times.size
+    if n == 0 or bucket_seconds <= 0:
+        return np.arange(n)
+    buckets = times.astype(np.int64) // int(bucket_seconds * 1000)
+    # Последний индекс каждой корзины: смотрим, где меняется номер корзины
+    last = np.flatnonzero(np.append(buckets[1:] != buckets[:-1], True))
+    if last[0] != 0:
+        last = np.insert(last, 0, 0)
+    return last
@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Order
+from services.geo import EARTH_RADIUS_KM, haversine_one_to_many
+
+# Размер ячейки сетки в градусах (~1.1 км по широте)
+DEFAULT_CELL_DEG = 0.01
+
+
+class GridIndex:
+    """
+    Равномерная сетка (lat, lon) -> множество id.
+    Поиск k ближайших идёт кольцами ячеек вокруг точки, расстояния — haversine.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._points: Dict[int, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int], set] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._points
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def get(self, item_id: int) -> Optional[Tuple[float, float]]:
+        return self._points.get(item_id)
+
+    def add(self, item_id: int, lat: float, lon: float) -> None:
+        self.remove(item_id)
+        self._points[item_id] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(item_id)
+
+    def remove(self, item_id: int) -> None:
+        point = self._points.pop(item_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(item_id)
+            if not bucket:
+                del self._cells[cell]
+
+    def clear(self) -> None:
+        self._points.clear()
+        self._cells.clear()
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                exclude: Iterable[int] = ()) -> List[Tuple[float, int]]:
+        """k ближайших точек: список (расстояние_км, id) по возрастанию расстояния"""
+        excluded = set(exclude)
+        if len(self._points) - len(excluded) <= 0 or k <= 0:
+            return []
+
+        ci, cj = self._cell(lat, lon)
+        cell_km = math.radians(self.cell_deg) * EARTH_RADIUS_KM
+
+        best: List[Tuple[float, int]] = []  # max-heap через отрицательные расстояния
+        seen = 0
+        total = len(self._points)
+        ring = 0
+
+        while True:
+            ids = []
+            for cell in self._ring_cells(ci, cj, ring):
+                bucket = self._cells.get(cell)
+                if bucket:
+                    seen += len(bucket)
+                    ids.extend(i for i in bucket if i not in excluded)
+
+            if ids:
+                coords = [self._points[i] for i in ids]
+                dists = haversine_one_to_many(
+                    lat, lon, [c[0] for c in coords], [c[1] for c in coords]
+                ).tolist()
+                for dist, item_id in zip(dists, ids):
+                    if len(best) < k:
+                        heapq.heappush(best, (-dist, item_id))
+                    elif dist < -best[0][0]:
+                        heapq.heapreplace(best, (-dist, item_id))
+
+            # Всё, что лежит за кольцом ring, не ближе ring ячеек; по долготе
+            # ячейка сужается к полюсам, поэтому берём самую узкую в пределах кольца
+            edge_lat = min(abs(lat) + (ring + 1) * self.cell_deg, 89.9)
+            min_cell_km = cell_km * math.cos(math.radians(edge_lat))
+            if len(best) >= k and -best[0][0] <= ring * min_cell_km:
+                break
+            if seen >= total:
+                break
+            ring += 1
+
+        return sorted((-d, i) for d, i in best)
+
+    def within_bbox(self, min_lat: float, min_lon: float,
+                    max_lat: float, max_lon: float) -> List[int]:
+        """id точек внутри прямоугольника (без перехода через антимеридиан)"""
+        i0, j0 = self._cell(min_lat, min_lon)
+        i1, j1 = self._cell(max_lat, max_lon)
+        if i1 < i0 or j1 < j0:
+            return []
+        span = (i1 - i0 + 1) * (j1 - j0 + 1)
+        # Большой прямоугольник дешевле пройти по занятым ячейкам, чем по всем
+        if span > len(self._cells):
+            cells = [c for c in self._cells if i0 <= c[0] <= i1 and j0 <= c[1] <= j1]
+        else:
+            cells = [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1) if (i, j) in self._cells]
+
+        result = []
+        for cell in cells:
+            inner = i0 < cell[0] < i1 and j0 < cell[1] < j1
+            for item_id in self._cells[cell]:
+                if inner:
+                    result.append(item_id)
+                    continue
+                lat, lon = self._points[item_id]
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                    result.append(item_id)
+        return result
+
+    @staticmethod
+    def _ring_cells(ci: int, cj: int, ring: int):
+        if ring == 0:
+            yield ci, cj
+            return
+        for dj in range(-ring, ring + 1):
+            yield ci - ring, cj + dj
+            yield ci + ring, cj + dj
+        for di in range(-ring + 1, ring):
+            yield ci + di, cj - ring
+            yield ci + di, cj + ring
+
+
+class PendingOrderIndex:
+    """
+    Индекс заказов в статусе pending в памяти процесса.
+    Загружается из БД при первом обращении, дальше обновляется инкрементально
+    из create_order / assign_order / delete_order / complete_order.
+    Кроме общей сетки у каждой зоны своя — поиск в зоне не фильтрует чужие заказы.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._grid = GridIndex(cell_deg)
+        self._zone_grids: Dict[int, GridIndex] = {}
+        self._zone_of: Dict[int, int] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._grid)
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            result = await session.execute(
+                select(Order.id, Order.latitude, Order.longitude, Order.zone_id).where(
+                    Order.status == "pending",
+                    Order.latitude.is_not(None),
+                    Order.longitude.is_not(None),
+                )
+            )
+            self._clear()
+            for order_id, lat, lon, zone_id in result:
+                self._add(order_id, lat, lon, zone_id)
+            self._loaded = True
+
+    def _clear(self) -> None:
+        self._grid.clear()
+        self._zone_grids.clear()
+        self._zone_of.clear()
+
+    def _add(self, order_id: int, lat: float, lon: float, zone_id: Optional[int]) -> None:
+        self._grid.add(order_id, lat, lon)
+        if zone_id is not None:
+            self._zone_grids.setdefault(zone_id, GridIndex(self.cell_deg)).add(order_id, lat, lon)
+            self._zone_of[order_id] = zone_id
+
+    def invalidate(self) -> None:
+        """Сбросить индекс — он перезагрузится при следующем запросе"""
+        self._loaded = False
+        self._clear()
+
+    def add(self, order_id: int, lat: Optional[float], lon: Optional[float],
+            zone_id: Optional[int] = None) -> None:
+        if not self._loaded:
+            return
+        self.discard(order_id)
+        if lat is None or lon is None:
+            return
+        self._add(order_id, lat, lon, zone_id)
+
+    def discard(self, order_id: int) -> None:
+        self._grid.remove(order_id)
+        zone_id = self._zone_of.pop(order_id, None)
+        if zone_id is not None:
+            grid = self._zone_grids[zone_id]
+            grid.remove(order_id)
+            if not len(grid):
+                del self._zone_grids[zone_id]
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                exclude: Iterable[int] = (), zone_id: Optional[int] = None) -> List[Tuple[float, int]]:
+        """k ближайших заказов; с zone_id — только заказы этой зоны"""
+        if zone_id is None:
+            return self._grid.nearest(lat, lon, k, exclude)
+        grid = self._zone_grids.get(zone_id)
+        return grid.nearest(lat, lon, k, exclude) if grid is not None else []
+
+
+# Общий индекс на процесс
+pending_orders_index = PendingOrderIndex()
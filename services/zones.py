@@ -0,0 +1,297 @@
+"""
+Зоны доставки в памяти процесса: поиск зоны по точке без обхода всех полигонов.
+
+Рамки полигонов раскладываются по равномерной сетке; для каждой ячейки
+заранее известно, какие зоны её задевают (по убыванию priority), а ячейки,
+целиком лежащие внутри первой из них, отвечают сразу, без проверки полигона.
+Остальные точки проверяются лучом (чётно-нечётное правило) векторно по
+всем рёбрам зоны — дыры и MultiPolygon обрабатываются тем же правилом.
+Переход через антимеридиан не поддерживается: зоны — районы города.
+"""
+import asyncio
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from models import Courier, Order, Zone
+from services.pubsub import broker
+from services.spatial_index import pending_orders_index
+
+ZONES_CHANNEL = "zones"
+
+# Сколько пар точка×ребро проверяем за раз (ограничивает временные массивы)
+_PIP_CHUNK = 1_000_000
+
+BBox = Tuple[float, float, float, float]  # min_lat, min_lon, max_lat, max_lon
+
+
+def polygon_rings(geometry: dict) -> List[np.ndarray]:
+    """Кольца GeoJSON Polygon / MultiPolygon как массивы (k, 2) [lon, lat], замкнутые"""
+    if geometry.get("type") == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry.get("type") == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError("Ожидается геометрия Polygon или MultiPolygon")
+    rings = []
+    for polygon in polygons:
+        for ring in polygon:
+            points = np.asarray(ring, dtype=np.float64)
+            if points.ndim != 2 or points.shape[1] < 2 or len(points) < 3:
+                raise ValueError("Кольцо полигона — не меньше трёх точек [lon, lat]")
+            points = points[:, :2]
+            if not np.array_equal(points[0], points[-1]):
+                points = np.vstack([points, points[:1]])
+            if len(points) < 4:
+                raise ValueError("Кольцо полигона — не меньше трёх разных точек")
+            rings.append(points)
+    if not rings:
+        raise ValueError("Пустой полигон")
+    return rings
+
+
+def polygon_bbox(geometry: dict) -> BBox:
+    points = np.vstack(polygon_rings(geometry))
+    return (float(points[:, 1].min()), float(points[:, 0].min()),
+            float(points[:, 1].max()), float(points[:, 0].max()))
+
+
+def points_in_polygon(lats: np.ndarray, lons: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Точки внутри по чётно-нечётному правилу. edges — (E, 4): x1, y1, x2, y2
+    всех колец сразу (x — долгота, y — широта).
+    """
+    inside = np.zeros(len(lats), dtype=bool)
+    if not len(lats) or not len(edges):
+        return inside
+    x1, y1, x2, y2 = (edges[:, k] for k in range(4))
+    dy = y2 - y1
+    # Горизонтальные рёбра луч не пересекают; делитель заменяем, чтобы не делить на 0
+    safe_dy = np.where(dy == 0, 1.0, dy)
+    step = max(1, _PIP_CHUNK // len(edges))
+    for start in range(0, len(lats), step):
+        y = lats[start:start + step, None]
+        x = lons[start:start + step, None]
+        straddles = (y1 > y) != (y2 > y)
+        x_cross = x1 + (y - y1) * (x2 - x1) / safe_dy
+        crossings = np.count_nonzero(straddles & (x < x_cross), axis=1)
+        inside[start:start + step] = crossings % 2 == 1
+    return inside
+
+
+class _Zone:
+    __slots__ = ("id", "priority", "bbox", "edges", "full_cells")
+
+    def __init__(self, zone_id: int, priority: int, geometry: dict):
+        self.id = zone_id
+        self.priority = priority
+        rings = polygon_rings(geometry)
+        self.edges = np.vstack([np.hstack([ring[:-1], ring[1:]]) for ring in rings])
+        points = np.vstack(rings)
+        self.bbox = (points[:, 1].min(), points[:, 0].min(), points[:, 1].max(), points[:, 0].max())
+        # Ячейки сетки, целиком лежащие внутри зоны
+        self.full_cells: Set[Tuple[int, int]] = set()
+
+    def contains(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        result = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        candidates = np.flatnonzero(result)
+        if len(candidates):
+            result[candidates] = points_in_polygon(lats[candidates], lons[candidates], self.edges)
+        return result
+
+
+class ZoneIndex:
+    """
+    Зоны в памяти процесса. Загружаются из БД при первом обращении
+    и сбрасываются во всех воркерах, когда зоны меняются (канал "zones").
+    """
+
+    def __init__(self, cell_deg: float):
+        self.cell_deg = cell_deg
+        self._zones: List[_Zone] = []
+        # ячейка -> зоны, чья рамка её задевает, по убыванию priority
+        self._cells: Dict[Tuple[int, int], List[_Zone]] = {}
+        # ячейка -> id зоны, если ячейка целиком внутри первой из её зон
+        self._resolved: Dict[Tuple[int, int], int] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._zones)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def build(self, rows: Iterable[Tuple[int, int, dict]]) -> None:
+        """rows — (id, priority, geometry)"""
+        zones = []
+        for zone_id, priority, geometry in rows:
+            try:
+                zones.append(_Zone(zone_id, priority or 0, geometry))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"❌ Зона {zone_id} пропущена: некорректный полигон ({e})")
+        zones.sort(key=lambda z: (-z.priority, z.id))
+
+        cells: Dict[Tuple[int, int], List[_Zone]] = {}
+        for zone in zones:
+            i0, j0 = self._cell(zone.bbox[0], zone.bbox[1])
+            i1, j1 = self._cell(zone.bbox[2], zone.bbox[3])
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    cells.setdefault((i, j), []).append(zone)
+            zone.full_cells = self._full_cells(zone, i0, j0, i1, j1)
+
+        self._zones = zones
+        self._cells = cells
+        self._resolved = {
+            cell: candidates[0].id for cell, candidates in cells.items()
+            if cell in candidates[0].full_cells
+        }
+
+    def _full_cells(self, zone: _Zone, i0: int, j0: int, i1: int, j1: int) -> Set[Tuple[int, int]]:
+        """Ячейки, у которых все углы внутри зоны и которые не пересекает ни одно ребро"""
+        c = self.cell_deg
+        corner_lats = np.arange(i0, i1 + 2) * c
+        corner_lons = np.arange(j0, j1 + 2) * c
+        grid_lats, grid_lons = np.meshgrid(corner_lats, corner_lons, indexing="ij")
+        corners = zone.contains(grid_lats.ravel(), grid_lons.ravel()).reshape(grid_lats.shape)
+        full = corners[:-1, :-1] & corners[1:, :-1] & corners[:-1, 1:] & corners[1:, 1:]
+
+        # Ячейки, которые задевает рамка ребра, не считаем целыми (с запасом)
+        x1, y1, x2, y2 = (zone.edges[:, k] for k in range(4))
+        ei0 = np.floor(np.minimum(y1, y2) / c).astype(int) - i0
+        ei1 = np.floor(np.maximum(y1, y2) / c).astype(int) - i0
+        ej0 = np.floor(np.minimum(x1, x2) / c).astype(int) - j0
+        ej1 = np.floor(np.maximum(x1, x2) / c).astype(int) - j0
+        for a, b, d, e in zip(ei0.tolist(), ei1.tolist(), ej0.tolist(), ej1.tolist()):
+            full[max(a, 0):b + 1, max(d, 0):e + 1] = False
+
+        return {(int(i) + i0, int(j) + j0) for i, j in zip(*np.nonzero(full))}
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            rows = (await session.execute(select(Zone.id, Zone.priority, Zone.polygon))).all()
+            self.build(rows)
+            self._loaded = True
+
+    def invalidate(self) -> None:
+        self._loaded = False
+
+    def lookup(self, lat: Optional[float], lon: Optional[float]) -> Optional[int]:
+        if lat is None or lon is None:
+            return None
+        cell = self._cell(lat, lon)
+        zone_id = self._resolved.get(cell)
+        if zone_id is not None:
+            return zone_id
+        point_lat, point_lon = np.array([lat]), np.array([lon])
+        for zone in self._cells.get(cell, ()):
+            if zone.contains(point_lat, point_lon)[0]:
+                return zone.id
+        return None
+
+    def lookup_many(self, lats: Sequence[Optional[float]], lons: Sequence[Optional[float]]) -> List[Optional[int]]:
+        """Зоны для пачки точек; None — точка вне зон или без координат"""
+        n = len(lats)
+        if not n or not self._zones:
+            return [None] * n
+        lat_arr = np.array([np.nan if v is None else v for v in lats], dtype=np.float64)
+        lon_arr = np.array([np.nan if v is None else v for v in lons], dtype=np.float64)
+        result = np.full(n, -1, dtype=np.int64)
+        valid = ~(np.isnan(lat_arr) | np.isnan(lon_arr))
+
+        cell_i = np.floor(np.where(valid, lat_arr, 0) / self.cell_deg).astype(np.int64)
+        cell_j = np.floor(np.where(valid, lon_arr, 0) / self.cell_deg).astype(np.int64)
+        pending = np.zeros(n, dtype=bool)
+        candidates: Dict[int, _Zone] = {}
+        for k, (i, j) in enumerate(zip(cell_i.tolist(), cell_j.tolist())):
+            if not valid[k]:
+                continue
+            zone_id = self._resolved.get((i, j))
+            if zone_id is not None:
+                result[k] = zone_id
+                continue
+            zones = self._cells.get((i, j))
+            if zones:
+                pending[k] = True
+                for zone in zones:
+                    candidates[zone.id] = zone
+
+        # Зоны по убыванию priority: точка достаётся первой, которая её содержит
+        for zone in sorted(candidates.values(), key=lambda z: (-z.priority, z.id)):
+            idx = np.flatnonzero(pending)
+            if not len(idx):
+                break
+            inside = zone.contains(lat_arr[idx], lon_arr[idx])
+            result[idx[inside]] = zone.id
+            pending[idx[inside]] = False
+
+        return [None if v < 0 else v for v in result.tolist()]
+
+
+zone_index = ZoneIndex(cell_deg=config.ZONE_GRID_CELL_DEG)
+
+
+def _bbox_filter(column_lat, column_lon, bbox: BBox):
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return (column_lat.between(min_lat, max_lat), column_lon.between(min_lon, max_lon))
+
+
+_set_order_zone = update(Order.__table__).where(Order.__table__.c.id == bindparam("b_id")).values(
+    zone_id=bindparam("b_zone"))
+_set_courier_zone = update(Courier.__table__).where(Courier.__table__.c.id == bindparam("b_id")).values(
+    zone_id=bindparam("b_zone"))
+
+
+async def retag(session: AsyncSession, bboxes: Sequence[BBox]) -> Dict[str, int]:
+    """
+    Пересчитать зоны активных заказов и курьеров внутри рамок (старой и новой
+    рамки изменённой зоны). Доставленные заказы сохраняют зону, в которой
+    были выполнены. Индекс зон должен быть уже перезагружен.
+    """
+    counts = {"orders": 0, "couriers": 0}
+    for model, stmt, key, extra in (
+        (Order, _set_order_zone, "orders", (Order.status.in_(("pending", "assigned")),)),
+        (Courier, _set_courier_zone, "couriers", ()),
+    ):
+        for bbox in bboxes:
+            rows = (await session.execute(
+                select(model.id, model.latitude, model.longitude, model.zone_id)
+                .where(*_bbox_filter(model.latitude, model.longitude, bbox), *extra)
+            )).all()
+            zones = zone_index.lookup_many([r[1] for r in rows], [r[2] for r in rows])
+            changed = [{"b_id": r[0], "b_zone": z} for r, z in zip(rows, zones) if r[3] != z]
+            if changed:
+                await session.execute(stmt, changed)
+                counts[key] += len(changed)
+    return counts
+
+
+async def publish_zones_changed() -> None:
+    try:
+        await broker.publish(ZONES_CHANNEL, {"event": "zones_changed"})
+    except Exception as e:
+        print(f"❌ Не удалось опубликовать изменение зон: {e}")
+
+
+def _on_zones_changed(message: dict) -> None:
+    # Зоны заказов в индексе свободных заказов тоже могли поменяться
+    zone_index.invalidate()
+    pending_orders_index.invalidate()
+
+
+def register() -> None:
+    broker.subscribe(ZONES_CHANNEL, _on_zones_changed)